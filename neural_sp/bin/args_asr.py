@@ -346,6 +346,11 @@ def build_parser():
                         help='Teacher ASR model for knowledge distillation')
     parser.add_argument('--teacher_lm', default=False, nargs='?',
                         help='Teacher LM for knowledge distillation')
+    parser.add_argument('--teacher_store', default=False, nargs='?',
+                        help='directory of top-k teacher log-probabilities dumped by dump_teacher.py '
+                        '(used instead of running the teacher during training)')
+    parser.add_argument('--teacher_store_topk', type=int, default=8,
+                        help='number of tokens to keep per output position in the teacher store')
     parser.add_argument('--distillation_weight', type=float, default=0.1,
                         help='soft label weight for knowledge distillation')
     # special label
@@ -370,7 +375,7 @@ def build_parser():
                         choices=['word', 'wp', 'char', 'phone', 'word_char', 'char_space'],
                         help='')
     parser.add_argument('--recog_metric', type=str, default='edit_distance',
-                        choices=['edit_distance', 'loss', 'accuracy', 'ppl', 'bleu'],
+                        choices=['edit_distance', 'loss', 'accuracy', 'ppl', 'bleu', 'latency'],
                         help='metric for evaluation')
     parser.add_argument('--recog_oracle', type=strtobool, default=False,
                         help='recognize by teacher-forcing')
@@ -382,10 +387,21 @@ def build_parser():
                         help='')
     parser.add_argument('--recog_min_len_ratio', type=float, default=0.0,
                         help='')
+    parser.add_argument('--recog_ctc_max_len_ratio', type=float, default=0.0,
+                        help='maximum output length relative to the length of the CTC greedy output (0: disabled). \
+                              This is effective only when CTC scores are used.')
+    parser.add_argument('--recog_beam_margin', type=float, default=0.0,
+                        help='prune hypotheses whose scores are lower than the best one by this margin (0: disabled)')
+    parser.add_argument('--recog_end_detect', type=strtobool, default=False,
+                        help='terminate beam search when ended hypotheses can no longer be beaten')
+    parser.add_argument('--recog_time_budget', type=float, default=0.0,
+                        help='time budget for beam search per utterance [sec] (0: no limit)')
     parser.add_argument('--recog_length_penalty', type=float, default=0.0,
                         help='length penalty')
     parser.add_argument('--recog_length_norm', type=strtobool, default=False, nargs='?',
                         help='normalize score by hypothesis length')
+    parser.add_argument('--recog_max_sym_exp', type=int, default=3,
+                        help='maximum number of expansions per frame in the RNN-T beam search (up to N-1 labels per frame)')
     parser.add_argument('--recog_coverage_penalty', type=float, default=0.0,
                         help='coverage penalty')
     parser.add_argument('--recog_coverage_threshold', type=float, default=0.0,
@@ -404,7 +420,8 @@ def build_parser():
     parser.add_argument('--recog_ctc_weight', type=float, default=0.0,
                         help='weight of CTC score')
     parser.add_argument('--recog_lm', type=str, default=False, nargs='?',
-                        help='path to first path LM for shallow fusion')
+                        help='path to first path LM for shallow fusion '
+                        '(an n-gram LM is loaded if the extension is .arpa or .arpa.gz)')
     parser.add_argument('--recog_lm_second', type=str, default=False, nargs='?',
                         help='path to second path LM for rescoring')
     parser.add_argument('--recog_lm_bwd', type=str, default=False, nargs='?',
@@ -415,12 +432,26 @@ def build_parser():
                         help='forward-backward attention decoding')
     parser.add_argument('--recog_bwd_attention', type=strtobool, default=False,
                         help='backward attention decoding')
+    parser.add_argument('--recog_store_attention', type=strtobool, default=False,
+                        help='store attention weights of all decoding steps in beam search (for plotting and alignment)')
     parser.add_argument('--recog_reverse_lm_rescoring', type=strtobool, default=False,
                         help='rescore with another LM in the reverse direction')
     parser.add_argument('--recog_asr_state_carry_over', type=strtobool, default=False,
                         help='carry over ASR decoder state')
     parser.add_argument('--recog_lm_state_carry_over', type=strtobool, default=False,
                         help='carry over LM state')
+    parser.add_argument('--recog_interleave_sessions', type=strtobool, default=False,
+                        help='decode --recog_batch_size sessions in parallel, one session per row of \
+                        mini-batches, with ASR/LM states carried over in each session')
+    parser.add_argument('--recog_lm_state_cache_size', type=int, default=0,
+                        help='number of token prefixes whose LM states are cached and shared \
+                        across hypotheses and utterances in shallow fusion (0: disabled)')
+    parser.add_argument('--recog_lm_n_cands', type=int, default=0,
+                        help='number of candidate tokens per hypothesis scored by the LM in shallow fusion \
+                        (0: full vocabulary). Only used for n-gram LMs and LMs with the adaptive softmax. \
+                        The top-K candidates are always scored in the RNN decoder (same results). \
+                        The Transformer decoder scores the top-N attention candidates (pre-beam) only, \
+                        which changes the decoding results.')
     parser.add_argument('--recog_softmax_smoothing', type=float, default=1.0,
                         help='softmax smoothing (beta) for diverse hypothesis generation')
     parser.add_argument('--recog_wordlm', type=strtobool, default=False,
@@ -441,8 +472,24 @@ def build_parser():
                         help='')
     parser.add_argument('--recog_ctc_vad_n_accum_frames', type=float, default=4000,
                         help='')
+    parser.add_argument('--recog_stream_max_batch_size', type=int, default=64,
+                        help='maximum number of chunks of live streams encoded at once')
+    parser.add_argument('--recog_bench_n_streams', type=str, default='1_4_16_64',
+                        help='numbers of concurrent streams for the streaming benchmark (separated by _)')
+    parser.add_argument('--recog_bench_duration', type=float, default=10.0,
+                        help='duration of each stream in the streaming benchmark [sec]')
+    parser.add_argument('--recog_bench_block_size', type=int, default=10,
+                        help='number of frames pushed at once by each stream in the streaming benchmark and latency evaluation')
+    parser.add_argument('--recog_longform_window', type=int, default=0,
+                        help='window size [frames] for long-form decoding with overlapped windows (0: disabled)')
+    parser.add_argument('--recog_longform_overlap', type=int, default=400,
+                        help='number of frames shared by adjacent windows in long-form decoding')
+    parser.add_argument('--recog_longform_batch_size', type=int, default=8,
+                        help='number of windows encoded and decoded at once in long-form decoding')
     parser.add_argument('--recog_mma_delay_threshold', type=int, default=-1,
                         help='delay threshold for MMA decoder')
     parser.add_argument('--recog_mem_len', type=int, default=0,
-                        help='number of tokens for memory in TransformerXL decoder during evaluation')
+                        help='number of tokens for memory in TransformerXL decoder/LM during evaluation. \
+                        The LM memory is carried over across utterances in the same session \
+                        with --recog_lm_state_carry_over')
     return parser
@@ -100,6 +100,9 @@ def build_parser():
                         help='output unit')
     parser.add_argument('--wp_model', type=str, default=False, nargs='?',
                         help='wordpiece model path')
+    parser.add_argument('--token_stream_dir', type=str, default=False, nargs='?',
+                        help='directory to save binary token streams of datasets, which are memory-mapped \
+                        during training. Streams are rebuilt when the tsv files, dictionary, unit or word-piece model change.')
     # features
     parser.add_argument('--min_n_tokens', type=int, default=1,
                         help='minimum number of input tokens')
@@ -211,4 +214,14 @@ def build_parser():
                         help='lambda paramter for cache')
     parser.add_argument('--recog_mem_len', type=int, default=0,
                         help='number of tokens for memory in TransformerXL during evaluation')
+    parser.add_argument('--recog_stride', type=int, default=0,
+                        help='number of tokens scored per forward in the sliding-window perplexity evaluation, \
+                        where each token has the left context of bptt tokens (0: evaluate BPTT chunks independently)')
+    # N-best rescoring
+    parser.add_argument('--recog_lm_weight', type=float, default=0.3,
+                        help='weight of the forward LM score in N-best rescoring')
+    parser.add_argument('--recog_lm_bwd', type=str, default=None, nargs='?',
+                        help='backward LM path for N-best rescoring')
+    parser.add_argument('--recog_lm_bwd_weight', type=float, default=0.3,
+                        help='weight of the backward LM score in N-best rescoring')
     return parser
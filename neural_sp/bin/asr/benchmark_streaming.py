@@ -0,0 +1,118 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Benchmark streaming ASR with many concurrent streams.
+
+Each stream pushes a block of input features every `recog_bench_block_size` frames
+in real time, and a single worker processes all pending chunks after each arrival.
+Streams start with random delays so that their chunks are not always aligned.
+Throughput and chunk latency (from the arrival of the block completing a chunk
+to the end of its decoding) are reported with and without batching chunks of streams.
+
+"""
+
+import logging
+import numpy as np
+import os
+import sys
+import time
+
+from neural_sp.bin.args_asr import parse_args_eval
+from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.bin.train_utils import set_logger
+from neural_sp.models.seq2seq.speech2text import Speech2Text
+from neural_sp.models.seq2seq.stream_scheduler import StreamScheduler
+
+logger = logging.getLogger(__name__)
+
+FRAME_SHIFT = 0.01  # [sec]
+
+
+def run_load(model, params, input_dim, n_streams, n_frames, block_size, max_batch_size, seed=1):
+    """Simulate concurrent streams with a single worker.
+
+    Args:
+        model (Speech2Text): streamable ASR model
+        params (dict): hyperparameters for decoding
+        input_dim (int): dimension of input features
+        n_streams (int): number of concurrent streams
+        n_frames (int): number of frames per stream
+        block_size (int): number of frames pushed at once
+        max_batch_size (int): maximum number of chunks in one encoder forward
+        seed (int): random seed for input features and delays
+    Returns:
+        throughput (float): seconds of audio processed per second
+        latencies (np.ndarray): `[n_chunks]`, chunk latencies [sec]
+
+    """
+    rng = np.random.RandomState(seed)
+    xs = [rng.randn(n_frames, input_dim).astype(np.float32) for _ in range(n_streams)]
+    scheduler = StreamScheduler(model, params, max_batch_size=max_batch_size)
+    for i in range(n_streams):
+        scheduler.open(i)
+
+    n_blocks = -(-n_frames // block_size)
+    # NOTE: delays are less than a chunk
+    delays = rng.randint(0, max(1, scheduler.sessions[0].N_c // block_size), n_streams)
+
+    latencies = []
+    elapsed_total = 0.
+    worker_free = 0.  # time when the worker finishes the previous work
+    for k in range(n_blocks + delays.max()):
+        arrival = k * block_size * FRAME_SHIFT
+        for i in range(n_streams):
+            if 0 <= k - delays[i] < n_blocks:
+                j = (k - delays[i]) * block_size
+                scheduler.push_features(i, xs[i][j:j + block_size])
+        start = max(arrival, worker_free)
+        tic = time.time()
+        n_chunks = scheduler.run()
+        elapsed = time.time() - tic
+        elapsed_total += elapsed
+        worker_free = start + elapsed
+        latencies += [worker_free - arrival] * sum(n_chunks.values())
+
+    tic = time.time()
+    for i in range(n_streams):
+        scheduler.close(i)
+    elapsed_total += time.time() - tic
+
+    throughput = n_streams * n_frames * FRAME_SHIFT / elapsed_total
+    return throughput, np.array(latencies)
+
+
+def main():
+
+    # Load configuration
+    args, recog_params, dir_name = parse_args_eval(sys.argv[1:])
+
+    # Setting for logging
+    if os.path.isfile(os.path.join(args.recog_dir, 'benchmark.log')):
+        os.remove(os.path.join(args.recog_dir, 'benchmark.log'))
+    set_logger(os.path.join(args.recog_dir, 'benchmark.log'), stdout=args.recog_stdout)
+
+    # Load the ASR model
+    model = Speech2Text(args, dir_name)
+    load_checkpoint(args.recog_model[0], model)
+    if args.recog_n_gpus >= 1:
+        model.cuda()
+    model.eval()
+
+    n_frames = int(args.recog_bench_duration / FRAME_SHIFT)
+    logger.info('duration per stream: %.1f [sec]' % args.recog_bench_duration)
+    logger.info('block size: %d frames' % args.recog_bench_block_size)
+    logger.info('%8s %10s %16s %12s %12s' % ('streams', 'batch', 'throughput[xRT]', 'p50[ms]', 'p99[ms]'))
+    for n_streams in [int(n) for n in args.recog_bench_n_streams.split('_')]:
+        for max_batch_size in [1, args.recog_stream_max_batch_size]:
+            throughput, latencies = run_load(model, recog_params, args.input_dim, n_streams, n_frames,
+                                             args.recog_bench_block_size, max_batch_size)
+            logger.info('%8d %10d %16.2f %12.1f %12.1f' %
+                        (n_streams, max_batch_size, throughput,
+                         np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Run the teacher ASR model or LM once over the training set and
+dump sparse top-k log-probabilities for knowledge distillation.
+
+Training with `--teacher_store` reads the dumped store instead of
+running the teacher at every step.
+
+"""
+
+import argparse
+import copy
+import logging
+import numpy as np
+import os
+import sys
+import time
+import torch
+from tqdm import tqdm
+
+from neural_sp.bin.args_asr import parse_args_train
+from neural_sp.bin.train_utils import (
+    compute_susampling_factor,
+    load_checkpoint,
+    load_config,
+    set_logger
+)
+from neural_sp.datasets.asr import Dataset
+from neural_sp.datasets.teacher_store import TeacherStoreWriter
+from neural_sp.models.lm.build import build_lm
+from neural_sp.models.seq2seq.speech2text import Speech2Text
+from neural_sp.models.torch_utils import np2tensor
+from neural_sp.models.torch_utils import pad_list
+
+logger = logging.getLogger(__name__)
+
+
+def generate_lm_logits(lm, ys, eos, pad, device_id):
+    """Same as Speech2Text.generate_lm_logits without the student model."""
+    ys = [np2tensor(np.fromiter(y, dtype=np.int64), device_id) for y in ys]
+    eos = ys[0].new_zeros(1).fill_(eos)
+    ys_in = pad_list([torch.cat([eos, y], dim=0) for y in ys], pad)
+    logits, _, _ = lm.decode(ys_in, None)
+    return logits
+
+
+def main():
+
+    args = parse_args_train(sys.argv[1:])
+    args_teacher = copy.deepcopy(args)
+    assert args.teacher_store, 'Set --teacher_store.'
+    assert args.teacher or args.teacher_lm, 'Set --teacher or --teacher_lm.'
+
+    if not os.path.isdir(args.teacher_store):
+        os.makedirs(args.teacher_store)
+    set_logger(os.path.join(args.teacher_store, 'dump.log'), stdout=args.stdout)
+    args = compute_susampling_factor(args)
+
+    # NOTE: the same utterances as in training are kept
+    dataset = Dataset(corpus=args.corpus,
+                      tsv_path=args.train_set,
+                      dict_path=args.dict,
+                      nlsyms=args.nlsyms,
+                      unit=args.unit,
+                      wp_model=args.wp_model,
+                      batch_size=args.batch_size,
+                      min_n_frames=args.min_n_frames,
+                      max_n_frames=args.max_n_frames,
+                      sort_by='input',
+                      ctc=args.ctc_weight > 0,
+                      subsample_factor=args.subsample_factor)
+    device_id = 0 if args.n_gpus >= 1 else -1
+
+    if args.teacher:
+        assert os.path.isfile(args.teacher), 'There is no checkpoint.'
+        conf_teacher = load_config(os.path.join(os.path.dirname(args.teacher), 'conf.yml'))
+        for k, v in conf_teacher.items():
+            setattr(args_teacher, k, v)
+        args_teacher.ss_prob = 0
+        teacher = Speech2Text(args_teacher)
+        load_checkpoint(args.teacher, teacher)
+    else:
+        assert os.path.isfile(args.teacher_lm), 'There is no checkpoint.'
+        conf_lm = load_config(os.path.join(os.path.dirname(args.teacher_lm), 'conf.yml'))
+        args_lm = argparse.Namespace()
+        for k, v in conf_lm.items():
+            setattr(args_lm, k, v)
+        teacher = build_lm(args_lm)
+        load_checkpoint(args.teacher_lm, teacher)
+    teacher.eval()
+    if args.n_gpus >= 1:
+        teacher.cuda()
+
+    writer = TeacherStoreWriter(args.teacher_store, args.teacher_store_topk)
+    start_time = time.time()
+    pbar = tqdm(total=len(dataset))
+    with torch.no_grad():
+        while True:
+            batch, is_new_epoch = dataset.next()
+            if args.teacher:
+                logits = teacher.generate_logits(batch)
+            else:
+                logits = generate_lm_logits(teacher, batch['ys'], dataset.eos, dataset.pad, device_id)
+            # NOTE: +1 for <eos>
+            writer.add(batch['utt_ids'], logits, [len(y) + 1 for y in batch['ys']])
+            pbar.update(len(batch['utt_ids']))
+            if is_new_epoch:
+                break
+    pbar.close()
+    writer.close()
+    logger.info('Elasped time: %.2f [sec]' % (time.time() - start_time))
+
+
+if __name__ == '__main__':
+    main()
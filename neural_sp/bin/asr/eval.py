@@ -6,7 +6,6 @@
 
 """Evaluate the ASR model."""
 
-import argparse
 import copy
 import logging
 import os
@@ -15,18 +14,21 @@ import time
 
 from neural_sp.bin.args_asr import parse_args_eval
 from neural_sp.bin.eval_utils import average_checkpoints
+from neural_sp.bin.eval_utils import load_lm
 from neural_sp.bin.train_utils import load_checkpoint
 from neural_sp.bin.train_utils import load_config
 from neural_sp.bin.train_utils import set_logger
 from neural_sp.datasets.asr import Dataset
 from neural_sp.evaluators.accuracy import eval_accuracy
 from neural_sp.evaluators.character import eval_char
+from neural_sp.evaluators.latency import eval_latency
+from neural_sp.evaluators.latency import PERCENTILES
 from neural_sp.evaluators.phone import eval_phone
 from neural_sp.evaluators.ppl import eval_ppl
 from neural_sp.evaluators.word import eval_word
 from neural_sp.evaluators.wordpiece import eval_wordpiece
 from neural_sp.evaluators.wordpiece_bleu import eval_wordpiece_bleu
-from neural_sp.models.lm.build import build_lm
+from neural_sp.models.seq2seq.decoders.decoder_base import DecoderBase
 from neural_sp.models.seq2seq.speech2text import Speech2Text
 
 logger = logging.getLogger(__name__)
@@ -63,6 +65,7 @@ def main():
                           unit_sub1=args.unit_sub1,
                           unit_sub2=args.unit_sub2,
                           batch_size=args.recog_batch_size,
+                          interleave_sessions=args.recog_interleave_sessions,
                           first_n_utterances=args.recog_first_n_utt,
                           is_test=True)
 
@@ -98,15 +101,8 @@ def main():
             if not args.lm_fusion:
                 # first path
                 if args.recog_lm is not None and args.recog_lm_weight > 0:
-                    conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm), 'conf.yml'))
-                    args_lm = argparse.Namespace()
-                    for k, v in conf_lm.items():
-                        setattr(args_lm, k, v)
-                    args_lm.recog_mem_len = args.recog_mem_len
-                    lm = build_lm(args_lm, wordlm=args.recog_wordlm,
-                                  lm_dict_path=os.path.join(os.path.dirname(args.recog_lm), 'dict.txt'),
-                                  asr_dict_path=os.path.join(dir_name, 'dict.txt'))
-                    load_checkpoint(args.recog_lm, lm)
+                    lm, args_lm = load_lm(args.recog_lm, os.path.join(dir_name, 'dict.txt'),
+                                          args.recog_mem_len, wordlm=args.recog_wordlm)
                     if args_lm.backward:
                         model.lm_bwd = lm
                     else:
@@ -114,24 +110,14 @@ def main():
 
                 # second path (forward)
                 if args.recog_lm_second is not None and args.recog_lm_second_weight > 0:
-                    conf_lm_second = load_config(os.path.join(os.path.dirname(args.recog_lm_second), 'conf.yml'))
-                    args_lm_second = argparse.Namespace()
-                    for k, v in conf_lm_second.items():
-                        setattr(args_lm_second, k, v)
-                    args_lm_second.recog_mem_len = args.recog_mem_len
-                    lm_second = build_lm(args_lm_second)
-                    load_checkpoint(args.recog_lm_second, lm_second)
+                    lm_second, _ = load_lm(args.recog_lm_second, os.path.join(dir_name, 'dict.txt'),
+                                           args.recog_mem_len)
                     model.lm_second = lm_second
 
                 # second path (bakward)
                 if args.recog_lm_bwd is not None and args.recog_lm_bwd_weight > 0:
-                    conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm_bwd), 'conf.yml'))
-                    args_lm_bwd = argparse.Namespace()
-                    for k, v in conf_lm.items():
-                        setattr(args_lm_bwd, k, v)
-                    args_lm_bwd.recog_mem_len = args.recog_mem_len
-                    lm_bwd = build_lm(args_lm_bwd)
-                    load_checkpoint(args.recog_lm_bwd, lm_bwd)
+                    lm_bwd, _ = load_lm(args.recog_lm_bwd, os.path.join(dir_name, 'dict.txt'),
+                                        args.recog_mem_len)
                     model.lm_bwd = lm_bwd
 
             if not args.recog_unit:
@@ -145,6 +131,10 @@ def main():
             logger.info('beam width: %d' % args.recog_beam_width)
             logger.info('min length ratio: %.3f' % args.recog_min_len_ratio)
             logger.info('max length ratio: %.3f' % args.recog_max_len_ratio)
+            logger.info('max length ratio (CTC greedy): %.3f' % args.recog_ctc_max_len_ratio)
+            logger.info('beam margin: %.3f' % args.recog_beam_margin)
+            logger.info('end detection: %s' % args.recog_end_detect)
+            logger.info('time budget: %.3f [sec]' % args.recog_time_budget)
             logger.info('length penalty: %.3f' % args.recog_length_penalty)
             logger.info('length norm: %s' % args.recog_length_norm)
             logger.info('coverage penalty: %.3f' % args.recog_coverage_penalty)
@@ -162,6 +152,15 @@ def main():
             logger.info('ensemble: %d' % (len(ensemble_models)))
             logger.info('ASR decoder state carry over: %s' % (args.recog_asr_state_carry_over))
             logger.info('LM state carry over: %s' % (args.recog_lm_state_carry_over))
+            logger.info('interleave sessions: %s' % (args.recog_interleave_sessions))
+            logger.info('long-form window (overlap): %d (%d)' % (args.recog_longform_window,
+                                                                 args.recog_longform_overlap))
+            logger.info('memory length (TransformerXL): %d' % (args.recog_mem_len))
+            logger.info('LM state cache size: %d' % (args.recog_lm_state_cache_size))
+            logger.info('LM candidates: %d' % (args.recog_lm_n_cands))
+            if args.recog_lm_n_cands > 0 and getattr(model, 'lm_fwd', None) is not None and \
+                    not model.lm_fwd.restricted_scoring:
+                logger.warning('LM candidates are ignored for LMs with the full softmax.')
             logger.info('model average (Transformer): %d' % (args.recog_n_average))
 
             # GPU setting
@@ -169,6 +168,12 @@ def main():
                 model.cudnn_setting(deterministic=True, benchmark=False)
                 model.cuda()
 
+        # Reset statistics of beam search and states carried over from the previous set
+        decs = [m for m in model.modules() if isinstance(m, DecoderBase)]
+        for dec in decs:
+            dec.reset_beam_stats()
+            dec.reset_carry_over()
+
         start_time = time.time()
 
         if args.recog_metric == 'edit_distance':
@@ -219,11 +224,36 @@ def main():
                                        progressbar=True,
                                        fine_grained=True)
             bleu_avg += bleu
+        elif args.recog_metric == 'latency':
+            # emission latency of streaming decoding with a simulated real-time clock
+            stats = eval_latency(ensemble_models, dataset, recog_params,
+                                 idx2token=dataset.idx2token[0],
+                                 block_size=args.recog_bench_block_size,
+                                 progressbar=True)
+            N_l, N_r = args.lc_chunk_size_left, args.lc_chunk_size_right
+            N_c = getattr(args, 'lc_chunk_size_current', 0)  # only for Transformer encoders
+            logger.info('encoder: %s (chunk left/current/right: %d/%d/%d)' % (args.enc_type, N_l, N_c, N_r))
+            logger.info('decoder: %s' % ('chunk-synchronous attention' if args.recog_chunk_sync
+                                         else 'CTC prefix beam search'))
+            logger.info('%12s %s' % ('delay', ' '.join(['%10s' % ('p%d[ms]' % p) for p in PERCENTILES])))
+            for k in ['emission', 'final', 'first_token', 'eou']:
+                logger.info('%12s %s' % (k, ' '.join(['%10.1f' % v for v in stats[k]])))
         else:
             raise NotImplementedError(args.recog_metric)
         elasped_time = time.time() - start_time
         logger.info('Elasped time: %.3f [sec]' % elasped_time)
         logger.info('RTF: %.3f' % (elasped_time / (dataset.n_frames * 0.01)))
+        for dec in decs:
+            if dec.beam_stats['n_steps'] > 0:
+                logger.info('Active beam size (avg. / peak): %.2f / %d' %
+                            (dec.beam_stats['n_active_hyps'] / dec.beam_stats['n_steps'],
+                             dec.beam_stats['max_active_hyps']))
+                logger.info('Utterances terminated by the time budget: %d / %d' %
+                            (dec.beam_stats['n_timeout'], dec.beam_stats['n_utts']))
+            if dec.lm_state_cache is not None and dec.lm_state_cache.n_queries > 0:
+                logger.info('LM state cache hit rate: %.2f %% (%d / %d)' %
+                            (dec.lm_state_cache.hit_rate * 100, dec.lm_state_cache.n_hits,
+                             dec.lm_state_cache.n_queries))
 
     if args.recog_metric == 'edit_distance':
         if 'phone' in args.recog_unit:
@@ -6,7 +6,6 @@
 
 """Plot attention weights of the attention model."""
 
-import argparse
 import copy
 import logging
 import os
@@ -15,6 +14,7 @@ import sys
 
 from neural_sp.bin.args_asr import parse_args_eval
 from neural_sp.bin.eval_utils import average_checkpoints
+from neural_sp.bin.eval_utils import load_lm
 from neural_sp.bin.plot_utils import plot_attention_weights
 from neural_sp.bin.train_utils import (
     load_checkpoint,
@@ -22,7 +22,6 @@ from neural_sp.bin.train_utils import (
     set_logger
 )
 from neural_sp.datasets.asr import Dataset
-from neural_sp.models.lm.build import build_lm
 from neural_sp.models.seq2seq.speech2text import Speech2Text
 from neural_sp.utils import mkdir_join
 
@@ -33,6 +32,7 @@ def main():
 
     # Load configuration
     args, recog_params, dir_name = parse_args_eval(sys.argv[1:])
+    recog_params['recog_store_attention'] = True
 
     # Setting for logging
     if os.path.isfile(os.path.join(args.recog_dir, 'plot.log')):
@@ -83,12 +83,7 @@ def main():
             if not args.lm_fusion:
                 # first path
                 if args.recog_lm is not None and args.recog_lm_weight > 0:
-                    conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm), 'conf.yml'))
-                    args_lm = argparse.Namespace()
-                    for k, v in conf_lm.items():
-                        setattr(args_lm, k, v)
-                    lm = build_lm(args_lm)
-                    load_checkpoint(args.recog_lm, lm)
+                    lm, args_lm = load_lm(args.recog_lm, os.path.join(dir_name, 'dict.txt'))
                     if args_lm.backward:
                         model.lm_bwd = lm
                     else:
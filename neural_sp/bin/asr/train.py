@@ -29,6 +29,7 @@ from neural_sp.bin.train_utils import (
     set_save_path
 )
 from neural_sp.datasets.asr import Dataset
+from neural_sp.datasets.teacher_store import TeacherStore
 from neural_sp.models.data_parallel import CustomDataParallel
 from neural_sp.models.data_parallel import CPUWrapperASR
 from neural_sp.models.lm.build import build_lm
@@ -238,7 +239,10 @@ def main():
 
     # Load the teacher ASR model
     teacher = None
-    if args.teacher:
+    if args.teacher_store:
+        # NOTE: the teacher ASR model or LM is not run during training
+        teacher = TeacherStore(args.teacher_store)
+    elif args.teacher:
         assert os.path.isfile(args.teacher), 'There is no checkpoint.'
         conf_teacher = load_config(os.path.join(os.path.dirname(args.teacher), 'conf.yml'))
         for k, v in conf_teacher.items():
@@ -251,7 +255,7 @@ def main():
 
     # Load the teacher LM
     teacher_lm = None
-    if args.teacher_lm:
+    if args.teacher_lm and not args.teacher_store:
         assert os.path.isfile(args.teacher_lm), 'There is no checkpoint.'
         conf_lm = load_config(os.path.join(os.path.dirname(args.teacher_lm), 'conf.yml'))
         args_lm = argparse.Namespace()
@@ -281,7 +285,7 @@ def main():
                 load_checkpoint(args.resume, amp=amp)
         model = CustomDataParallel(model, device_ids=list(range(0, args.n_gpus)))
 
-        if teacher is not None:
+        if teacher is not None and not args.teacher_store:
             teacher.cuda()
         if teacher_lm is not None:
             teacher_lm.cuda()
@@ -6,13 +6,51 @@
 
 """Utility functions for evaluation."""
 
+import argparse
 import logging
 import os
 import torch
 
+from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.bin.train_utils import load_config
+from neural_sp.models.lm.build import build_lm
+
 logger = logging.getLogger(__name__)
 
 
+def load_lm(lm_path, asr_dict_path=None, recog_mem_len=0, wordlm=False):
+    """Load a trained LM for decoding.
+
+    An ARPA file (`.arpa` or `.arpa.gz`) is loaded as an n-gram LM over the vocabulary
+    of the ASR model. Otherwise, the configuration is loaded from `conf.yml` in the
+    same directory as the checkpoint.
+
+    Args:
+        lm_path (str): path to a checkpoint or an ARPA file
+        asr_dict_path (str): path to the dictionary of the ASR model
+        recog_mem_len (int): memory length of TransformerXL
+        wordlm (bool):
+    Returns:
+        lm (LMBase):
+        args_lm (Namespace): configuration of the LM
+
+    """
+    if lm_path.endswith(('.arpa', '.arpa.gz')):
+        args_lm = argparse.Namespace(lm_type='ngram', arpa_path=lm_path, backward=False)
+        return build_lm(args_lm, asr_dict_path=asr_dict_path), args_lm
+
+    conf_lm = load_config(os.path.join(os.path.dirname(lm_path), 'conf.yml'))
+    args_lm = argparse.Namespace()
+    for k, v in conf_lm.items():
+        setattr(args_lm, k, v)
+    args_lm.recog_mem_len = recog_mem_len
+    lm = build_lm(args_lm, wordlm=wordlm,
+                  lm_dict_path=os.path.join(os.path.dirname(lm_path), 'dict.txt'),
+                  asr_dict_path=asr_dict_path)
+    load_checkpoint(lm_path, lm)
+    return lm, args_lm
+
+
 def average_checkpoints(model, best_model_path, n_average, topk_list=[]):
     if n_average == 1:
         return model
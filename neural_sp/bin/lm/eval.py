@@ -57,6 +57,7 @@ def main():
             logger.info('epoch: %d' % epoch)
             logger.info('batch size: %d' % args.recog_batch_size)
             logger.info('BPTT: %d' % (args.bptt))
+            logger.info('stride: %d' % (args.recog_stride))
             logger.info('cache size: %d' % (args.recog_n_caches))
             logger.info('cache theta: %.3f' % (args.recog_cache_theta))
             logger.info('cache lambda: %.3f' % (args.recog_cache_lambda))
@@ -71,7 +72,8 @@ def main():
         start_time = time.time()
 
         ppl, _ = eval_ppl([model], dataset, batch_size=1, bptt=args.bptt,
-                          n_caches=args.recog_n_caches, progressbar=True)
+                          n_caches=args.recog_n_caches, progressbar=True,
+                          stride=args.recog_stride)
         ppl_avg += ppl
         print('PPL (%s): %.2f' % (dataset.set, ppl))
         logger.info('Elasped time: %.2f [sec]:' % (time.time() - start_time))
@@ -85,39 +85,31 @@ def main():
 
         hidden = None
         fig_count = 0
-        toknen_count = 0
-        n_tokens = args.recog_n_caches
+        model.reset_cache()
         while True:
             ys, is_new_epoch = dataset.next()
-
-            for t in range(ys.shape[1] - 1):
-                loss, hidden = model(ys[:, t:t + 2], hidden, is_eval=True, n_caches=args.recog_n_caches)[:2]
-
-                if len(model.cache_attn) > 0:
-                    if toknen_count == n_tokens:
-                        tokens_keys = dataset.idx2token[0](model.cache_ids[:args.recog_n_caches], return_list=True)
-                        tokens_query = dataset.idx2token[0](model.cache_ids[-n_tokens:], return_list=True)
-
-                        # Slide attention matrix
-                        n_keys = len(tokens_keys)
-                        n_queries = len(tokens_query)
-                        cache_probs = np.zeros((n_keys, n_queries))  # `[n_keys, n_queries]`
-                        mask = np.zeros((n_keys, n_queries))
-                        for i, aw in enumerate(model.cache_attn[-n_tokens:]):
-                            cache_probs[:(n_keys - n_queries + i + 1), i] = aw[0, -(n_keys - n_queries + i + 1):]
-                            mask[(n_keys - n_queries + i + 1):, i] = 1
-
-                        plot_cache_weights(
-                            cache_probs,
-                            keys=tokens_keys,
-                            queries=tokens_query,
-                            save_path=mkdir_join(save_path, str(fig_count) + '.png'),
-                            figsize=(40, 16),
-                            mask=mask)
-                        toknen_count = 0
-                        fig_count += 1
-                    else:
-                        toknen_count += 1
+            loss, hidden = model(ys, hidden, is_eval=True, n_caches=args.recog_n_caches)[:2]
+
+            # Attention weights over keys (cached tokens and the current chunk) for each query
+            n_queries = ys.shape[1] - 1
+            tokens_keys = dataset.idx2token[0](model.cache_attn_ids, return_list=True)
+            tokens_query = tokens_keys[-n_queries:]
+            cache_probs = model.cache_attn.T  # `[n_keys, n_queries]`
+            n_keys = cache_probs.shape[0]
+            mask = np.ones((n_keys, n_queries))
+            for i in range(n_queries):
+                # key j is visible to query i if it is one of the previous `n_caches` tokens
+                j_end = n_keys - n_queries + i
+                mask[max(0, j_end - args.recog_n_caches):j_end, i] = 0
+
+            plot_cache_weights(
+                cache_probs,
+                keys=tokens_keys,
+                queries=tokens_query,
+                save_path=mkdir_join(save_path, str(fig_count) + '.png'),
+                figsize=(40, 16),
+                mask=mask)
+            fig_count += 1
 
             if is_new_epoch:
                 break
@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Rescore dumped N-best lists with forward/backward LMs offline.
+
+Each N-best list is a tsv file with the following columns:
+    utt_id: utterance ID
+    score: score of the hypothesis given by the first-path decoding
+    token_id: space-separated token IDs of the hypothesis (<sos> and <eos> excluded)
+
+"""
+
+import argparse
+import logging
+import numpy as np
+import os
+import pandas as pd
+import sys
+import time
+
+from neural_sp.bin.args_lm import parse_args_eval
+from neural_sp.bin.train_utils import (
+    load_checkpoint,
+    load_config,
+    set_logger
+)
+from neural_sp.models.lm.build import build_lm
+from neural_sp.models.lm.nbest_rescoring import rescore_nbest
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+
+    # Load configuration
+    args, _, dir_name = parse_args_eval(sys.argv[1:])
+
+    # Setting for logging
+    if os.path.isfile(os.path.join(args.recog_dir, 'rescore.log')):
+        os.remove(os.path.join(args.recog_dir, 'rescore.log'))
+    set_logger(os.path.join(args.recog_dir, 'rescore.log'), stdout=args.recog_stdout)
+
+    # Load the forward LM
+    lm_fwd = build_lm(args)
+    load_checkpoint(args.recog_model[0], lm_fwd)
+
+    # Load the backward LM
+    lm_bwd = None
+    if args.recog_lm_bwd is not None and args.recog_lm_bwd_weight > 0:
+        conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm_bwd), 'conf.yml'))
+        args_lm_bwd = argparse.Namespace()
+        for k, v in conf_lm.items():
+            setattr(args_lm_bwd, k, v)
+        args_lm_bwd.recog_mem_len = args.recog_mem_len
+        lm_bwd = build_lm(args_lm_bwd)
+        load_checkpoint(args.recog_lm_bwd, lm_bwd)
+
+    logger.info('forward LM weight: %.3f' % args.recog_lm_weight)
+    logger.info('backward LM weight: %.3f' % (args.recog_lm_bwd_weight if lm_bwd is not None else 0))
+    logger.info('batch size: %d' % args.recog_batch_size)
+
+    # GPU setting
+    if args.recog_n_gpus > 0:
+        lm_fwd.cuda()
+        if lm_bwd is not None:
+            lm_bwd.cuda()
+
+    for s in args.recog_sets:
+        start_time = time.time()
+
+        df = pd.read_csv(s, encoding='utf-8', delimiter='\t', dtype={'token_id': str})
+        df['token_id'] = df['token_id'].fillna('')
+        ys = [[lm_fwd.eos] + list(map(int, token_id.split())) + [lm_fwd.eos]
+              for token_id in df['token_id']]
+
+        # NOTE: all hypotheses over utterances are packed into mini-batches
+        scores_fwd, scores_bwd = rescore_nbest(ys, lm_fwd, lm_bwd, batch_size=args.recog_batch_size)
+        df['score_lm'] = scores_fwd
+        df['score_lm_bwd'] = scores_bwd if scores_bwd is not None else np.zeros(len(df))
+        df['score_total'] = df['score'] + df['score_lm'] * args.recog_lm_weight
+        if scores_bwd is not None:
+            df['score_total'] += df['score_lm_bwd'] * args.recog_lm_bwd_weight
+
+        # Rerank hypotheses per utterance
+        df = df.sort_values(['utt_id', 'score_total'], ascending=[True, False], kind='mergesort')
+        set_name = os.path.splitext(os.path.basename(s))[0]
+        df.to_csv(os.path.join(args.recog_dir, set_name + '_rescored.tsv'),
+                  sep='\t', index=False, encoding='utf-8')
+        df.groupby('utt_id', sort=False).head(1).to_csv(
+            os.path.join(args.recog_dir, set_name + '_1best.tsv'),
+            sep='\t', index=False, encoding='utf-8')
+
+        logger.info('%s: %d hypotheses of %d utterances' % (set_name, len(df), df['utt_id'].nunique()))
+        logger.info('Elasped time: %.2f [sec]:' % (time.time() - start_time))
+
+
+if __name__ == '__main__':
+    main()
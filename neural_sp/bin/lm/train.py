@@ -66,7 +66,8 @@ def main():
                         bptt=args.bptt,
                         shuffle=args.shuffle,
                         backward=args.backward,
-                        serialize=args.serialize)
+                        serialize=args.serialize,
+                        token_stream_dir=args.token_stream_dir)
     dev_set = Dataset(corpus=args.corpus,
                       tsv_path=args.dev_set,
                       dict_path=args.dict,
@@ -76,7 +77,8 @@ def main():
                       batch_size=batch_size,
                       bptt=args.bptt,
                       backward=args.backward,
-                      serialize=args.serialize)
+                      serialize=args.serialize,
+                      token_stream_dir=args.token_stream_dir)
     eval_sets = [Dataset(corpus=args.corpus,
                          tsv_path=s,
                          dict_path=args.dict,
@@ -9,6 +9,7 @@
    You can use the multi-GPU version.
 """
 
+from collections import OrderedDict
 import codecs
 import kaldiio
 import numpy as np
@@ -50,7 +51,7 @@ class Dataset(object):
                  wp_model_sub1=False, ctc_sub1=False, subsample_factor_sub1=1,
                  tsv_path_sub2=False, dict_path_sub2=False, unit_sub2=False,
                  wp_model_sub2=False, ctc_sub2=False, subsample_factor_sub2=1,
-                 discourse_aware=False, first_n_utterances=-1):
+                 discourse_aware=False, interleave_sessions=False, first_n_utterances=-1):
         """A class for loading dataset.
 
         Args:
@@ -77,6 +78,8 @@ class Dataset(object):
             wp_model (): path to the word-piece model for sentencepiece
             corpus (str): name of corpus
             discourse_aware (bool):
+            interleave_sessions (bool): make each row of mini-batches a different session
+                and feed utterances of the session in order (for decoding with state carry over)
             first_n_utterances (int): evaluate the first N utterances
 
         """
@@ -103,6 +106,9 @@ class Dataset(object):
         self.discourse_aware = discourse_aware
         if discourse_aware:
             assert not is_test
+        self.interleave_sessions = interleave_sessions
+        if interleave_sessions:
+            assert is_test and not discourse_aware
 
         self.vocab = count_vocab_size(dict_path)
         self.eos = 2
@@ -269,6 +275,8 @@ class Dataset(object):
 
         if discourse_aware:
             self.df_indices_buckets = self.discourse_bucketing(batch_size)
+        elif interleave_sessions:
+            self.df_indices_buckets = self.session_interleaving(batch_size)
         elif shuffle_bucket:
             self.df_indices_buckets = self.shuffle_bucketing(batch_size)
         else:
@@ -298,6 +306,8 @@ class Dataset(object):
 
         if self.discourse_aware:
             self.df_indices_buckets = self.discourse_bucketing(batch_size)
+        elif self.interleave_sessions:
+            self.df_indices_buckets = self.session_interleaving(batch_size)
         elif self.shuffle_bucket:
             self.df_indices_buckets = self.shuffle_bucketing(batch_size)
         else:
@@ -353,7 +363,7 @@ class Dataset(object):
         """
         is_new_epoch = False
 
-        if self.discourse_aware:
+        if self.discourse_aware or self.interleave_sessions:
             df_indices_mb = self.df_indices_buckets.pop(0)
             self.offset += len(df_indices_mb)
             is_new_epoch = (len(self.df_indices_buckets) == 0)
@@ -492,3 +502,33 @@ class Dataset(object):
                     df_indices_buckets.append(df_indices_mb)
 
         return df_indices_buckets
+
+    def session_interleaving(self, batch_size):
+        """Interleave sessions so that each row of mini-batches is a different session.
+
+        Up to `batch_size` sessions are active at once, and each mini-batch contains
+        the next utterance of every active session in the order of the tsv file.
+        When a session finishes, a new session takes over its row.
+
+        Args:
+            batch_size (int): maximum number of sessions decoded in parallel
+        Returns:
+            df_indices_buckets (list): list of indices of dataframe per mini-batch
+
+        """
+        session_indices = OrderedDict()
+        for i, session in zip(self.df.index, self.df['session']):
+            if session not in session_indices:
+                session_indices[session] = []
+            session_indices[session].append(i)
+        pending = list(session_indices.values())
+
+        df_indices_buckets = []  # list of list
+        active = []
+        while len(pending) > 0 or len(active) > 0:
+            while len(active) < batch_size and len(pending) > 0:
+                active.append(pending.pop(0))
+            df_indices_buckets.append([ids.pop(0) for ids in active])
+            active = [ids for ids in active if len(ids) > 0]
+
+        return df_indices_buckets
@@ -9,6 +9,7 @@
    You can use the multi-GPU version.
 """
 
+import hashlib
 import logging
 import numpy as np
 import os
@@ -31,13 +32,80 @@ np.random.seed(1)
 logger = logging.getLogger(__name__)
 
 
+def build_token_stream(df, eos):
+    """Concatenate token IDs of all sentences into a flat array.
+
+    Args:
+        df (pd.DataFrame): tsv records
+        eos (int): index of <eos> (<sos>) prepended to each sentence
+    Returns:
+        tokens (np.ndarray): `[n_tokens]`, int32
+        offsets (np.ndarray): `[n_sents + 1]`, start index of each sentence in tokens
+
+    """
+    ids = []
+    for token_id in df['token_id']:
+        assert token_id != ''
+        ids += [np.array([eos] + list(map(int, token_id.split())), dtype=np.int32)]
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in ids])
+    tokens = np.concatenate(ids) if len(ids) > 0 else np.zeros(0, dtype=np.int32)
+    return tokens, offsets
+
+
+def token_stream_key(tsv_path, dict_path, unit, wp_model, serialize):
+    """Return a key identifying the token stream of a dataset.
+
+    The key changes when the tsv file is modified or a different tsv file with the same
+    name, dictionary, unit or word-piece model is used, so that stale streams are not reused.
+
+    Args:
+        tsv_path (str): path to the dataset tsv file
+        dict_path (str): path to the dictionary
+        unit (str): word or wp or char or phone or word_char
+        wp_model (): path to the word-piece model for sentencepiece
+        serialize (bool): serialize text according to contexts in dialogue
+    Returns:
+        key (str): hexadecimal digest
+
+    """
+    sources = [(os.path.abspath(path), os.path.getmtime(path)) if path and os.path.isfile(path) else path
+               for path in [tsv_path, dict_path, wp_model]]
+    return hashlib.md5(repr(sources + [unit, serialize]).encode('utf-8')).hexdigest()[:16]
+
+
+def load_token_stream(df, eos, stream_path):
+    """Load a pre-built token stream as memory-mapped arrays, building it if missing.
+
+    Args:
+        df (pd.DataFrame): tsv records (only used to build the stream)
+        eos (int): index of <eos> (<sos>)
+        stream_path (str): path prefix of `*.tokens.npy` and `*.offsets.npy`
+    Returns:
+        tokens (np.memmap): `[n_tokens]`, int32
+        offsets (np.memmap): `[n_sents + 1]`, int64
+
+    """
+    if not os.path.isfile(stream_path + '.offsets.npy'):
+        tokens, offsets = build_token_stream(df, eos)
+        # NOTE: write to temporary files first not to load incomplete streams from other processes
+        for name, x in [('tokens', tokens), ('offsets', offsets)]:
+            with open(stream_path + '.%s.tmp.npy' % name, 'wb') as f:
+                np.save(f, x)
+            os.replace(stream_path + '.%s.tmp.npy' % name, stream_path + '.%s.npy' % name)
+        logger.info('Saved the token stream to %s' % stream_path)
+    tokens = np.load(stream_path + '.tokens.npy', mmap_mode='r')
+    offsets = np.load(stream_path + '.offsets.npy', mmap_mode='r')
+    return tokens, offsets
+
+
 class Dataset(object):
 
     def __init__(self, tsv_path, dict_path,
                  unit, batch_size, nlsyms=False, n_epochs=1e10,
                  is_test=False, min_n_tokens=1,
                  bptt=2, shuffle=False, backward=False, serialize=False,
-                 wp_model=None, corpus=''):
+                 wp_model=None, corpus='', token_stream_dir=False):
         """A class for loading dataset.
 
         Args:
@@ -55,6 +123,9 @@ class Dataset(object):
             serialize (bool): serialize text according to contexts in dialogue
             wp_model (): path to the word-piece model for sentencepiece
             corpus (str): name of corpus
+            token_stream_dir (str): directory to save a binary token stream of this dataset,
+                which is memory-mapped instead of loading all tokens into memory.
+                The stream is identified by the tsv file (path and mtime), dictionary, unit and word-piece model.
 
         """
         super(Dataset, self).__init__()
@@ -95,60 +166,95 @@ class Dataset(object):
         else:
             raise ValueError(unit)
 
-        # Load dataset tsv file
-        self.df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t')
-        self.df = self.df.loc[:, ['utt_id', 'speaker', 'feat_path',
-                                  'xlen', 'xdim', 'text', 'token_id', 'ylen', 'ydim']]
+        # Load the pre-built token stream if any
+        stream_path = None
+        df = None
+        if token_stream_dir:
+            if not os.path.isdir(token_stream_dir):
+                os.makedirs(token_stream_dir)
+            stream_path = os.path.join(token_stream_dir, os.path.basename(tsv_path).split('.')[0])
+            if serialize:
+                stream_path += '_serialize'
+            stream_path += '_' + token_stream_key(tsv_path, dict_path, unit, wp_model, serialize)
+        if stream_path is None or not os.path.isfile(stream_path + '.offsets.npy'):
+            df = self.load_tsv(tsv_path, serialize, corpus)
+
+        if stream_path is not None:
+            self.tokens, self.offsets = load_token_stream(df, self.eos, stream_path)
+        else:
+            self.tokens, self.offsets = build_token_stream(df, self.eos)
 
         # Remove inappropriate utterances
+        ylens = np.diff(self.offsets) - 1  # exclude <eos>
+        n_utts = len(ylens)
+        print('Original utterance num: %d' % n_utts)
         if is_test:
-            print('Original utterance num: %d' % len(self.df))
-            n_utts = len(self.df)
-            self.df = self.df[self.df.apply(lambda x: x['ylen'] > 0, axis=1)]
-            print('Removed %d empty utterances' % (n_utts - len(self.df)))
+            self.sent_ids = np.where(ylens > 0)[0]
+            print('Removed %d empty utterances' % (n_utts - len(self.sent_ids)))
         else:
-            print('Original utterance num: %d' % len(self.df))
-            n_utts = len(self.df)
-            self.df = self.df[self.df.apply(lambda x: x['ylen'] >= min_n_tokens, axis=1)]
-            print('Removed %d utterances (threshold)' % (n_utts - len(self.df)))
+            self.sent_ids = np.where(ylens >= min_n_tokens)[0]
+            print('Removed %d utterances (threshold)' % (n_utts - len(self.sent_ids)))
+        if backward:
+            self.sent_ids = self.sent_ids[::-1]
 
-        # Sort tsv records
+        # Sort sentences
         if shuffle:
             assert not serialize
-            self.df = self.df.reindex(np.random.permutation(self.df.index))
-        elif serialize:
-            assert not shuffle
+        self.set_order(np.random.permutation(self.sent_ids) if shuffle else self.sent_ids)
+
+    def load_tsv(self, tsv_path, serialize, corpus):
+        """Load a dataset tsv file and sort records."""
+        df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t')
+        df = df.loc[:, ['utt_id', 'speaker', 'feat_path',
+                        'xlen', 'xdim', 'text', 'token_id', 'ylen', 'ydim']]
+        df = df[df.apply(lambda x: x['ylen'] > 0, axis=1)]
+        if serialize:
             assert corpus == 'swbd'
-            self.df['session'] = self.df['speaker'].apply(lambda x: str(x).split('-')[0])
-            self.df['onset'] = self.df['utt_id'].apply(lambda x: int(x.split('_')[-1].split('-')[0]))
-            self.df = self.df.sort_values(by=['session', 'onset'], ascending=True)
+            df['session'] = df['speaker'].apply(lambda x: str(x).split('-')[0])
+            df['onset'] = df['utt_id'].apply(lambda x: int(x.split('_')[-1].split('-')[0]))
+            df = df.sort_values(by=['session', 'onset'], ascending=True)
         else:
-            self.df = self.df.sort_values(by='utt_id', ascending=True)
-
-        # Concatenate into a single sentence
-        self.concat_ids = self.concat_utterances(self.df)
-
-    def concat_utterances(self, df):
-        indices = list(df.index)
-        if self.backward:
-            indices = indices[::-1]
-        concat_ids = []
-        for i in indices:
-            assert df['token_id'][i] != ''
-            concat_ids += [self.eos] + list(map(int, df['token_id'][i].split()))
-        concat_ids += [self.eos]  # for the last sentence
+            df = df.sort_values(by='utt_id', ascending=True)
+        return df
+
+    def set_order(self, order):
+        """Set the order of sentences in the concatenated token stream.
+
+        Sentences are not copied here. Tokens are gathered in `next` instead.
+
+        Args:
+            order (np.ndarray): `[n_sents]`, sentence indices
+
+        """
+        self.order = order
+        starts = self.offsets[order]
+        self.cum_lens = np.zeros(len(order) + 1, dtype=np.int64)
+        self.cum_lens[1:] = np.cumsum(self.offsets[order + 1] - starts)
+        self.starts = starts
+        n_tokens = self.cum_lens[-1] + 1  # <eos> for the last sentence
         # NOTE: <sos> and <eos> have the same index
+        self.n_tokens = n_tokens // self.batch_size * self.batch_size
+        logger.info('Removed %d tokens / %d tokens' % (n_tokens - self.n_tokens, n_tokens))
+
+    def gather(self, positions):
+        """Gather tokens at positions in the concatenated token stream.
 
-        # Reshape
-        n_utts = len(concat_ids)
-        concat_ids = concat_ids[:n_utts // self.batch_size * self.batch_size]
-        logger.info('Removed %d tokens / %d tokens' % (n_utts - len(concat_ids), n_utts))
-        concat_ids = np.array(concat_ids).reshape((self.batch_size, -1))
+        Args:
+            positions (np.ndarray): positions of any shape
+        Returns:
+            ys (np.ndarray): token IDs of the same shape as positions
 
-        return concat_ids
+        """
+        sent_idx = np.searchsorted(self.cum_lens, positions, side='right') - 1
+        is_last = sent_idx >= len(self.order)  # <eos> for the last sentence
+        sent_idx = np.minimum(sent_idx, len(self.order) - 1)
+        token_idx = self.starts[sent_idx] + positions - self.cum_lens[sent_idx]
+        ys = np.asarray(self.tokens[np.where(is_last, 0, token_idx)], dtype=np.int64)
+        ys[is_last] = self.eos
+        return ys
 
     def __len__(self):
-        return len(self.concat_ids.reshape((-1,)))
+        return self.n_tokens
 
     @property
     def epoch_detail(self):
@@ -158,8 +264,7 @@ class Dataset(object):
     def reset(self):
         """Reset data counter and offset."""
         if self.shuffle:
-            self.df = self.df.reindex(np.random.permutation(self.df.index))
-            self.concat_ids = self.concat_utterances(self.df)
+            self.set_order(np.random.permutation(self.sent_ids))
         self.offset = 0
 
     def next(self, batch_size=None, bptt=None):
@@ -175,9 +280,8 @@ class Dataset(object):
         """
         if batch_size is None:
             batch_size = self.batch_size
-        elif self.concat_ids.shape[0] != batch_size:
-            self.concat_ids = self.concat_ids.reshape((batch_size, -1))
-            # NOTE: only for the first iteration during evaluation
+        # NOTE: the stream is split into `batch_size` rows
+        row_len = len(self) // batch_size
 
         if bptt is None:
             bptt = self.bptt
@@ -185,10 +289,9 @@ class Dataset(object):
         if self.epoch >= self.max_epoch:
             raise StopIteration
 
-        ys = self.concat_ids[:, self.offset:self.offset + bptt]
+        cols = np.arange(self.offset, min(self.offset + bptt, row_len))
+        ys = self.gather(np.arange(batch_size)[:, None] * row_len + cols[None, :])
         self.offset += bptt - 1
-        # ys = self.concat_ids[:, self.offset:self.offset + (bptt + 1)]
-        # self.offset += (bptt + 1) - 1
         # NOTE: the last token in ys must be feeded as inputs in the next mini-batch
 
         is_new_epoch = False
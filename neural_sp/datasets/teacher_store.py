@@ -0,0 +1,144 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Store of sparse teacher distributions for offline knowledge distillation.
+
+A store directory contains the following files:
+    ids.bin: top-k token IDs per output position, int32 `[n_positions, topk]`
+    log_probs.bin: teacher log-probabilities of the top-k tokens, float16 `[n_positions, topk]`
+    offsets.npy: start position of each utterance, int64 `[n_utts + 1]`
+    utt_ids.txt: utterance IDs in the order of offsets
+    conf.yml: topk and temperature
+
+"""
+
+import codecs
+import logging
+import numpy as np
+import os
+import torch
+
+from neural_sp.bin.train_utils import (
+    load_config,
+    save_config
+)
+from neural_sp.models.torch_utils import np2tensor
+
+logger = logging.getLogger(__name__)
+
+
+class TeacherStoreWriter(object):
+    """Append top-k teacher log-probabilities to a store mini-batch by mini-batch.
+
+    Args:
+        save_dir (str): path to the store directory
+        topk (int): number of tokens to keep per output position
+        temperature (float): temperature applied to teacher logits before softmax
+
+    """
+
+    def __init__(self, save_dir, topk, temperature=5.0):
+
+        super(TeacherStoreWriter, self).__init__()
+
+        self.save_dir = save_dir
+        self.topk = topk
+        self.temperature = temperature
+        self.offsets = [0]
+        self.utt_ids = []
+
+        if not os.path.isdir(save_dir):
+            os.makedirs(save_dir)
+        self.f_ids = open(os.path.join(save_dir, 'ids.bin'), 'wb')
+        self.f_log_probs = open(os.path.join(save_dir, 'log_probs.bin'), 'wb')
+
+    def add(self, utt_ids, logits, ylens):
+        """Add teacher outputs of a mini-batch.
+
+        Args:
+            utt_ids (list): length `B`
+            logits (FloatTensor): `[B, L, vocab]`, teacher logits
+            ylens (list): length `B`, number of output positions of each utterance (including <eos>)
+
+        """
+        log_probs = torch.log_softmax(logits.float() / self.temperature, dim=-1)
+        topk_log_probs, topk_ids = torch.topk(log_probs, k=min(self.topk, log_probs.size(-1)), dim=-1)
+        topk_log_probs = topk_log_probs.cpu().numpy().astype(np.float16)
+        topk_ids = topk_ids.cpu().numpy().astype(np.int32)
+        for b, utt_id in enumerate(utt_ids):
+            topk_ids[b, :ylens[b]].tofile(self.f_ids)
+            topk_log_probs[b, :ylens[b]].tofile(self.f_log_probs)
+            self.offsets.append(self.offsets[-1] + ylens[b])
+            self.utt_ids.append(utt_id)
+
+    def close(self):
+        self.f_ids.close()
+        self.f_log_probs.close()
+        np.save(os.path.join(self.save_dir, 'offsets.npy'), np.array(self.offsets, dtype=np.int64))
+        with codecs.open(os.path.join(self.save_dir, 'utt_ids.txt'), 'w', encoding='utf-8') as f:
+            for utt_id in self.utt_ids:
+                f.write(utt_id + '\n')
+        # NOTE: conf.yml is written at last to mark the store as complete
+        save_config({'topk': self.topk, 'temperature': self.temperature},
+                    os.path.join(self.save_dir, 'conf.yml'))
+        logger.info('Saved teacher outputs of %d utterances (%d positions) to %s' %
+                    (len(self.utt_ids), self.offsets[-1], self.save_dir))
+
+
+class TeacherStore(object):
+    """Memory-mapped store of top-k teacher log-probabilities.
+
+    Args:
+        store_dir (str): path to the store directory written by TeacherStoreWriter
+
+    """
+
+    def __init__(self, store_dir):
+
+        super(TeacherStore, self).__init__()
+
+        assert os.path.isfile(os.path.join(store_dir, 'conf.yml')), 'The teacher store is incomplete.'
+        conf = load_config(os.path.join(store_dir, 'conf.yml'))
+        self.topk = conf['topk']
+        self.temperature = conf['temperature']
+
+        self.offsets = np.load(os.path.join(store_dir, 'offsets.npy'))
+        with codecs.open(os.path.join(store_dir, 'utt_ids.txt'), 'r', encoding='utf-8') as f:
+            self.utt2idx = {line.strip(): i for i, line in enumerate(f)}
+        self.ids = np.memmap(os.path.join(store_dir, 'ids.bin'),
+                             dtype=np.int32, mode='r').reshape(-1, self.topk)
+        self.log_probs = np.memmap(os.path.join(store_dir, 'log_probs.bin'),
+                                   dtype=np.float16, mode='r').reshape(-1, self.topk)
+        logger.info('Loaded teacher outputs of %d utterances (top-%d, temperature=%.1f)' %
+                    (len(self.utt2idx), self.topk, self.temperature))
+
+    def __len__(self):
+        return len(self.utt2idx)
+
+    def lookup(self, utt_ids, device_id=-1):
+        """Gather top-k teacher log-probabilities of a mini-batch.
+
+        Args:
+            utt_ids (list): length `B`
+            device_id (int): GPU ID (-1 for CPU)
+        Returns:
+            topk_ids (LongTensor): `[B, L, topk]`, padded with 0
+            topk_log_probs (FloatTensor): `[B, L, topk]`, padded with 0
+
+        """
+        spans = []
+        for utt_id in utt_ids:
+            assert utt_id in self.utt2idx, 'No teacher outputs for %s.' % utt_id
+            i = self.utt2idx[utt_id]
+            spans.append((self.offsets[i], self.offsets[i + 1]))
+        ymax = max([e - s for s, e in spans])
+
+        topk_ids = np.zeros((len(utt_ids), ymax, self.topk), dtype=np.int64)
+        topk_log_probs = np.zeros((len(utt_ids), ymax, self.topk), dtype=np.float32)
+        for b, (s, e) in enumerate(spans):
+            topk_ids[b, :e - s] = self.ids[s:e]
+            topk_log_probs[b, :e - s] = self.log_probs[s:e]
+        return np2tensor(topk_ids, device_id), np2tensor(topk_log_probs, device_id)
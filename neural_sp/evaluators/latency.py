@@ -0,0 +1,220 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Evaluate emission latency of streaming ASR with a simulated real-time clock."""
+
+import logging
+import numpy as np
+import time
+import torch
+from tqdm import tqdm
+
+from neural_sp.models.seq2seq.streaming_session import StreamingSession
+from neural_sp.models.torch_utils import np2tensor
+from neural_sp.models.torch_utils import pad_list
+
+logger = logging.getLogger(__name__)
+
+FRAME_SHIFT = 0.01  # [sec]
+PERCENTILES = [50, 90, 99]
+
+
+def eval_latency(models, dataset, recog_params, idx2token=None, block_size=10,
+                 progressbar=False):
+    """Evaluate emission latency of streaming decoding.
+
+    Args:
+        models (list): models to evaluate (only the first model is used)
+        dataset (Dataset): evaluation dataset
+        recog_params (dict):
+        idx2token (): converter from index to token
+        block_size (int): number of frames pushed at once
+        progressbar (bool): visualize the progressbar
+    Returns:
+        stats (dict): percentiles [ms] of
+            emission (list): delays of the first emission of correct tokens
+            final (list): delays until correct tokens are finalized
+            first_token (list): latency of the first matched token in each utterance
+            eou (list): finalization delay after the end of each utterance
+
+    """
+    # Reset data counter
+    dataset.reset(recog_params['recog_batch_size'])
+
+    model = models[0]
+    delays = {'emission': [], 'final': [], 'first_token': [], 'eou': []}
+    if progressbar:
+        pbar = tqdm(total=len(dataset))
+    while True:
+        batch, is_new_epoch = dataset.next(recog_params['recog_batch_size'])
+        for b in range(len(batch['xs'])):
+            result = measure_latency(model, recog_params, batch['xs'][b], batch['ys'][b],
+                                     idx2token, block_size)
+            delays['emission'] += result['emission']
+            delays['final'] += result['final']
+            if result['first_token'] is not None:
+                delays['first_token'].append(result['first_token'])
+            delays['eou'].append(result['eou'])
+            logger.debug('Utt-id: %s' % batch['utt_ids'][b])
+            logger.debug('emission delays: %s' % ' '.join(['%.2f' % d for d in result['emission']]))
+
+        if progressbar:
+            pbar.update(len(batch['xs']))
+
+        if is_new_epoch:
+            break
+
+    if progressbar:
+        pbar.close()
+
+    # Reset data counters
+    dataset.reset(recog_params['recog_batch_size'])
+
+    stats = {}
+    for k, v in delays.items():
+        stats[k] = [float(np.percentile(v, p)) * 1000 if len(v) > 0 else float('nan') for p in PERCENTILES]
+    return stats
+
+
+def measure_latency(model, params, x, y, idx2token=None, block_size=10, timer=time.time):
+    """Decode an utterance in simulated real time and measure delays of tokens.
+
+    Input features arrive block by block in real time, and the decoder processes them
+    as soon as it finishes the previous block. Processing time is measured by `timer`.
+    The time when each token of the final hypothesis is first emitted in partial
+    results and the time when it is finalized (committed) are compared with CTC
+    forced-alignment timestamps of the matched reference tokens.
+
+    Args:
+        model (Speech2Text): streamable ASR model
+        params (dict): hyperparameters for decoding
+        x (np.ndarray): `[T, input_dim]`
+        y (list): reference token IDs
+        idx2token (): converter from index to token
+        block_size (int): number of frames pushed at once
+        timer (callable): clock measuring processing time [sec]
+    Returns:
+        result (dict):
+            hyp (list): final hypothesis
+            emission (list): delays of the first emission of matched tokens [sec]
+            final (list): delays until matched tokens are finalized [sec]
+            first_token (float): delay of the first matched token, None if no token matches [sec]
+            eou (float): delay from the end of the utterance to the final result [sec]
+
+    """
+    session = StreamingSession(model, params, idx2token)
+    records = []  # (time, partial hypothesis, number of committed tokens)
+    now = 0.
+    for t in range(0, len(x), block_size):
+        arrival = min(t + block_size, len(x)) * FRAME_SHIFT
+        tic = timer()
+        hyp_partial = session.push_features(x[t:t + block_size])
+        now = max(arrival, now) + timer() - tic
+        records.append((now, hyp_partial.tolist(), len(session.committed)))
+    eou_time = len(x) * FRAME_SHIFT
+    tic = timer()
+    hyp = session.finalize().tolist()
+    now = max(eou_time, now) + timer() - tic
+    records.append((now, hyp, len(hyp)))
+
+    emit_times, final_times = emission_times(records, hyp)
+    ref_times = ctc_alignment_times(model, x, y) if len(y) > 0 else []
+    pairs = match_tokens(y, hyp)
+    first_token = None
+    if len(pairs) > 0:
+        i, j = pairs[0]
+        first_token = emit_times[i] - ref_times[j]
+    return {'hyp': hyp,
+            'emission': [emit_times[i] - ref_times[j] for i, j in pairs],
+            'final': [final_times[i] - ref_times[j] for i, j in pairs],
+            'first_token': first_token,
+            'eou': now - eou_time}
+
+
+def emission_times(records, hyp):
+    """Find when each token of the final hypothesis is first emitted and finalized.
+
+    A token is emitted when partial results contain the same prefix up to the token
+    for the first time, and it is finalized when it is committed.
+
+    Args:
+        records (list): (time, partial hypothesis, number of committed tokens)
+            in the chronological order, the last of which is the final result
+        hyp (list): final hypothesis
+    Returns:
+        emit_times (list): `[L]`
+        final_times (list): `[L]`
+
+    """
+    emit_times = [None] * len(hyp)
+    final_times = [None] * len(hyp)
+    for now, hyp_partial, n_committed in records:
+        n_match = 0
+        while n_match < min(len(hyp), len(hyp_partial)) and hyp_partial[n_match] == hyp[n_match]:
+            n_match += 1
+        for i in range(n_match):
+            if emit_times[i] is None:
+                emit_times[i] = now
+        for i in range(min(n_committed, len(hyp))):
+            if final_times[i] is None:
+                final_times[i] = now
+    return emit_times, final_times
+
+
+def match_tokens(ref, hyp):
+    """Align the hypothesis with the reference by the longest common subsequence.
+
+    Args:
+        ref (list): reference tokens
+        hyp (list): hypothesis tokens
+    Returns:
+        pairs (list): (index in hyp, index in ref) of matched tokens
+
+    """
+    lcs = np.zeros((len(hyp) + 1, len(ref) + 1), dtype=np.int32)
+    for i in range(len(hyp) - 1, -1, -1):
+        for j in range(len(ref) - 1, -1, -1):
+            if hyp[i] == ref[j]:
+                lcs[i, j] = lcs[i + 1, j + 1] + 1
+            else:
+                lcs[i, j] = max(lcs[i + 1, j], lcs[i, j + 1])
+    pairs = []
+    i, j = 0, 0
+    while i < len(hyp) and j < len(ref):
+        if hyp[i] == ref[j]:
+            pairs.append((i, j))
+            i += 1
+            j += 1
+        elif lcs[i + 1, j] >= lcs[i, j + 1]:
+            i += 1
+        else:
+            j += 1
+    return pairs
+
+
+def ctc_alignment_times(model, x, y):
+    """Compute timestamps of reference tokens by CTC forced alignment.
+
+    The whole utterance is encoded offline, and each token is timestamped at the end
+    of the first frame of its CTC spike.
+
+    Args:
+        model (Speech2Text): ASR model with CTC
+        x (np.ndarray): `[T, input_dim]`
+        y (list): reference token IDs
+    Returns:
+        ref_times (list): `[L]`, timestamps [sec]
+
+    """
+    ctc = model.dec_fwd.ctc
+    factor = model.enc.subsampling_factor * model.n_stacks
+    with torch.no_grad():
+        eout_dict = model.encode([x], 'ys')
+        eouts, elens = eout_dict['ys']['xs'], eout_dict['ys']['xlens']
+        ys = pad_list([np2tensor(np.fromiter(y, dtype=np.int64), model.device_id)], 0)
+        ylens = torch.IntTensor([len(y)])
+        trigger_points = ctc.forced_aligner.align(ctc.output(eouts), elens.cpu(), ys, ylens)
+    return [(t + 1) * factor * FRAME_SHIFT for t in trigger_points[0, :len(y)].tolist()]
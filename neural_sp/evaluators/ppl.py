@@ -8,12 +8,14 @@
 
 import logging
 import numpy as np
+import torch
 from tqdm import tqdm
 
 from neural_sp.models.lm.gated_convlm import GatedConvLM
 from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.lm.transformerlm import TransformerLM
 from neural_sp.models.lm.transformer_xl import TransformerXL
+from neural_sp.models.torch_utils import np2tensor
 
 logger = logging.getLogger(__name__)
 
@@ -31,8 +33,51 @@ def check_lm(model):
         return False
 
 
+def forward_stride(model, ys, state, context_len):
+    """Compute log-probabilities of a stride of tokens with the left context of previous strides.
+
+    States of the previous strides are reused instead of re-encoding the left context:
+        - RNNLM: recurrent states
+        - GatedConvLM: inputs to convolutions in the receptive field
+        - TransformerXL: memory of the last `context_len` tokens, as in the segment-level
+          recurrence of training (results depend on the stride since memory is not normalized)
+        - TransformerLM: layer-wise caches (keys and values) of the last `context_len` tokens
+    NOTE: The results of TransformerLM are exact until the stream exceeds `context_len` tokens.
+    After that, cached states keep positional encodings of previous windows as in TransformerXL.
+
+    Args:
+        model (LMBase): language model
+        ys (np.ndarray): `[B, stride + 1]`, the first token is the last one of the previous stride
+        state: states of the previous strides (None for the first stride)
+        context_len (int): number of tokens in the left context for TransformerLM/TransformerXL
+    Returns:
+        nll (FloatTensor): `[B, stride]`, negative log-likelihood of each token
+        new_state: states to be passed to the next stride
+
+    """
+    ys = np2tensor(ys, model.device_id).long()
+    ys_in, ys_out = ys[:, :-1], ys[:, 1:]
+
+    if isinstance(model, TransformerLM):
+        ys_ctx, cache = state if state is not None else (None, None)
+        if ys_ctx is not None:
+            ys_in = torch.cat([ys_ctx, ys_in], dim=1)
+        _, cache, log_probs = model.predict(ys_in, cache=cache)
+        log_probs = log_probs[:, -ys_out.size(1):]
+        new_state = (ys_in[:, -context_len:], [c[:, -context_len:] for c in cache])
+    elif isinstance(model, TransformerXL):
+        _, cache, log_probs = model.predict(ys_in, mems=state)
+        new_state = model.update_memory_from_cache(state, ys_in, cache)
+        new_state = [m[:, -context_len:] for m in new_state]
+    else:
+        _, new_state, log_probs = model.predict(ys_in, state)
+
+    nll = -torch.gather(log_probs, 2, ys_out.unsqueeze(2)).squeeze(2)
+    return nll, new_state
+
+
 def eval_ppl(models, dataset, batch_size=1, bptt=None,
-             n_caches=0, progressbar=False):
+             n_caches=0, progressbar=False, stride=0):
     """Evaluate a Seq2seq or (RNN/GatedConv)LM by perprexity and loss.
 
     Args:
@@ -40,8 +85,11 @@ def eval_ppl(models, dataset, batch_size=1, bptt=None,
         dataset (Dataset): evaluation dataset
         batch_size (int): batch size
         bptt (int): BPTT length
-        n_caches (int):
+        n_caches (int): number of tokens for the cache LM
         progressbar (bool): if True, visualize the progressbar
+        stride (int): number of tokens scored per forward in the sliding-window evaluation.
+            Each token is scored with the left context of at least `bptt` tokens
+            by reusing states of previous strides. BPTT chunks are evaluated independently if 0.
     Returns:
         ppl (float): Average perplexity
         loss (float): Average loss
@@ -54,29 +102,35 @@ def eval_ppl(models, dataset, batch_size=1, bptt=None,
     total_loss = 0
     n_tokens = 0
     hidden = None  # for RNNLM
+    if is_lm and n_caches > 0:
+        models[0].reset_cache()
     if progressbar:
         pbar = tqdm(total=len(dataset))
+    if is_lm and stride > 0:
+        assert n_caches == 0
+        models[0].eval()
     while True:
-        if is_lm:
-            ys, is_new_epoch = dataset.next(batch_size, bptt)
+        if is_lm and stride > 0:
+            ys, is_new_epoch = dataset.next(batch_size, stride + 1)
             bs, time = ys.shape[:2]
-            if n_caches > 0:
-                assert isinstance(models[0], RNNLM)
-                # NOTE: cache is not supported for GatedConvLM/TransformerLM now
-                for t in range(time - 1):
-                    loss, hidden = models[0](ys[:, t:t + 2], hidden, is_eval=True, n_caches=n_caches)[:2]
-                    total_loss += loss.item() * bs
-                    n_tokens += bs
-
-                    if progressbar:
-                        pbar.update(bs)
-            else:
-                loss, hidden = models[0](ys, hidden, is_eval=True)[:2]
-                total_loss += loss.item() * bs * (time - 1)
+            if time > 1:
+                with torch.no_grad():
+                    nll, hidden = forward_stride(models[0], ys, hidden, bptt)
+                total_loss += nll.sum().item()
                 n_tokens += bs * (time - 1)
 
-                if progressbar:
-                    pbar.update(bs * (time - 1))
+            if progressbar:
+                pbar.update(bs * (time - 1))
+        elif is_lm:
+            ys, is_new_epoch = dataset.next(batch_size, bptt)
+            bs, time = ys.shape[:2]
+            # NOTE: the cache LM processes a whole BPTT chunk at once with a causal mask
+            loss, hidden = models[0](ys, hidden, is_eval=True, n_caches=n_caches)[:2]
+            total_loss += loss.item() * bs * (time - 1)
+            n_tokens += bs * (time - 1)
+
+            if progressbar:
+                pbar.update(bs * (time - 1))
         else:
             batch, is_new_epoch = dataset.next(batch_size)
             bs = len(batch['ys'])
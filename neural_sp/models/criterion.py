@@ -114,6 +114,29 @@ def distillation(logits_student, logits_teacher, ylens, temperature=5.0):
     return loss_mean
 
 
+def distillation_topk(logits_student, topk_ids, topk_log_probs_teacher, ylens):
+    """Compute cross entropy loss for knowledge distillation from sparse teacher distributions.
+
+    The teacher distribution is renormalized over the top-k tokens dumped offline.
+
+    Args:
+        logits_student (FloatTensor): `[B, T, vocab]`
+        topk_ids (LongTensor): `[B, T, topk]`
+        topk_log_probs_teacher (FloatTensor): `[B, T, topk]`, temperature is already applied
+        ylens (IntTensor): `[B]`
+    Returns:
+        loss_mean (FloatTensor): `[1]`
+
+    """
+    bs = logits_student.size(0)
+
+    log_probs_student = torch.log_softmax(logits_student, dim=-1)
+    probs_teacher = torch.softmax(topk_log_probs_teacher.float(), dim=-1).data
+    loss = -torch.mul(probs_teacher, torch.gather(log_probs_student, 2, topk_ids))
+    loss_mean = np.sum([loss[b, :ylens[b], :].sum() for b in range(bs)]) / ylens.sum()
+    return loss_mean
+
+
 def kldiv_lsm_ctc(logits, ylens):
     """Compute KL divergence loss for label smoothing of CTC and Transducer models.
 
@@ -155,3 +178,60 @@ def focal_loss(logits, ys, ylens, alpha, gamma):
     loss = -alpha * torch.mul(torch.pow(probs_inv, gamma), log_probs)
     loss_mean = np.sum([loss[b, :ylens[b], :].sum() for b in range(bs)]) / ylens.sum()
     return loss_mean
+
+
+def transducer_loss(log_probs_blank, log_probs_label, elens, ylens):
+    """Compute RNN-T loss with the forward algorithm in pure PyTorch.
+
+    Forward variables are computed along anti-diagonals of the `[T, L+1]` lattice
+    so that the number of sequential steps is `T + L`. Each anti-diagonal is indexed
+    by the label position u, so that log-probabilities rearranged along anti-diagonals
+    are `[B, L+1, T+L]` and each step keeps `[B, L+1]` forward variables for autograd.
+    The memory footprint is `O(B * (L+1) * (T+L))`, i.e., at most about twice as large
+    as the lattice when L <= T, and the full `[B, T, L+1, vocab]` tensor does not
+    have to be kept. Gradients are computed by autograd.
+
+    Args:
+        log_probs_blank (FloatTensor): `[B, T, L+1]`
+        log_probs_label (FloatTensor): `[B, T, L]`
+        elens (IntTensor): `[B]`
+        ylens (IntTensor): `[B]`
+    Returns:
+        loss_mean (FloatTensor): `[1]`
+
+    """
+    bs, xmax, ymax = log_probs_label.size()
+    n_diags = xmax + ymax
+    log0 = -1e10  # finite value to avoid NaN gradients
+    device = log_probs_blank.device
+
+    # The (t, u)-th node on the n-th anti-diagonal (n = t + u) is stored at [:, u, n]
+    us = torch.arange(ymax + 1, device=device).unsqueeze(1)
+    ts = torch.arange(n_diags, device=device).unsqueeze(0) - us  # `[L+1, T+L]`
+    mask = (ts < 0) | (ts >= xmax)
+    ts = ts.clamp(0, xmax - 1).unsqueeze(0).expand(bs, -1, -1)
+    blank_skew = log_probs_blank.transpose(1, 2).gather(2, ts).masked_fill(mask, log0)
+    label_skew = F.pad(log_probs_label, (0, 1)).transpose(1, 2).gather(2, ts)
+    label_skew = label_skew.masked_fill(mask | (us == ymax), log0)  # `[B, L+1, T+L]`
+
+    elens = elens.to(device).long()
+    ylens = ylens.to(device).long()
+    bidx = torch.arange(bs, device=device)
+    last_diags = elens - 1 + ylens
+
+    alpha = log_probs_blank.new_zeros(bs, ymax + 1).fill_(log0)
+    alpha[:, 0] = 0.
+    log_likelihood = alpha[bidx, ylens]
+    for n in range(1, n_diags):
+        # (t-1, u) -> (t, u) by <blank>
+        from_blank = alpha + blank_skew[:, :, n - 1]
+        # (t, u-1) -> (t, u) by the u-th label
+        from_label = torch.cat([alpha.new_zeros(bs, 1).fill_(log0),
+                                (alpha + label_skew[:, :, n - 1])[:, :-1]], dim=1)
+        alpha = torch.logsumexp(torch.stack([from_blank, from_label], dim=0), dim=0)
+        alpha = alpha.masked_fill(mask[:, n], log0)
+        log_likelihood = torch.where(last_diags == n, alpha[bidx, ylens], log_likelihood)
+
+    log_likelihood = log_likelihood + log_probs_blank[bidx, elens - 1, ylens]
+    loss_mean = -log_likelihood.mean()
+    return loss_mean
@@ -15,12 +15,15 @@ def build_lm(args, save_path=None, wordlm=False, lm_dict_path=None, asr_dict_pat
         save_path (str):
         wordlm (bool):
         lm_dict_path (dict):
-        asr_dict_path (dict):
+        asr_dict_path (dict): required for n-gram LMs (`args.lm_type == 'ngram'`)
     Returns:
         lm ():
 
     """
-    if 'gated_conv' in args.lm_type:
+    if args.lm_type == 'ngram':
+        from neural_sp.models.lm.ngram import NgramLM
+        lm = NgramLM(args.arpa_path, asr_dict_path)
+    elif 'gated_conv' in args.lm_type:
         from neural_sp.models.lm.gated_convlm import GatedConvLM
         lm = GatedConvLM(args, save_path)
     elif args.lm_type == 'transformer':
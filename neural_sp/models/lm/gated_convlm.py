@@ -8,6 +8,7 @@
 
 from collections import OrderedDict
 import logging
+import torch
 import torch.nn as nn
 
 from neural_sp.models.lm.lm_base import LMBase
@@ -40,9 +41,7 @@ class GatedConvLM(LMBase):
         # for cache
         self.cache_theta = 0.2  # smoothing parameter
         self.cache_lambda = 0.2  # cache weight
-        self.cache_ids = []
-        self.cache_keys = []
-        self.cache_attn = []
+        self.reset_cache()
 
         self.embed = nn.Embedding(self.vocab, args.emb_dim, padding_idx=self.pad)
         self.dropout_embed = nn.Dropout(p=args.dropout_in)
@@ -174,19 +173,23 @@ class GatedConvLM(LMBase):
             else:
                 raise ValueError(n)
 
-    def decode(self, ys, state=None, mems=None, incremental=False):
+    def decode(self, ys, state=None, mems=None, cache=None, incremental=False):
         """Decode function.
 
         Args:
             ys (LongTensor): `[B, L]`
-            state: dummy interfance for RNNLM
+            state (list): length `n_blocks`, each of which contains a FloatTensor
+                `[B, in_ch, kernel_size-1, 1]`, inputs of each block at the last
+                `kernel_size-1` time steps (used only in the incremental mode)
+            mems: dummy interfance for TransformerXL
             cache: dummy interfance for TransformerLM/TransformerXL
-            incremental: dummy interfance for TransformerLM/TransformerXL
+            incremental (bool): ASR decoding mode. Only new positions are computed
+                with the left context in `state`.
         Returns:
             logits (FloatTensor): `[B, L, vocab]`
             out (FloatTensor): `[B, L, d_model]` (for cache)
-            new_cache: dummy interfance for RNNLM/TransformerLM/TransformerXL
-            new_mems: dummy interfance for TransformerXL
+            new_state (list): length `n_blocks`, each of which contains a FloatTensor
+                `[B, in_ch, kernel_size-1, 1]` (None if not incremental)
 
         """
         out = self.dropout_embed(self.embed(ys.long()))
@@ -194,7 +197,20 @@ class GatedConvLM(LMBase):
 
         # NOTE: consider embed_dim as in_ch
         out = out.unsqueeze(3)
-        out = self.blocks(out.transpose(2, 1))  # [B, out_ch, T, 1]
+        out = out.transpose(2, 1)  # `[B, in_ch, T, 1]`
+        if incremental:
+            if state is None:
+                state = [None] * len(self.blocks)
+            new_state = []
+            for lth, block in enumerate(self.blocks):
+                context = state[lth]
+                if context is None:
+                    context = out.new_zeros(bs, out.size(1), block.kernel_size - 1, 1)
+                new_state.append(torch.cat([context, out], dim=2)[:, :, max_ylen:])
+                out = block(out, cache=context)
+        else:
+            new_state = None
+            out = self.blocks(out)  # [B, out_ch, T, 1]
         out = out.transpose(2, 1).contiguous()  # `[B, T, out_ch, 1]`
         out = out.squeeze(3)
         if self.adaptive_softmax is None:
@@ -202,4 +218,4 @@ class GatedConvLM(LMBase):
         else:
             logits = out
 
-        return logits, out, None
+        return logits, out, new_state
@@ -15,6 +15,7 @@ from neural_sp.models.criterion import cross_entropy_lsm
 from neural_sp.models.torch_utils import compute_accuracy
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import pad_list
+from neural_sp.models.torch_utils import tensor2np
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +32,16 @@ class LMBase(ModelBase):
     def reset_parameters(self, param_init):
         raise NotImplementedError
 
+    @property
+    def restricted_scoring(self):
+        """Whether `score_candidates` is cheaper than the full output layer.
+
+        The full softmax needs the log-normalizer over the whole vocabulary, so
+        candidate-restricted scoring is used only with the adaptive softmax.
+
+        """
+        return self.adaptive_softmax is not None
+
     def forward(self, ys, state=None, is_eval=False, n_caches=0,
                 ylens=[], predict_last=False):
         """Forward computation.
@@ -72,58 +83,107 @@ class LMBase(ModelBase):
             logits = logits[:, -1].unsqueeze(1)
 
         # Compute XE sequence loss
-        if n_caches > 0 and len(self.cache_ids) > 0:
-            assert ys_out.size(1) == 1
-            assert ys_out.size(0) == 1
-            if self.adaptive_softmax is None:
-                probs = torch.softmax(logits, dim=-1)
-            else:
-                probs = self.adaptive_softmax.log_prob(logits).exp()
-            cache_probs = probs.new_zeros(probs.size())
-
-            # Truncate cache
-            self.cache_ids = self.cache_ids[-n_caches:]  # list of `[B, 1]`
-            self.cache_keys = self.cache_keys[-n_caches:]  # list of `[B, 1, n_units]`
-
-            # Compute inner-product over caches
-            cache_attn = torch.softmax(self.cache_theta * torch.matmul(
-                torch.cat(self.cache_keys, dim=1), out.transpose(2, 1)).squeeze(2), dim=1)
-
-            # For visualization
-            if len(self.cache_ids) == n_caches:
-                self.cache_attn += [cache_attn.cpu().numpy()]
-                self.cache_attn = self.cache_attn[-n_caches:]
-
-            # Sum all probabilities
-            for offset, idx in enumerate(self.cache_ids):
-                cache_probs[:, :, idx] += cache_attn[:, offset]
-            probs = (1 - self.cache_lambda) * probs + self.cache_lambda * cache_probs
-            loss = -torch.log(probs[:, :, ys_out[:, -1]])
+        if n_caches > 0:
+            loss, ppl = self.cache_loss(logits, out, ys_out, n_caches)
         else:
             if self.adaptive_softmax is None:
                 loss, ppl = cross_entropy_lsm(logits, ys_out.contiguous(),
                                               self.lsm_prob, self.pad, self.training,
                                               normalize_length=True)
             else:
-                loss = self.adaptive_softmax(logits.view((-1, logits.size(2))),
+                loss = self.adaptive_softmax(logits.reshape((-1, logits.size(2))),
                                              ys_out.contiguous().view(-1)).loss
                 ppl = np.exp(loss.item())
 
-        if n_caches > 0:
-            # Register to cache
-            self.cache_ids += [ys_out[0, -1].item()]
-            self.cache_keys += [out]
-
         # Compute token-level accuracy in teacher-forcing
         if self.adaptive_softmax is None:
             acc = compute_accuracy(logits, ys_out, pad=self.pad)
         else:
             acc = compute_accuracy(self.adaptive_softmax.log_prob(
-                logits.view((-1, logits.size(2)))), ys_out, pad=self.pad)
+                logits.reshape((-1, logits.size(2)))), ys_out, pad=self.pad)
 
         observation = {'loss.lm': loss.item(), 'acc.lm': acc, 'ppl.lm': ppl}
         return loss, new_state, observation
 
+    def reset_cache(self):
+        """Reset the ring buffer of the cache LM."""
+        self.cache_ids = None  # `[B, n_caches]`
+        self.cache_keys = None  # `[B, n_caches, n_units]`
+        self.cache_pos = None  # `[n_caches]`
+        self.n_cached = 0
+        self.cache_attn = None
+        self.cache_attn_ids = None
+
+    def cache_loss(self, logits, out, ys_out, n_caches):
+        """Compute XE loss of the cache LM over a chunk of tokens.
+
+        Each token attends to the outputs at the previous `n_caches` tokens,
+        consisting of the ring buffer and the preceding tokens in the chunk,
+        and the attention weights are added to the probabilities of their target tokens.
+
+        Args:
+            logits (FloatTensor): `[B, L, vocab]`
+            out (FloatTensor): `[B, L, n_units]`
+            ys_out (LongTensor): `[B, L]`
+            n_caches (int): number of cached tokens
+        Returns:
+            loss (FloatTensor): `[1]`
+            ppl (float): perplexity
+
+        """
+        bs, ylen = ys_out.size()
+        if self.adaptive_softmax is None:
+            probs = torch.softmax(logits, dim=-1)
+        else:
+            probs = self.adaptive_softmax.log_prob(logits.reshape(bs * ylen, -1)).exp().view(bs, ylen, -1)
+
+        if self.cache_keys is None or self.cache_keys.size(0) != bs or self.cache_keys.size(1) != n_caches:
+            self.cache_ids = ys_out.new_full((bs, n_caches), self.pad)
+            self.cache_keys = out.new_zeros(bs, n_caches, out.size(2))
+            self.cache_pos = ys_out.new_full((n_caches,), -1)  # `-1` for empty slots
+            self.n_cached = 0
+
+        # Keys are the ring buffer followed by the current chunk
+        keys = torch.cat([self.cache_keys, out], dim=1)  # `[B, n_caches + L, n_units]`
+        ids = torch.cat([self.cache_ids, ys_out], dim=1)  # `[B, n_caches + L]`
+        pos_q = torch.arange(self.n_cached, self.n_cached + ylen, device=ys_out.device)
+        pos_k = torch.cat([self.cache_pos, pos_q], dim=0)
+
+        # Causal mask over the last `n_caches` tokens
+        mask = (pos_k.unsqueeze(0) < pos_q.unsqueeze(1)) & (pos_k.unsqueeze(0) >= pos_q.unsqueeze(1) - n_caches)
+        mask = mask.unsqueeze(0) & (ids != self.pad).unsqueeze(1)  # `[B, L, n_caches + L]`
+
+        # Compute inner-product over caches
+        NEG_INF = float(np.finfo(torch.tensor(0, dtype=out.dtype).numpy().dtype).min)
+        e = self.cache_theta * torch.matmul(out, keys.transpose(2, 1))  # `[B, L, n_caches + L]`
+        cache_attn = torch.softmax(e.masked_fill(mask == 0, NEG_INF), dim=-1).masked_fill(mask == 0, 0)
+
+        # Sum all probabilities
+        cache_probs = torch.zeros_like(probs).scatter_add_(2, ids.unsqueeze(1).expand(-1, ylen, -1), cache_attn)
+        has_cache = mask.any(dim=-1, keepdim=True)  # `[B, L, 1]`
+        probs = torch.where(has_cache, (1 - self.cache_lambda) * probs + self.cache_lambda * cache_probs, probs)
+        nll = -torch.log(torch.gather(probs, 2, ys_out.unsqueeze(2)).squeeze(2))
+        mask_out = ys_out != self.pad
+        loss = nll.masked_fill(mask_out == 0, 0).sum() / mask_out.sum().clamp(min=1)
+        ppl = np.exp(loss.item())
+
+        # For visualization (the first utterance in the chronological order)
+        order = torch.argsort(pos_k)
+        order = order[pos_k[order] >= 0]
+        self.cache_attn = tensor2np(cache_attn[0][:, order])  # `[L, n_keys]`
+        self.cache_attn_ids = tensor2np(ids[0][order])  # `[n_keys]`
+
+        # Register the last `n_caches` tokens to the ring buffer
+        n_new = min(ylen, n_caches)
+        pos_new = pos_q[-n_new:]
+        slots = pos_new % n_caches
+        self.cache_ids[:, slots] = ys_out[:, -n_new:]
+        self.cache_keys[:, slots] = out[:, -n_new:]
+        self.cache_pos[slots] = pos_new
+        self.n_cached += ylen
+
+        return loss, ppl
+
     def repackage_state(self, state):
         return state
 
@@ -134,7 +194,7 @@ class LMBase(ModelBase):
     def decode(self, ys, state=None, mems=None, incremental=False):
         raise NotImplementedError
 
-    def predict(self, ys, state=None, mems=None, cache=None):
+    def predict(self, ys, state=None, mems=None, cache=None, skip_output=False):
         """Precict function for ASR.
 
         Args:
@@ -147,6 +207,8 @@ class LMBase(ModelBase):
                 - TransformerXL (list): length `n_layers + 1`, each of which contains a tensor`[B, L, d_model]`
             mems (list):
             cache (list):
+            skip_output (bool): skip the softmax of the adaptive softmax.
+                Use `score_candidates` to compute log-probabilities of candidate tokens from `lmout`.
         Returns:
             lmout (FloatTensor): `[B, L, vocab]`, used for LM integration such as cold fusion
             state:
@@ -155,14 +217,46 @@ class LMBase(ModelBase):
                     cxs (FloatTensor): `[n_layers, B, n_units]`
                 - TransformerLM (LongTensor): `[B, L]`
                 - TransformerXL (list): length `n_layers + 1`, each of which contains a tensor`[B, L, d_model]`
-            log_probs (FloatTensor): `[B, L, vocab]`
+            log_probs (FloatTensor): `[B, L, vocab]`, None if skip_output is True
 
         """
-        logits, lmout, new_state = self.decode(ys, state, mems=mems, cache=cache,
-                                               incremental=True)
-        log_probs = torch.log_softmax(logits, dim=-1)
+        logits, lmout, new_state = self.decode(ys, state, mems=mems, cache=cache, incremental=True)
+        if skip_output:
+            return lmout, new_state, None
+        if self.adaptive_softmax is None:
+            log_probs = torch.log_softmax(logits, dim=-1)
+        else:
+            bs, ylen = logits.size()[:2]
+            log_probs = self.adaptive_softmax.log_prob(logits.reshape(bs * ylen, -1)).view(bs, ylen, -1)
         return lmout, new_state, log_probs
 
+    def score_candidates(self, lmout, cands):
+        """Compute log-probabilities of candidate tokens only with the adaptive softmax.
+
+        Only the head and the tail clusters containing candidates are evaluated.
+
+        Args:
+            lmout (FloatTensor): `[B, n_units]`, hidden states before the adaptive softmax
+            cands (LongTensor): `[B, K]`, candidate token IDs
+        Returns:
+            log_probs (FloatTensor): `[B, K]`
+
+        """
+        assert self.adaptive_softmax is not None
+        asm = self.adaptive_softmax
+        head_log_probs = torch.log_softmax(asm.head(lmout), dim=-1)  # `[B, shortlist + n_clusters]`
+        log_probs = head_log_probs.gather(1, cands.clamp(max=asm.shortlist_size - 1))
+        for i in range(asm.n_clusters):
+            start, end = asm.cutoffs[i], asm.cutoffs[i + 1]
+            in_cluster = (cands >= start) & (cands < end)
+            if not in_cluster.any():
+                continue
+            tail_log_probs = torch.log_softmax(asm.tail[i](lmout), dim=-1)  # `[B, end - start]`
+            tail_log_probs = tail_log_probs.gather(1, (cands - start).clamp(min=0, max=end - start - 1))
+            cluster_log_probs = head_log_probs[:, asm.shortlist_size + i].unsqueeze(1) + tail_log_probs
+            log_probs = torch.where(in_cluster, cluster_log_probs, log_probs)
+        return log_probs
+
     def plot_attention(self):
         # raise NotImplementedError
         pass
@@ -0,0 +1,174 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Prefix-keyed LRU cache of LM states for shallow fusion."""
+
+from collections import OrderedDict
+import logging
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def select_state(state, ids):
+    """Select hypotheses from a batched LM state.
+
+    Args:
+        state:
+            - RNNLM: dict
+                hxs (FloatTensor): `[n_layers, B, n_units]`
+                cxs (FloatTensor): `[n_layers, B, n_units]`
+            - TransformerLM/TransformerXL (list): length `n_layers`,
+                each of which contains a tensor `[B, L, d_model]`
+        ids (LongTensor): `[B']`
+    Returns:
+        state: the same structure as the input with the batch size of `B'`
+
+    """
+    if state is None:
+        return None
+    if isinstance(state, dict):
+        return {k: v.index_select(1, ids) if v is not None else None for k, v in state.items()}
+    return [s.index_select(0, ids) if s is not None else None for s in state]
+
+
+def concat_state(states):
+    """Concatenate LM states of hypotheses in the batch dimension.
+
+    Args:
+        states (list): LM states, each of which has the batch size of 1
+    Returns:
+        state: batched LM state
+
+    """
+    if states[0] is None:
+        return None
+    if isinstance(states[0], dict):
+        return {k: torch.cat([s[k] for s in states], dim=1) if states[0][k] is not None else None
+                for k in states[0].keys()}
+    return [torch.cat([s[lth] for s in states], dim=0) if states[0][lth] is not None else None
+            for lth in range(len(states[0]))]
+
+
+class LMStateCache(object):
+    """Bounded LRU cache of LM outputs and states keyed by token prefixes.
+
+    Each entry holds the outputs of the LM after consuming a token prefix
+    (including <sos>), i.e., the last-position LM output, log-probabilities
+    (None in candidate-restricted scoring), and the recurrent states (RNNLM)
+    or layer-wise caches (TransformerLM/TransformerXL).
+    Hypotheses sharing a prefix, within a beam or across utterances, reuse
+    the entry instead of running the LM again.
+
+    Args:
+        capacity (int): maximum number of prefixes to keep
+
+    """
+
+    def __init__(self, capacity):
+
+        super(LMStateCache, self).__init__()
+
+        self.capacity = capacity
+        self.lm = None
+        self.entries = OrderedDict()
+        self.reset_stats()
+
+    def reset(self):
+        self.entries = OrderedDict()
+
+    def reset_stats(self):
+        self.n_queries = 0
+        self.n_hits = 0
+
+    @property
+    def hit_rate(self):
+        return self.n_hits / self.n_queries if self.n_queries > 0 else 0.
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, prefix, skip_output=False):
+        """Look up a prefix and mark it as the most recently used one.
+
+        Args:
+            prefix (tuple): token IDs
+            skip_output (bool): log-probabilities are not required
+        Returns:
+            entry (tuple): (lmout, state, log_probs), or None if not cached
+
+        """
+        self.n_queries += 1
+        entry = self.entries.get(prefix)
+        if entry is not None and entry[2] is None and not skip_output:
+            entry = None  # cached in candidate-restricted scoring
+        if entry is not None:
+            self.n_hits += 1
+            self.entries.move_to_end(prefix)
+        return entry
+
+    def store(self, prefix, entry):
+        """Register a prefix and evict the least recently used ones.
+
+        Args:
+            prefix (tuple): token IDs
+            entry (tuple): (lmout, state, log_probs)
+
+        """
+        self.entries[prefix] = entry
+        self.entries.move_to_end(prefix)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def predict(self, lm, prefixes, ys, state=None, cache=None, skip_output=False):
+        """Cached version of LMBase.predict for a batch of hypotheses.
+
+        Only hypotheses whose prefixes are not cached are fed to the LM, in a single batch.
+
+        Args:
+            lm (LMBase): language model
+            prefixes (list): length `B`, token IDs of each hypothesis including <sos>
+            ys (LongTensor): `[B, L]`, inputs to the LM
+            state: batched LM state of the parent prefixes (see LMBase.predict)
+            cache (list): batched layer-wise caches for TransformerLM/TransformerXL
+            skip_output (bool): skip the output layer (see LMBase.predict)
+        Returns:
+            lmout (FloatTensor): `[B, 1, n_units]`
+            state: batched LM state after consuming the prefixes
+            log_probs (FloatTensor): `[B, 1, vocab]`, None if skip_output is True
+
+        """
+        if lm is not self.lm:
+            # cached states are only valid for the same LM
+            self.reset()
+            self.lm = lm
+
+        prefixes = [tuple(prefix) for prefix in prefixes]
+        entries = [self.lookup(prefix, skip_output) for prefix in prefixes]
+        miss_ids = [j for j, entry in enumerate(entries) if entry is None]
+
+        if len(miss_ids) > 0:
+            if len(miss_ids) < len(prefixes):
+                ids = torch.tensor(miss_ids, dtype=torch.long, device=ys.device)
+                ys = ys.index_select(0, ids)
+                state = select_state(state, ids)
+                cache = select_state(cache, ids)
+            lmout, new_state, log_probs = lm.predict(ys, state, cache=cache, skip_output=skip_output)
+            ids = torch.arange(len(miss_ids), device=ys.device)
+            for i, j in enumerate(miss_ids):
+                # NOTE: clone to release the batched tensors
+                entry = (lmout[i:i + 1, -1:].clone(),
+                         select_state(new_state, ids[i:i + 1]),
+                         log_probs[i:i + 1, -1:].clone() if log_probs is not None else None)
+                entries[j] = entry
+                self.store(prefixes[j], entry)
+
+        lmout = torch.cat([entry[0] for entry in entries], dim=0)
+        state = concat_state([entry[1] for entry in entries])
+        log_probs = None
+        if not skip_output:
+            log_probs = torch.cat([entry[2] for entry in entries], dim=0)
+        return lmout, state, log_probs
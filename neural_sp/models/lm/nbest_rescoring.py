@@ -0,0 +1,87 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Batched N-best rescoring with forward/backward language models."""
+
+import logging
+import numpy as np
+import torch
+
+from neural_sp.models.torch_utils import np2tensor
+from neural_sp.models.torch_utils import pad_list
+from neural_sp.models.torch_utils import tensor2np
+
+logger = logging.getLogger(__name__)
+
+
+def score_nbest(lm, ys, reverse=False, batch_size=0):
+    """Compute length-normalized LM scores of N-best hypotheses.
+
+    Hypotheses are sorted by length and packed into mini-batches so that
+    each mini-batch is scored with a single forward pass of the LM.
+
+    Args:
+        lm (LMBase): language model
+        ys (list): length `n_hyps`, each of which contains token IDs
+            including <sos> at the beginning (and <eos> at the end if any)
+        reverse (bool): score hypotheses in the reverse order with a backward LM
+        batch_size (int): maximum number of hypotheses per forward pass.
+            All hypotheses are scored at once if 0.
+    Returns:
+        scores (np.ndarray): `[n_hyps]`, average log-probability per token
+
+    """
+    n_hyps = len(ys)
+    scores = np.zeros(n_hyps, dtype=np.float32)
+    if n_hyps == 0:
+        return scores
+    if batch_size <= 0:
+        batch_size = n_hyps
+
+    device_id = lm.device_id
+    ys = [np.fromiter(y[::-1] if reverse else y, dtype=np.int64) for y in ys]
+    perm_ids = sorted(range(n_hyps), key=lambda i: len(ys[i]), reverse=True)
+
+    training = lm.training
+    lm.eval()
+    with torch.no_grad():
+        for offset in range(0, n_hyps, batch_size):
+            ids = perm_ids[offset:offset + batch_size]
+            ys_b = [np2tensor(ys[i], device_id) for i in ids]
+            ys_in = pad_list([y[:-1] for y in ys_b], lm.pad)  # `[B, L-1]`
+            ys_out = pad_list([y[1:] for y in ys_b], -1)  # `[B, L-1]`
+            mask = ys_out != -1
+            ylens = mask.sum(1)
+
+            _, _, log_probs = lm.predict(ys_in, None)
+            log_probs = torch.gather(log_probs, 2, ys_out.clamp(min=0).unsqueeze(2)).squeeze(2)
+            log_probs = log_probs.masked_fill(mask == 0, 0.)
+            scores_b = log_probs.sum(1) / ylens.clamp(min=1).float()
+            scores[ids] = tensor2np(scores_b)
+    lm.train(training)
+    return scores
+
+
+def rescore_nbest(ys, lm_fwd=None, lm_bwd=None, batch_size=0):
+    """Compute forward and backward LM scores of N-best hypotheses together.
+
+    Args:
+        ys (list): length `n_hyps`, each of which contains token IDs
+            including <sos> at the beginning (and <eos> at the end if any)
+        lm_fwd (LMBase): forward language model
+        lm_bwd (LMBase): backward language model
+        batch_size (int): maximum number of hypotheses per forward pass
+    Returns:
+        scores_fwd (np.ndarray): `[n_hyps]`, None if lm_fwd is not given
+        scores_bwd (np.ndarray): `[n_hyps]`, None if lm_bwd is not given
+
+    """
+    scores_fwd, scores_bwd = None, None
+    if lm_fwd is not None:
+        scores_fwd = score_nbest(lm_fwd, ys, reverse=False, batch_size=batch_size)
+    if lm_bwd is not None:
+        scores_bwd = score_nbest(lm_bwd, ys, reverse=True, batch_size=batch_size)
+    return scores_fwd, scores_bwd
@@ -0,0 +1,301 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Back-off n-gram language model loaded from an ARPA file."""
+
+import codecs
+import gzip
+import logging
+import math
+import numpy as np
+import torch
+
+from neural_sp.datasets.asr import count_vocab_size
+from neural_sp.models.lm.lm_base import LMBase
+
+logger = logging.getLogger(__name__)
+
+LOG_10 = math.log(10)
+LOG_ZERO = -99 * LOG_10  # log(0) in the ARPA format
+
+
+class NgramLM(LMBase):
+    """Back-off n-gram language model for shallow fusion on CPU.
+
+    All n-grams are stored in a trie of flat numpy arrays. Nodes are sorted by
+    (parent, word), so that children of each node are contiguous and a child is
+    found by a binary search over `parent * (vocab + 1) + word` for all hypotheses at once.
+    The LM state is the trie node of the longest history found in the ARPA file,
+    stored in the same format as RNNLM (`hxs`) so that it can be batched in beam search.
+
+    Args:
+        arpa_path (str): path to an ARPA file (gzip-compressed if the extension is `.gz`)
+        dict_path (str): path to the dictionary of the ASR model
+
+    """
+
+    def __init__(self, arpa_path, dict_path):
+
+        super(NgramLM, self).__init__(None)
+
+        self.lm_type = 'ngram'
+        self.vocab = count_vocab_size(dict_path)
+        self.unk = 1
+        self.eos = 2
+        self.pad = 3
+        # NOTE: reserved in advance
+        self.sos_internal = self.vocab  # <s> is distinguished from </s> inside the trie
+        self.adaptive_softmax = None
+
+        token2idx = {}
+        with codecs.open(dict_path, 'r', 'utf-8') as f:
+            for line in f:
+                w, idx = line.strip().split(' ')
+                token2idx[w] = int(idx)
+        token2idx['<s>'] = self.sos_internal
+        token2idx['</s>'] = self.eos
+        token2idx['<unk>'] = self.unk
+
+        self.load_arpa(arpa_path, token2idx)
+
+    @property
+    def device_id(self):
+        # NOTE: the trie is always kept on CPU
+        return -1
+
+    @property
+    def restricted_scoring(self):
+        return True
+
+    def load_arpa(self, arpa_path, token2idx):
+        """Load an ARPA file into the trie.
+
+        Args:
+            arpa_path (str): path to an ARPA file
+            token2idx (dict): token to index in the vocabulary
+
+        """
+        ngrams = {}
+        order = 0
+        n_skipped = 0
+        open_fn = gzip.open if arpa_path.endswith('.gz') else open
+        with open_fn(arpa_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line == '' or line.startswith('ngram ') or line == '\\data\\':
+                    continue
+                if line == '\\end\\':
+                    break
+                if line.startswith('\\') and line.endswith('-grams:'):
+                    order = int(line[1:].split('-')[0])
+                    ngrams[order] = []
+                    continue
+                fields = line.split()
+                tokens = fields[1:order + 1]
+                if any([w not in token2idx for w in tokens]):
+                    n_skipped += 1  # out of the ASR vocabulary
+                    continue
+                logp = float(fields[0]) * LOG_10
+                bo = float(fields[order + 1]) * LOG_10 if len(fields) > order + 1 else 0.
+                ngrams[order].append((tuple([token2idx[w] for w in tokens]), logp, bo))
+        self.max_order = max(ngrams.keys())
+        logger.info('%d-gram LM: %s' % (self.max_order, ' '.join(
+            ['%d-grams=%d' % (n, len(ngrams[n])) for n in sorted(ngrams.keys())])))
+        if n_skipped > 0:
+            logger.info('Skipped %d n-grams including tokens out of the vocabulary' % n_skipped)
+
+        # Assign node IDs in the order of (order, parent, word)
+        index = {(): 0}
+        words, logps, bos, parents, orders = [-1], [0.], [0.], [-1], [0]
+        for n in range(1, self.max_order + 1):
+            entries = [(index[ng[:-1]], ng[-1], logp, bo, ng) for ng, logp, bo in ngrams.get(n, [])
+                       if ng[:-1] in index]
+            entries.sort(key=lambda x: (x[0], x[1]))
+            for parent, w, logp, bo, ng in entries:
+                index[ng] = len(words)
+                words.append(w)
+                logps.append(logp)
+                bos.append(bo)
+                parents.append(parent)
+                orders.append(n)
+
+        # Longest proper suffix of each n-gram in the trie
+        suffixes = np.full(len(words), -1, dtype=np.int64)
+        for ng, node in index.items():
+            if node == 0:
+                continue
+            s = ng[1:]
+            while s not in index:
+                s = s[1:]
+            suffixes[node] = index[s]
+
+        self.words = np.array(words, dtype=np.int64)
+        self.logps = np.array(logps, dtype=np.float32)
+        self.bos = np.array(bos, dtype=np.float32)
+        self.orders = np.array(orders, dtype=np.int64)
+        self.suffixes = suffixes
+        parents = np.array(parents, dtype=np.int64)
+        self.keys = parents * (self.vocab + 1) + self.words  # sorted in the ascending order
+        self.child_starts = np.searchsorted(parents, np.arange(len(words)), side='left')
+        self.child_ends = np.searchsorted(parents, np.arange(len(words)), side='right')
+        self.sos_node = index.get((self.sos_internal,), 0)
+
+        # Unigram distribution over the vocabulary for back-off
+        # NOTE: tokens missing in the ARPA file are regarded as <unk>
+        logp_unk = logps[index[(self.unk,)]] if (self.unk,) in index else LOG_ZERO
+        self.unigram = np.full(self.vocab + 1, logp_unk, dtype=np.float32)
+        uni = slice(self.child_starts[0], self.child_ends[0])
+        self.unigram[self.words[uni]] = self.logps[uni]
+        self.unigram[[0, self.pad, self.sos_internal]] = LOG_ZERO  # <blank>, <pad> and <s> are never predicted
+
+    def find_children(self, nodes, ws):
+        """Find children of nodes in a batch.
+
+        Args:
+            nodes (np.ndarray): `[B]`, trie node IDs
+            ws (np.ndarray): `[B]`, token IDs
+        Returns:
+            children (np.ndarray): `[B]`, trie node IDs (-1 if not found)
+
+        """
+        keys = nodes * (self.vocab + 1) + ws
+        idx = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where((self.keys[idx] == keys) & (nodes >= 0), idx, -1)
+
+    def next_states(self, nodes, ws):
+        """Update states by consuming tokens.
+
+        Args:
+            nodes (np.ndarray): `[B]`, trie node IDs of the histories
+            ws (np.ndarray): `[B]`, token IDs
+        Returns:
+            new_nodes (np.ndarray): `[B]`, trie node IDs of the longest histories in the trie
+
+        """
+        new_nodes = np.zeros_like(nodes)
+        active = np.ones(len(nodes), dtype=bool)
+        while active.any():
+            children = self.find_children(nodes, ws)
+            found = active & (children >= 0)
+            new_nodes[found] = children[found]
+            active &= ~found
+            nodes = np.where(active, self.suffixes[nodes], nodes)
+            active &= nodes >= 0
+        # n-grams of the maximum order cannot be extended
+        is_max = self.orders[new_nodes] == self.max_order
+        new_nodes[is_max] = self.suffixes[new_nodes[is_max]]
+        # <eos> starts a new sentence
+        new_nodes[ws == self.eos] = self.sos_node
+        return new_nodes
+
+    def backoff_chains(self, nodes):
+        """Collect histories to back off to for nodes in a batch.
+
+        Args:
+            nodes (np.ndarray): `[B]`, trie node IDs of the histories
+        Returns:
+            chains (np.ndarray): `[B, max_order]`, trie node IDs from the longest history
+                (0 after the shortest one)
+            bo_accs (np.ndarray): `[B, max_order + 1]`, back-off weights accumulated
+                before each history in chains
+
+        """
+        chains = np.zeros((len(nodes), self.max_order), dtype=np.int64)
+        for n in range(self.max_order):
+            chains[:, n] = nodes
+            nodes = np.where(nodes > 0, self.suffixes[np.maximum(nodes, 0)], 0)
+        bo_accs = np.zeros((len(chains), self.max_order + 1), dtype=np.float32)
+        np.cumsum(self.bos[chains], axis=1, out=bo_accs[:, 1:])  # NOTE: bos[0] is 0
+        return chains, bo_accs
+
+    def log_probs(self, nodes):
+        """Compute log-probabilities over the vocabulary given histories.
+
+        Args:
+            nodes (np.ndarray): `[B]`, trie node IDs of the histories
+        Returns:
+            log_probs (np.ndarray): `[B, vocab]`
+
+        """
+        chains, bo_accs = self.backoff_chains(nodes)
+        # Back off to the unigram with the weights of all histories
+        log_probs = self.unigram[None, :] + bo_accs[:, -1:]
+        # Overwrite with longer histories
+        for n in range(self.max_order - 1, -1, -1):
+            starts = self.child_starts[chains[:, n]]
+            counts = np.where(chains[:, n] > 0, self.child_ends[chains[:, n]] - starts, 0)
+            if counts.sum() == 0:
+                continue
+            rows = np.repeat(np.arange(len(nodes)), counts)
+            children = np.arange(counts.sum()) + np.repeat(starts - np.cumsum(counts) + counts, counts)
+            log_probs[rows, self.words[children]] = self.logps[children] + bo_accs[rows, n]
+        return log_probs[:, :self.vocab]
+
+    def predict(self, ys, state=None, mems=None, cache=None, skip_output=False):
+        """Precict function for ASR.
+
+        Args:
+            ys (LongTensor): `[B, L]`
+            state (dict):
+                hxs (LongTensor): `[1, B]`, trie node IDs of the histories
+                cxs: dummy interfance for RNNLM
+            mems: dummy interfance for TransformerXL
+            cache: dummy interfance for TransformerLM/TransformerXL
+            skip_output (bool): return trie node IDs as lmout instead of log-probabilities.
+                Use `score_candidates` to compute log-probabilities of candidate tokens.
+        Returns:
+            lmout (FloatTensor): `[B, L, vocab]`, log-probabilities
+                (LongTensor `[B, L]` of trie node IDs if skip_output is True)
+            new_state (dict):
+                hxs (LongTensor): `[1, B]`
+                cxs: None
+            log_probs (FloatTensor): `[B, L, vocab]`, None if skip_output is True
+
+        """
+        bs, ylen = ys.size()
+        ys_np = ys.cpu().numpy()
+        if state is None:
+            nodes = np.zeros(bs, dtype=np.int64)
+        else:
+            nodes = state['hxs'][0].cpu().numpy()
+
+        nodes_all = np.zeros((bs, ylen), dtype=np.int64)
+        for t in range(ylen):
+            nodes = self.next_states(nodes, ys_np[:, t])
+            nodes_all[:, t] = nodes
+        new_state = {'hxs': torch.from_numpy(nodes).to(ys.device).unsqueeze(0), 'cxs': None}
+
+        if skip_output:
+            return torch.from_numpy(nodes_all).to(ys.device), new_state, None
+        log_probs = self.log_probs(nodes_all.reshape(-1)).reshape(bs, ylen, self.vocab)
+        log_probs = torch.from_numpy(log_probs).to(ys.device)
+        return log_probs, new_state, log_probs
+
+    def score_candidates(self, lmout, cands):
+        """Compute log-probabilities of candidate tokens only.
+
+        Only the candidates are looked up in the trie without the full distribution.
+
+        Args:
+            lmout (LongTensor): `[B]`, trie node IDs of the histories
+                (see `predict(skip_output=True)`)
+            cands (LongTensor): `[B, K]`, candidate token IDs
+        Returns:
+            log_probs (FloatTensor): `[B, K]`
+
+        """
+        bs, n_cands = cands.size()
+        ws = cands.cpu().numpy().reshape(-1)
+        chains, bo_accs = self.backoff_chains(lmout.cpu().numpy())
+        chains, bo_accs = np.repeat(chains, n_cands, axis=0), np.repeat(bo_accs, n_cands, axis=0)
+        log_probs = self.unigram[ws] + bo_accs[:, -1]
+        found = np.zeros(len(ws), dtype=bool)
+        for n in range(self.max_order):
+            children = self.find_children(np.where(chains[:, n] > 0, chains[:, n], -1), ws)
+            hit = ~found & (children >= 0)
+            log_probs[hit] = self.logps[children[hit]] + bo_accs[hit, n]
+            found |= hit
+        return torch.from_numpy(log_probs.reshape(bs, n_cands)).to(cands.device)
@@ -63,9 +63,7 @@ class TransformerXL(LMBase):
         # for cache
         self.cache_theta = 0.2  # smoothing parameter
         self.cache_lambda = 0.2  # cache weight
-        self.cache_ids = []
-        self.cache_keys = []
-        self.cache_attn = []
+        self.reset_cache()
 
         # positional embedding
         self.pos_emb = XLPositionalEmbedding(self.d_model, args.dropout_in)
@@ -179,6 +177,25 @@ class TransformerXL(LMBase):
 
         return new_mems
 
+    def update_memory_from_cache(self, memory_prev, ys, cache):
+        """Update memory with layer-wise caches of incremental decoding.
+
+        Caches hold outputs of each layer while memory holds inputs to each layer,
+        so the token embeddings are recomputed for the first layer.
+
+        Args:
+            memory_prev (list): length `n_layers`, each of which contains `[B, mlen, d_model]`
+            ys (LongTensor): `[B, L']`, tokens fed to the LM (<sos> included)
+            cache (list): length `n_layers`, each of which contains `[B, L, d_model]` (L <= L')
+        Returns:
+            new_mems (list): length `n_layers`, each of which contains `[B, mlen, d_model]`
+
+        """
+        ylen = cache[0].size(1)
+        with torch.no_grad():
+            emb = self.dropout_emb(self.embed(ys[:, :ylen].long()) * self.scale)
+        return self.update_memory(memory_prev, [emb] + cache[:-1])
+
     def decode(self, ys, state=None, mems=None, cache=None, incremental=False):
         """Decode function.
 
@@ -226,7 +243,7 @@ class TransformerXL(LMBase):
         hidden_states = [out]
         for lth, (mem, layer) in enumerate(zip(mems, self.layers)):
             if incremental and mlen > 0 and mem.size(0) != bs:
-                mem = mem.repeat([bs, 1, 1])
+                mem = mem.expand(bs, -1, -1)
             out = layer(out, causal_mask, cache=cache[lth],
                         pos_embs=pos_embs, memory=mem, u=self.u, v=self.v)
             if incremental:
@@ -57,9 +57,7 @@ class TransformerLM(LMBase):
         # for cache
         self.cache_theta = 0.2  # smoothing parameter
         self.cache_lambda = 0.2  # cache weight
-        self.cache_ids = []
-        self.cache_keys = []
-        self.cache_attn = []
+        self.reset_cache()
 
         self.embed = nn.Embedding(self.vocab, self.d_model, padding_idx=self.pad)
         self.pos_enc = PositionalEncoding(self.d_model, args.dropout_in, args.transformer_pe_type,
@@ -181,7 +179,8 @@ class TransformerLM(LMBase):
             ys (LongTensor): `[B, L]`
             state (list): dummy interfance for RNNLM
             mems (list): length `n_layers`, each of which contains a FloatTensor `[B, mlen, d_model]`
-            cache (list): length `L`, each of which contains a FloatTensor `[B, L-1, d_model]`
+            cache (list): length `n_layers`, each of which contains a FloatTensor `[B, L', d_model]`.
+                Only the last `L - L'` positions are computed.
             incremental (bool): ASR decoding mode
         Returns:
             logits (FloatTensor): `[B, L, vocab]`
@@ -198,8 +197,6 @@ class TransformerLM(LMBase):
 
         # Create the self-attention mask
         bs, ylen = ys.size()[:2]
-        if incremental and cache[0] is not None:
-            ylen = cache[0].size(1) + 1
         causal_mask = ys.new_ones(ylen, ylen).byte()
         causal_mask = torch.tril(causal_mask, diagonal=0, out=causal_mask).unsqueeze(0)
         causal_mask = causal_mask.repeat([bs, 1, 1])
@@ -134,9 +134,9 @@ class AttentionMechanism(nn.Module):
             if mask is not None:
                 assert self.mask.size() == (bs, 1, klen), (self.mask.size(), (bs, 1, klen))
 
-        # for batch beam search decoding
+        # for batch beam search decoding (share the cached key across hypotheses without copies)
         if self.key.size(0) != query.size(0):
-            self.key = self.key[0: 1, :, :].repeat([query.size(0), 1, 1])
+            self.key = self.key[0: 1, :, :].expand(query.size(0), -1, -1)
 
         if self.atype == 'no':
             raise NotImplementedError
@@ -7,6 +7,7 @@
 """Convolution block for Conformer encoder."""
 
 import logging
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -62,13 +63,17 @@ class ConformerConvBlock(nn.Module):
             for n, p in layer.named_parameters():
                 init_with_xavier_uniform(n, p)
 
-    def forward(self, xs):
+    def forward(self, xs, cache=None):
         """Forward pass.
 
         Args:
             xs (FloatTensor): `[B, T, d_model]`
+            cache (FloatTensor): `[B, d_model, kernel_size // 2]`, inputs of the depthwise
+                convolution in the previous frames for streaming encoding
         Returns:
             xs (FloatTensor): `[B, T, d_model]`
+            new_cache (FloatTensor): `[B, d_model, kernel_size // 2 + T]`, inputs of the
+                depthwise convolution including the cache (None if cache is not given)
 
         """
         B, T, d_model = xs.size()
@@ -79,11 +84,19 @@ class ConformerConvBlock(nn.Module):
         xs = xs.transpose(2, 1)  # `[B, T, 2 * C]`
         xs = F.glu(xs)  # `[B, T, C]`
         xs = xs.transpose(2, 1).contiguous()  # `[B, C, T]`
-        xs = self.depthwise_conv(xs)  # `[B, C, T]`
+        new_cache = None
+        if cache is not None:
+            # NOTE: the left padding is replaced with the cache
+            xs = torch.cat([cache, xs], dim=2)  # `[B, C, kernel_size // 2 + T]`
+            new_cache = xs
+            xs = F.conv1d(F.pad(xs, (0, cache.size(2))), self.depthwise_conv.weight,
+                          self.depthwise_conv.bias, groups=self.d_model)  # `[B, C, T]`
+        else:
+            xs = self.depthwise_conv(xs)  # `[B, C, T]`
 
         xs = self.batch_norm(xs)
         xs = self.activation(xs)
         xs = self.pointwise_conv2(xs)  # `[B, C, T]`
 
         xs = xs.transpose(2, 1).contiguous()  # `[B, T, C]`
-        return xs
+        return xs, new_cache
@@ -7,6 +7,7 @@
 """Gated Linear Units (GLU) block."""
 
 from collections import OrderedDict
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -43,6 +44,8 @@ class ConvGLUBlock(nn.Module):
     def __init__(self, kernel_size, in_ch, out_ch, bottlececk_dim=0, dropout=0.):
         super().__init__()
 
+        self.kernel_size = kernel_size
+
         self.conv_residual = None
         if in_ch != out_ch:
             self.conv_residual = nn.utils.weight_norm(
@@ -61,7 +64,7 @@ class ConvGLUBlock(nn.Module):
                           kernel_size=(kernel_size, 1)), name='weight', dim=0)
             # TODO(hirofumi0810): padding?
             layers['dropout'] = nn.Dropout(p=dropout)
-            layers['glu'] = nn.GLU()
+            layers['glu'] = nn.GLU(dim=1)
 
         elif bottlececk_dim > 0:
             layers['conv_in'] = nn.utils.weight_norm(
@@ -71,23 +74,26 @@ class ConvGLUBlock(nn.Module):
             layers['dropout_in'] = nn.Dropout(p=dropout)
             layers['conv_bottleneck'] = nn.utils.weight_norm(
                 nn.Conv2d(in_channels=bottlececk_dim,
-                          out_channels=bottlececk_dim,
+                          out_channels=bottlececk_dim * 2,
                           kernel_size=(kernel_size, 1)), name='weight', dim=0)
             layers['dropout'] = nn.Dropout(p=dropout)
-            layers['glu'] = nn.GLU()
+            layers['glu'] = nn.GLU(dim=1)
             layers['conv_out'] = nn.utils.weight_norm(
                 nn.Conv2d(in_channels=bottlececk_dim,
-                          out_channels=out_ch * 2,
+                          out_channels=out_ch,
                           kernel_size=(1, 1)), name='weight', dim=0)
             layers['dropout_out'] = nn.Dropout(p=dropout)
 
         self.layers = nn.Sequential(layers)
 
-    def forward(self, xs):
+    def forward(self, xs, cache=None):
         """Forward computation.
 
         Args:
             xs (FloatTensor): `[B, in_ch, T, feat_dim]`
+            cache (FloatTensor): `[B, in_ch, kernel_size-1, feat_dim]`,
+                inputs at the previous time steps used as the left context
+                for incremental decoding. Zero padding is used if None.
         Returns:
             out (FloatTensor): `[B, out_ch, T, feat_dim]`
 
@@ -95,7 +101,10 @@ class ConvGLUBlock(nn.Module):
         residual = xs
         if self.conv_residual is not None:
             residual = self.dropout_residual(self.conv_residual(residual))
-        xs = self.pad_left(xs)  # `[B, embed_dim, T+kernel-1, 1]`
-        xs = self.layers(xs)  # `[B, out_ch * 2, T ,1]`
+        if cache is None:
+            xs = self.pad_left(xs)  # `[B, embed_dim, T+kernel-1, 1]`
+        else:
+            xs = torch.cat([cache, xs], dim=2)  # `[B, embed_dim, T+kernel-1, 1]`
+        xs = self.layers(xs)  # `[B, out_ch, T ,1]`
         xs = xs + residual
         return xs
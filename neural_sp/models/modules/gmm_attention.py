@@ -67,20 +67,18 @@ class GMMAttention(nn.Module):
         else:
             myu_prev = self.myu
 
-        self.mask = mask
-        if self.mask is None:
-            assert self.mask.size() == (bs, 1, klen), (self.mask.size(), (bs, 1, klen))
+        if self.mask is None or not cache:
+            self.mask = mask
+            if self.mask is not None:
+                assert self.mask.size() == (bs, 1, klen), (self.mask.size(), (bs, 1, klen))
 
         w = torch.softmax(self.ffn_gamma(query), dim=-1)  # `[B, 1, n_mix]`
         v = torch.exp(self.ffn_beta(query))  # `[B, 1, n_mix]`
         myu = torch.exp(self.ffn_kappa(query)) + myu_prev  # `[B, 1, n_mix]`
         self.myu = myu  # register for the next step
 
-        # Compute attention weights
-        js = torch.arange(klen).unsqueeze(0).unsqueeze(2).repeat([bs, 1, self.n_mix]).float()
-        device_id = torch.cuda.device_of(next(self.parameters())).idx
-        if device_id >= 0:
-            js = js.cuda(device_id).float()
+        # Compute attention weights (frame indices are broadcast over batch and mixtures)
+        js = torch.arange(klen, dtype=myu.dtype, device=myu.device).view(1, klen, 1)
         numerator = torch.exp(-torch.pow(js - myu, 2) / (2 * v + self.vfloor))
         denominator = torch.pow(2 * math.pi * v + self.vfloor, 0.5)
         aw = w * numerator / denominator  # `[B, klen, n_mix]`
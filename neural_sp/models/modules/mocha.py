@@ -129,6 +129,10 @@ class MonotonicEnergy(nn.Module):
                 assert self.mask.size() == (bs, self.n_heads, qlen, klen), \
                     (self.mask.size(), (bs, self.n_heads, qlen, klen))
 
+        # for batch beam search decoding (share the cached key across hypotheses without copies)
+        if self.key.size(0) != bs:
+            self.key = self.key[0: 1].expand(bs, -1, -1, -1)
+
         query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)
         query = query.transpose(2, 1).contiguous()  # `[B, H_ma, qlen, d_k]`
         m = self.mask
@@ -236,6 +240,10 @@ class ChunkEnergy(nn.Module):
                 assert self.mask.size() == (bs, self.n_heads, qlen, klen), \
                     (self.mask.size(), (bs, self.n_heads, qlen, klen))
 
+        # for batch beam search decoding (share the cached key across hypotheses without copies)
+        if self.key.size(0) != bs:
+            self.key = self.key[0: 1].expand(bs, -1, -1, -1)
+
         query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)
         query = query.transpose(2, 1).contiguous()  # `[B, H_ca, qlen, d_k]`
         m = self.mask
@@ -359,6 +367,7 @@ class MoChA(nn.Module):
         self.dropout_head = dropout_head
 
         self.bd_offset = 0
+        self.value = None
 
     def reset_parameters(self, bias):
         """Initialize parameters with Xavier uniform distribution."""
@@ -378,6 +387,7 @@ class MoChA(nn.Module):
         if self.chunk_energy is not None:
             self.chunk_energy.reset()
         self.bd_offset = 0
+        self.value = None
 
     def forward(self, key, value, query, mask=None, aw_prev=None,
                 mode='hard', cache=False, trigger_point=None,
@@ -409,6 +419,11 @@ class MoChA(nn.Module):
             aw_prev = key.new_zeros(bs, self.n_heads_ma, 1, klen)
             aw_prev[:, :, :, 0:1] = key.new_ones(bs, self.n_heads_ma, 1, 1)
 
+        # Pre-computation of encoder-side features for computing context vectors
+        if self.n_heads_ma * self.n_heads_ca > 1 and (self.value is None or not cache):
+            self.value = self.w_value(value).view(value.size(0), -1, self.n_heads_ma * self.n_heads_ca, self.d_k)
+            self.value = self.value.transpose(2, 1).contiguous()  # `[B, H_ma * H_ca, klen, d_k]`
+
         # Compute monotonic energy
         e_ma = self.monotonic_energy(key, query, mask, cache=cache,
                                      boundary_leftmost=self.bd_offset)  # `[B, H_ma, qlen, klen]`
@@ -522,6 +537,7 @@ class MoChA(nn.Module):
 
         # Compute chunk energy
         beta = None
+        value_range = (0, klen)
         if self.chunk_energy is not None:
             bd_leftmost = 0
             bd_rightmost = klen - 1 - self.bd_offset
@@ -557,7 +573,8 @@ class MoChA(nn.Module):
             beta = self.dropout_attn(beta)  # `[B, H_ma * H_ca, qlen, klen]`
 
             if efficient_decoding and mode == 'hard':
-                value = value[:, max(0, self.bd_offset + bd_leftmost - self.w + 1):self.bd_offset + bd_rightmost + 1]
+                value_range = (max(0, self.bd_offset + bd_leftmost - self.w + 1), self.bd_offset + bd_rightmost + 1)
+                value = value[:, value_range[0]:value_range[1]]
 
         # Update after calculating beta
         bd_offset_old = self.bd_offset
@@ -566,8 +583,10 @@ class MoChA(nn.Module):
 
         # Compute context vector
         if self.n_heads_ma * self.n_heads_ca > 1:
-            value = self.w_value(value).view(bs, -1, self.n_heads_ma * self.n_heads_ca, self.d_k)
-            value = value.transpose(2, 1).contiguous()  # `[B, H_ma * H_ca, klen, d_k]`
+            value = self.value[:, :, value_range[0]:value_range[1]]  # `[B, H_ma * H_ca, klen, d_k]`
+            if value.size(0) != bs:
+                # for batch beam search decoding (share the cached value across hypotheses without copies)
+                value = value[0: 1].expand(bs, -1, -1, -1)
             cv = torch.matmul(alpha if self.w == 1 else beta, value)  # `[B, H_ma * H_ca, qlen, d_k]`
             cv = cv.transpose(2, 1).contiguous().view(bs, -1, self.n_heads_ma * self.n_heads_ca * self.d_k)
             cv = self.w_out(cv)  # `[B, qlen, adim]`
@@ -126,6 +126,11 @@ class MultiheadAttentionMechanism(nn.Module):
                 assert self.mask.size() == (bs, qlen, klen, self.n_heads), \
                     (self.mask.size(), (bs, qlen, klen, self.n_heads))
 
+        # for batch beam search decoding (share the cached key/value across hypotheses without copies)
+        if self.key.size(0) != bs:
+            self.key = self.key[0: 1].expand(bs, -1, -1, -1)
+            self.value = self.value[0: 1].expand(bs, -1, -1, -1)
+
         query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)  # `[B, qlen, H, d_k]`
 
         if self.atype == 'scaled_dot':
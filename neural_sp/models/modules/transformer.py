@@ -174,7 +174,7 @@ class TransformerDecoderBlock(nn.Module):
             yy_mask (ByteTensor): `[B, L (query), L (key)]`
             xs (FloatTensor): encoder outputs. `[B, T, d_model]`
             xy_mask (ByteTensor): `[B, L, T]`
-            cache (FloatTensor): `[B, L-1, d_model]`
+            cache (FloatTensor): `[B, L', d_model]` (L' < L)
             xy_aws_prev (FloatTensor): `[B, H, L, T]`
             mode (str): decoding mode for MMA
             eps_wait (int): wait time delay for head-synchronous decoding in MMA
@@ -198,9 +198,10 @@ class TransformerDecoderBlock(nn.Module):
         ys = self.norm1(ys)
 
         if cache is not None:
-            ys_q = ys[:, -1:]
-            residual = residual[:, -1:]
-            yy_mask = yy_mask[:, -1:]
+            # NOTE: only positions after the cache are computed
+            ys_q = ys[:, cache.size(1):]
+            residual = residual[:, cache.size(1):]
+            yy_mask = yy_mask[:, cache.size(1):]
         else:
             ys_q = ys
 
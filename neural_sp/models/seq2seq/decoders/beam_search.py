@@ -7,11 +7,12 @@
 """Utility funcitons for beam search decoding."""
 
 # import logging
-# import math
-# import numpy as np
+import math
+import numpy as np
 # import os
 # import random
 # import shutil
+import time
 import torch
 # import torch.nn as nn
 
@@ -19,7 +20,8 @@ from neural_sp.models.torch_utils import tensor2np
 
 
 class BeamSearch(object):
-    def __init__(self, beam_width, eos, ctc_weight, device_id, beam_width_bwd=0):
+    def __init__(self, beam_width, eos, ctc_weight, device_id, beam_width_bwd=0,
+                 score_margin=0., time_budget=0.):
 
         super(BeamSearch, self).__init__()
 
@@ -31,6 +33,11 @@ class BeamSearch(object):
         self.ctc_weight = ctc_weight
         # self.lm_weight = lm_weight
 
+        self.score_margin = score_margin
+        self.time_budget = time_budget
+        self.start_time = time.time()
+        self.n_active_hyps = []  # number of active hypotheses at each step
+
     def remove_complete_hyp(self, hyps_sorted, end_hyps, prune=True, backward=False):
         new_hyps = []
         is_finish = False
@@ -68,3 +75,63 @@ class BeamSearch(object):
 
     def add_lm_score(self):
         raise NotImplementedError
+
+    def prune_by_score_margin(self, hyps_sorted):
+        """Remove hypotheses whose scores are lower than the best one by more than the margin.
+
+        Args:
+            hyps_sorted (list): hypotheses sorted by scores in descending order
+        Returns:
+            hyps_sorted (list): pruned hypotheses
+
+        """
+        if self.score_margin <= 0 or len(hyps_sorted) == 0:
+            return hyps_sorted
+        score_threshold = hyps_sorted[0]['score'] - self.score_margin
+        return [hyp for hyp in hyps_sorted if hyp['score'] >= score_threshold]
+
+    def end_detect(self, end_hyps, t, M=3, D_end=np.log(1 * np.exp(-10))):
+        """End detection (see Eq. (50) in S. Watanabe et al., 2017).
+
+        Decoding is terminated when the best hypotheses ended in the last `M` steps
+        are all much worse than the best ended hypothesis.
+
+        Args:
+            end_hyps (list): ended hypotheses
+            t (int): current decoding step
+            M (int): number of steps to look back
+            D_end (float): score threshold
+        Returns:
+            (bool): True when no ended hypothesis can beat the best one anymore
+
+        """
+        if len(end_hyps) == 0:
+            return False
+        score_best = max([hyp['score'] for hyp in end_hyps])
+        count = 0
+        for m in range(M):
+            scores_m = [hyp['score'] for hyp in end_hyps if len(hyp['hyp']) == t - m]
+            if len(scores_m) > 0 and max(scores_m) - score_best < D_end:
+                count += 1
+        return count == M
+
+    def is_timeout(self):
+        """Check if the time budget for the current utterance is exhausted."""
+        return self.time_budget > 0 and time.time() - self.start_time > self.time_budget
+
+    @staticmethod
+    def max_len_ctc(ctc_log_probs, blank, ratio):
+        """Estimate the maximum output length from the CTC greedy output.
+
+        Args:
+            ctc_log_probs (np.ndarray): `[T, vocab]`
+            blank (int): index for <blank>
+            ratio (float): ratio to the number of tokens in the CTC greedy output
+        Returns:
+            (int): maximum number of decoding steps including <eos>
+
+        """
+        best_path = ctc_log_probs.argmax(-1)
+        best_path = best_path[np.insert(best_path[1:] != best_path[:-1], 0, True)]  # collapse repeats
+        n_tokens = int((best_path != blank).sum())
+        return int(math.ceil(n_tokens * ratio)) + 1
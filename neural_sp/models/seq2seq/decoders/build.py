@@ -78,7 +78,8 @@ def build_decoder(args, special_symbols, enc_n_units, vocab,
             external_lm=external_lm if args.lm_init else None,
             global_weight=global_weight,
             mtl_per_batch=args.mtl_per_batch,
-            param_init=args.param_init)
+            param_init=args.param_init,
+            joint_chunk_size=getattr(args, 'transducer_joint_chunk_size', 0))
 
     else:
         from neural_sp.models.seq2seq.decoders.las import RNNDecoder
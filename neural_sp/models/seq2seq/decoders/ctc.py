@@ -187,7 +187,7 @@ class CTC(DecoderBase):
             eouts (FloatTensor): `[B, T, enc_n_units]`
             elens (np.ndarray): `[B]`
         Returns:
-            hyps (np.ndarray): Best path hypothesis. `[B, L]`
+            hyps (list): Best path hypotheses of length `[B]`, which contains arrays of size `[L]`
 
         """
         log_probs = torch.log_softmax(self.output(eouts), dim=-1)
@@ -204,7 +204,127 @@ class CTC(DecoderBase):
             best_hyp = [x for x in filter(lambda x: x != self.blank, collapsed_indices)]
             hyps.append(np.array(best_hyp))
 
-        return np.array(hyps)
+        return hyps
+
+    def initial_beam(self):
+        """Initialize the beam with the empty sequence.
+
+        Elements in the beam are prefixes with (p_b, p_nb), i.e., log-probabilities
+        of ending in blank and non-blank. The empty sequence has a probability of
+        1 for ending in blank and zero for ending in non-blank (in log space).
+
+        Returns:
+            beam (list): hypotheses
+
+        """
+        return [{'hyp': [self.eos],  # <eos> is used for LM
+                 'score': LOG_1,
+                 'p_b': LOG_1,
+                 'p_nb': LOG_0,
+                 'score_ctc': LOG_1,
+                 'score_lm': LOG_1,
+                 'score_lp': LOG_1,
+                 'lmstate': None}]
+
+    def beam_search_chunk(self, log_probs, beam, params, lm=None):
+        """Frame-synchronous prefix beam search over new frames.
+
+        The beam (including CTC prefix probabilities and LM states) is carried
+        over from the previous frames, so that decoding a stream chunk by chunk
+        gives the same result as decoding it at once.
+
+        Args:
+            log_probs (FloatTensor): `[T, vocab]`
+            beam (list): hypotheses after the previous frames
+            params (dict):
+                recog_beam_width (int): size of beam
+                recog_length_penalty (float): length penalty
+                recog_lm_weight (float): weight of first path LM score
+            lm: first path LM
+        Returns:
+            beam (list): hypotheses after the new frames
+
+        """
+        beam_width = params['recog_beam_width']
+        lp_weight = params['recog_length_penalty']
+        lm_weight = params['recog_lm_weight']
+
+        for t in range(log_probs.size(0)):
+            new_beam = []
+
+            # Pick up the top-k scores
+            _, topk_ids = torch.topk(log_probs[t:t + 1], k=min(beam_width, self.vocab),
+                                     dim=-1, largest=True, sorted=True)
+            log_probs_t = tensor2np(log_probs[t]).astype(np.float64)
+
+            for i_beam in range(len(beam)):
+                hyp = beam[i_beam]['hyp'][:]
+                p_b = beam[i_beam]['p_b']
+                p_nb = beam[i_beam]['p_nb']
+                score_lm = beam[i_beam]['score_lm']
+
+                # case 1. hyp is not extended
+                new_p_b = np.logaddexp(p_b + log_probs_t[self.blank],
+                                       p_nb + log_probs_t[self.blank])
+                if len(hyp) > 1:
+                    new_p_nb = p_nb + log_probs_t[hyp[-1]]
+                else:
+                    new_p_nb = LOG_0
+                score_ctc = np.logaddexp(new_p_b, new_p_nb)
+                score_lp = len(hyp[1:]) * lp_weight
+                new_beam.append({'hyp': hyp,
+                                 'score': score_ctc + score_lm + score_lp,
+                                 'p_b': new_p_b,
+                                 'p_nb': new_p_nb,
+                                 'score_ctc': score_ctc,
+                                 'score_lm': score_lm,
+                                 'score_lp': score_lp,
+                                 'lmstate': beam[i_beam]['lmstate']})
+
+                # Update LM states for shallow fusion
+                if lm is not None:
+                    _, lmstate, lm_log_probs = lm.predict(
+                        log_probs.new_zeros(1, 1).fill_(hyp[-1]).long(), beam[i_beam]['lmstate'])
+                else:
+                    lmstate = None
+
+                # case 2. hyp is extended
+                new_p_b = LOG_0
+                for c in tensor2np(topk_ids)[0]:
+                    p_t = log_probs_t[c]
+
+                    if c == self.blank:
+                        continue
+
+                    c_prev = hyp[-1] if len(hyp) > 1 else None
+                    if c == c_prev:
+                        new_p_nb = p_b + p_t
+                        # TODO(hirofumi): apply character LM here
+                    else:
+                        new_p_nb = np.logaddexp(p_b + p_t, p_nb + p_t)
+                        # TODO(hirofumi): apply character LM here
+                        if c == self.space:
+                            pass
+                            # TODO(hirofumi): apply word LM here
+
+                    score_ctc = np.logaddexp(new_p_b, new_p_nb)
+                    score_lp = (len(hyp[1:]) + 1) * lp_weight
+                    score_lm_c = score_lm
+                    if lm_weight > 0 and lm is not None:
+                        score_lm_c += lm_log_probs[0, 0, c].item() * lm_weight
+                    new_beam.append({'hyp': hyp + [c],
+                                     'score': score_ctc + score_lm_c + score_lp,
+                                     'p_b': new_p_b,
+                                     'p_nb': new_p_nb,
+                                     'score_ctc': score_ctc,
+                                     'score_lm': score_lm_c,
+                                     'score_lp': score_lp,
+                                     'lmstate': lmstate})
+
+            # Pruning
+            beam = sorted(new_beam, key=lambda x: x['score'], reverse=True)[:beam_width]
+
+        return beam
 
     def beam_search(self, eouts, elens, params, idx2token,
                     lm=None, lm_second=None, lm_second_rev=None,
@@ -234,7 +354,6 @@ class CTC(DecoderBase):
         """
         bs = eouts.size(0)
 
-        beam_width = params['recog_beam_width']
         lp_weight = params['recog_length_penalty']
         lm_weight = params['recog_lm_weight']
         lm_weight_second = params['recog_lm_second_weight']
@@ -249,88 +368,7 @@ class CTC(DecoderBase):
         best_hyps = []
         log_probs = torch.log_softmax(self.output(eouts), dim=-1)
         for b in range(bs):
-            # Elements in the beam are (prefix, (p_b, p_no_blank))
-            # Initialize the beam with the empty sequence, a probability of
-            # 1 for ending in blank and zero for ending in non-blank (in log space).
-            beam = [{'hyp': [self.eos],  # <eos> is used for LM
-                     'p_b': LOG_1,
-                     'p_nb': LOG_0,
-                     'score_lm': LOG_1,
-                     'lmstate': None}]
-
-            for t in range(elens[b]):
-                new_beam = []
-
-                # Pick up the top-k scores
-                log_probs_topk, topk_ids = torch.topk(
-                    log_probs[b:b + 1, t], k=min(beam_width, self.vocab), dim=-1, largest=True, sorted=True)
-
-                for i_beam in range(len(beam)):
-                    hyp = beam[i_beam]['hyp'][:]
-                    p_b = beam[i_beam]['p_b']
-                    p_nb = beam[i_beam]['p_nb']
-                    score_lm = beam[i_beam]['score_lm']
-
-                    # case 1. hyp is not extended
-                    new_p_b = np.logaddexp(p_b + log_probs[b, t, self.blank].item(),
-                                           p_nb + log_probs[b, t, self.blank].item())
-                    if len(hyp) > 1:
-                        new_p_nb = p_nb + log_probs[b, t, hyp[-1]].item()
-                    else:
-                        new_p_nb = LOG_0
-                    score_ctc = np.logaddexp(new_p_b, new_p_nb)
-                    score_lp = len(hyp[1:]) * lp_weight
-                    new_beam.append({'hyp': hyp,
-                                     'score': score_ctc + score_lm + score_lp,
-                                     'p_b': new_p_b,
-                                     'p_nb': new_p_nb,
-                                     'score_ctc': score_ctc,
-                                     'score_lm': score_lm,
-                                     'score_lp': score_lp,
-                                     'lmstate': beam[i_beam]['lmstate']})
-
-                    # Update LM states for shallow fusion
-                    if lm is not None:
-                        _, lmstate, lm_log_probs = lm.predict(
-                            eouts.new_zeros(1, 1).fill_(hyp[-1]), beam[i_beam]['lmstate'])
-                    else:
-                        lmstate = None
-
-                    # case 2. hyp is extended
-                    new_p_b = LOG_0
-                    for c in tensor2np(topk_ids)[0]:
-                        p_t = log_probs[b, t, c].item()
-
-                        if c == self.blank:
-                            continue
-
-                        c_prev = hyp[-1] if len(hyp) > 1 else None
-                        if c == c_prev:
-                            new_p_nb = p_b + p_t
-                            # TODO(hirofumi): apply character LM here
-                        else:
-                            new_p_nb = np.logaddexp(p_b + p_t, p_nb + p_t)
-                            # TODO(hirofumi): apply character LM here
-                            if c == self.space:
-                                pass
-                                # TODO(hirofumi): apply word LM here
-
-                        score_ctc = np.logaddexp(new_p_b, new_p_nb)
-                        score_lp = (len(hyp[1:]) + 1) * lp_weight
-                        if lm_weight > 0 and lm is not None:
-                            local_score_lm = lm_log_probs[0, 0, c].item() * lm_weight
-                            score_lm += local_score_lm
-                        new_beam.append({'hyp': hyp + [c],
-                                         'score': score_ctc + score_lm + score_lp,
-                                         'p_b': new_p_b,
-                                         'p_nb': new_p_nb,
-                                         'score_ctc': score_ctc,
-                                         'score_lm': score_lm,
-                                         'score_lp': score_lp,
-                                         'lmstate': lmstate})
-
-                # Pruning
-                beam = sorted(new_beam, key=lambda x: x['score'], reverse=True)[:beam_width]
+            beam = self.beam_search_chunk(log_probs[b, :elens[b]], self.initial_beam(), params, lm)
 
             # Rescoing lattice
             if lm_second is not None:
@@ -370,7 +408,7 @@ class CTC(DecoderBase):
                                     (beam[k]['score_lm_second'] * lm_weight_second))
                     logger.info('-' * 50)
 
-        return np.array(best_hyps)
+        return best_hyps
 
 
 def _label_to_path(labels, blank):
@@ -13,8 +13,8 @@ import torch
 import shutil
 
 from neural_sp.models.base import ModelBase
-from neural_sp.models.torch_utils import np2tensor
-from neural_sp.models.torch_utils import pad_list
+from neural_sp.models.lm.lm_state_cache import LMStateCache
+from neural_sp.models.lm.nbest_rescoring import score_nbest
 from neural_sp.utils import mkdir_join
 
 import matplotlib
@@ -22,6 +22,8 @@ matplotlib.use('Agg')
 
 logger = logging.getLogger(__name__)
 
+CARRY_OVER_STATES = ['dstates_final', 'lmstate_final', 'lmmemory']
+
 
 class DecoderBase(ModelBase):
     """Base class for decoders."""
@@ -32,6 +34,10 @@ class DecoderBase(ModelBase):
 
         logger.info('Overriding DecoderBase class.')
 
+        self.lm_state_cache = None
+        self.session_states = {}
+        self.reset_beam_stats()
+
     @property
     def device_id(self):
         return torch.cuda.device_of(next(self.parameters()).data).idx
@@ -42,12 +48,83 @@ class DecoderBase(ModelBase):
     def reset_session(self):
         self.new_session = True
 
+    def reset_carry_over(self):
+        """Reset ASR/LM states carried over from the previous utterance of the same session."""
+        self.prev_spk = ''
+        self.dstates_final = None
+        self.lmstate_final = None
+        self.lmmemory = None
+        self.session_states = {}
+
+    def switch_session(self, speaker):
+        """Swap ASR/LM states carried over in the current session for those of another session.
+
+        States of the current session are stashed until its next utterance so that
+        utterances of interleaved sessions (e.g., one session per row of mini-batches)
+        are decoded with their own carried-over states.
+
+        Args:
+            speaker (str): speaker (session) of the next utterance
+
+        """
+        if self.prev_spk != '':
+            self.session_states[self.prev_spk] = {k: getattr(self, k, None) for k in CARRY_OVER_STATES}
+        states = self.session_states.pop(speaker, {})
+        for k in CARRY_OVER_STATES:
+            setattr(self, k, states.get(k, None))
+        self.prev_spk = speaker
+
+    def drop_finished_sessions(self, speakers):
+        """Discard stashed states of sessions that do not appear in the current mini-batch.
+
+        Args:
+            speakers (list): speakers (sessions) in the current mini-batch
+
+        """
+        self.session_states = {k: v for k, v in self.session_states.items() if k in speakers}
+
     def greedy(self, eouts, elens, max_len_ratio):
         raise NotImplementedError
 
     def beam_search(self, eouts, elens, params, idx2token):
         raise NotImplementedError
 
+    def reset_beam_stats(self):
+        """Reset statistics of the number of active hypotheses and LM state cache hits in beam search."""
+        self.beam_stats = {'n_utts': 0, 'n_steps': 0, 'n_active_hyps': 0,
+                           'max_active_hyps': 0, 'n_timeout': 0}
+        if self.lm_state_cache is not None:
+            self.lm_state_cache.reset_stats()
+
+    def update_beam_stats(self, helper, timeout=False):
+        """Accumulate statistics of the number of active hypotheses per utterance.
+
+        Args:
+            helper (BeamSearch): beam search helper used for the utterance
+            timeout (bool): decoding was terminated by the time budget
+
+        """
+        self.beam_stats['n_utts'] += 1
+        self.beam_stats['n_steps'] += len(helper.n_active_hyps)
+        self.beam_stats['n_active_hyps'] += sum(helper.n_active_hyps)
+        self.beam_stats['max_active_hyps'] = max([self.beam_stats['max_active_hyps']] + helper.n_active_hyps)
+        self.beam_stats['n_timeout'] += int(timeout)
+
+    def get_lm_state_cache(self, capacity):
+        """Get the prefix-keyed LM state cache shared across utterances.
+
+        Args:
+            capacity (int): maximum number of prefixes to keep (0 disables the cache)
+        Returns:
+            lm_state_cache (LMStateCache): None if disabled
+
+        """
+        if capacity <= 0:
+            return None
+        if self.lm_state_cache is None or self.lm_state_cache.capacity != capacity:
+            self.lm_state_cache = LMStateCache(capacity)
+        return self.lm_state_cache
+
     def _plot_attention(self, save_path, n_cols=2):
         """Plot attention for each head in all decoder layers."""
         if getattr(self, 'att_weight', 0) == 0:
@@ -203,18 +280,21 @@ class DecoderBase(ModelBase):
         return probs, topk_ids
 
     def lm_rescoring(self, hyps, lm, lm_weight, reverse=False, tag=''):
-        for i in range(len(hyps)):
-            ys = hyps[i]['hyp']  # include <sos>
-            if reverse:
-                ys = ys[::-1]
+        """Rescore complete hypotheses with an external LM.
 
-            ys = [np2tensor(np.fromiter(ys, dtype=np.int64), self.device_id)]
-            ys_in = pad_list([y[:-1] for y in ys], -1)  # `[1, L-1]`
-            ys_out = pad_list([y[1:] for y in ys], -1)  # `[1, L-1]`
+        All hypotheses are scored together in a single batched forward pass.
 
-            lmout, lmstate, scores_lm = lm.predict(ys_in, None)
-            score_lm = sum([scores_lm[0, t, ys_out[0, t]] for t in range(ys_out.size(1))])
-            score_lm /= ys_out.size(1)
+        Args:
+            hyps (list): hypotheses, each of which contains `hyp` including <sos>.
+                `score` and `score_lm_[tag]` are updated in place.
+            lm (LMBase): language model
+            lm_weight (float): weight for the LM score
+            reverse (bool): score hypotheses in the reverse order with a backward LM
+            tag (str): suffix of the key to store the LM score
 
+        """
+        scores_lm = score_nbest(lm, [h['hyp'] for h in hyps], reverse=reverse)
+        for i in range(len(hyps)):
+            score_lm = scores_lm[i].item()
             hyps[i]['score'] += score_lm * lm_weight
             hyps[i]['score_lm_' + tag] = score_lm
@@ -17,8 +17,12 @@ import torch.nn as nn
 from neural_sp.evaluators.edit_distance import compute_wer
 from neural_sp.models.criterion import cross_entropy_lsm
 from neural_sp.models.criterion import distillation
+from neural_sp.models.criterion import distillation_topk
 from neural_sp.models.criterion import MBR
 # from neural_sp.models.criterion import minimum_bayes_risk
+from neural_sp.models.lm.gated_convlm import GatedConvLM
+from neural_sp.models.lm.lm_state_cache import concat_state
+from neural_sp.models.lm.ngram import NgramLM
 from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.lm.transformerlm import TransformerLM
 from neural_sp.models.lm.transformer_xl import TransformerXL
@@ -387,7 +391,8 @@ class RNNDecoder(DecoderBase):
             elens (IntTensor): `[B]`
             ys (list): length `B`, each of which contains a list of size `[L]`
             task (str): all/ys*/ys_sub*
-            teacher_logits (FloatTensor): `[B, L, vocab]`
+            teacher_logits (FloatTensor or tuple): `[B, L, vocab]`,
+                or top-k token IDs and log-probabilities loaded from TeacherStore
             recog_params (dict): parameters for MBR training
             idx2token ():
         Returns:
@@ -576,7 +581,8 @@ class RNNDecoder(DecoderBase):
             elens (IntTensor): `[B]`
             ys (list): length `B`, each of which contains a list of size `[L]`
             return_logits (bool): return logits for knowledge distillation
-            teacher_logits (FloatTensor): `[B, L, vocab]`
+            teacher_logits (FloatTensor or tuple): `[B, L, vocab]`,
+                or top-k token IDs and log-probabilities (`[B, L, topk]` each)
             trigger_points (IntTensor): `[B, T]`
         Returns:
             loss (FloatTensor): `[1]`
@@ -720,7 +726,11 @@ class RNNDecoder(DecoderBase):
             loss_latency = loss_latency.sum() / ylens.sum()
 
         # Knowledge distillation
-        if teacher_logits is not None:
+        if isinstance(teacher_logits, tuple):
+            # sparse teacher distributions dumped offline
+            kl_loss = distillation_topk(logits, teacher_logits[0], teacher_logits[1], ylens)
+            loss = loss * (1 - self.distillation_weight) + kl_loss * self.distillation_weight
+        elif teacher_logits is not None:
             kl_loss = distillation(logits, teacher_logits, ylens, temperature=5.0)
             loss = loss * (1 - self.distillation_weight) + kl_loss * self.distillation_weight
 
@@ -985,6 +995,7 @@ class RNNDecoder(DecoderBase):
         Returns:
             nbest_hyps_idx (list): length `B`, each of which contains list of N hypotheses
             aws (list): length `B`, each of which contains arrays of size `[H, L, T]`
+                (None unless `recog_store_attention` is set)
             scores (list):
 
         """
@@ -1008,6 +1019,14 @@ class RNNDecoder(DecoderBase):
         asr_state_CO = params['recog_asr_state_carry_over']
         lm_state_CO = params['recog_lm_state_carry_over']
         softmax_smoothing = params['recog_softmax_smoothing']
+        store_aws = params['recog_store_attention']
+        beam_margin = params['recog_beam_margin']
+        end_detect = params['recog_end_detect']
+        ctc_max_len_ratio = params['recog_ctc_max_len_ratio']
+        time_budget = params['recog_time_budget']
+        lm_cache_size = params['recog_lm_state_cache_size']
+        lm_cand = params['recog_lm_n_cands'] > 0 and lm is not None and lm.restricted_scoring and self.lm is None
+        # NOTE: LM scores are added after top-K selection, so the top-K candidates are scored
 
         if lm is not None:
             assert lm_weight > 0
@@ -1019,6 +1038,8 @@ class RNNDecoder(DecoderBase):
             assert lm_weight_second_bwd > 0
             lm_second_bwd.eval()
         trfm_lm = isinstance(lm, TransformerLM) or isinstance(lm, TransformerXL)
+        rnn_lm = isinstance(lm, RNNLM) or isinstance(lm, NgramLM)  # states in the dict format
+        lm_state_cache = self.get_lm_state_cache(lm_cache_size) if lm is not None else None
 
         if ctc_log_probs is not None:
             assert ctc_weight > 0
@@ -1032,6 +1053,9 @@ class RNNDecoder(DecoderBase):
             dstates = self.zero_state(1)
             lmstate = None
             ys = eouts.new_zeros(1, 1).fill_(self.eos).long()  # for TransformerLM/TransformerXL
+            eouts_b = eouts[b:b + 1, :elens[b]]
+            # NOTE: encoder-side projections are cached in the attention layer at the first step
+            # and shared by all hypotheses as expanded views
 
             # For joint CTC-Attention decoding
             ctc_prefix_scorer = None
@@ -1048,31 +1072,33 @@ class RNNDecoder(DecoderBase):
                     ensmbl_dstate += [dec.zero_state(1)]
                     ensmbl_cv += [eouts.new_zeros(1, 1, dec.enc_n_units)]
                     dec.score.reset()
+                ensmbl_eouts_b = [ensmbl_eouts[i_e][b:b + 1, :ensmbl_elens[i_e][b]]
+                                  for i_e in range(n_models - 1)]
 
             if speakers is not None:
-                if speakers[b] == self.prev_spk:
-                    if asr_state_CO:
-                        dstates = self.dstates_final
-                    if lm_state_CO:
-                        if isinstance(lm, RNNLM):
-                            lmstate = self.lmstate_final
-                        elif isinstance(lm, TransformerLM):
-                            ys_prev = self.lmstate_final
-                            # Re-encode past tokens here
-                            _, lmstate, _ = lm.predict(ys_prev)
-                            ys = torch.cat([ys_prev, ys], dim=1)
-                        # elif isinstance(lm, TransformerXL):
-                        #     ys_prev = self.lmstate_final
-                        #     # Re-encode past tokens here
-                        #     _, lmstate, _ = lm.predict(ys_prev, mems=self.lmmemory)
-                        #     ys = torch.cat([ys_prev, ys], dim=1)
-                else:
-                    self.dstates_final = None  # reset
-                    self.lmstate_final = None  # reset
-                    self.lmmemory = None  # reset
-                self.prev_spk = speakers[b]
-
-            helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device_id)
+                if speakers[b] != self.prev_spk:
+                    # restore states of the session (None for a new session)
+                    self.switch_session(speakers[b])
+                if asr_state_CO and self.dstates_final is not None:
+                    dstates = self.dstates_final
+                if lm_state_CO and self.lmstate_final is not None:
+                    if rnn_lm:
+                        lmstate = self.lmstate_final
+                    elif isinstance(lm, TransformerLM):
+                        ys_prev = self.lmstate_final
+                        # Re-encode past tokens here
+                        _, lmstate, _ = lm.predict(ys_prev)
+                        ys = torch.cat([ys_prev, ys], dim=1)
+                    # NOTE: TransformerXL attends to self.lmmemory instead of re-encoding past tokens
+            if not (lm_state_CO and speakers is not None):
+                self.lmmemory = None  # memory is shared only within a session
+
+            # LM states are shared by prefixes only when the LM starts from scratch
+            use_lm_cache = lm_state_cache is not None and lmstate is None
+            use_lm_cache = use_lm_cache and self.lmmemory is None and not self.replace_sos
+
+            helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device_id,
+                                score_margin=beam_margin, time_budget=time_budget)
 
             end_hyps = []
             hyps = [{'hyp': [self.eos],
@@ -1081,16 +1107,28 @@ class RNNDecoder(DecoderBase):
                      'score_att': 0.,
                      'score_ctc': 0.,
                      'score_lm': 0.,
+                     'score_cp': 0.,
                      'dstates': dstates,
                      'cv': eouts.new_zeros(1, 1, self.enc_n_units),
+                     'aw': None,
                      'aws': [None],
                      'lmstate': lmstate,
                      'ensmbl_dstate': ensmbl_dstate,
                      'ensmbl_cv': ensmbl_cv,
                      'ensmbl_aws':[[None]] * (n_models - 1),
-                     'ctc_state': ctc_prefix_scorer.initial_state() if ctc_prefix_scorer is not None else None}]
+                     'ctc_state': ctc_prefix_scorer.initial_state() if ctc_prefix_scorer is not None else None,
+                     'myu': None}]
             ymax = math.ceil(elens[b] * max_len_ratio)
+            if ctc_max_len_ratio > 0 and ctc_log_probs is not None:
+                ymax = min(ymax, helper.max_len_ctc(ctc_log_probs[b, :elens[b]], self.blank, ctc_max_len_ratio))
+            timeout = False
             for t in range(ymax):
+                if helper.is_timeout():
+                    logger.info('Beam search is terminated by the time budget at the %d-th step.' % t)
+                    timeout = True
+                    break
+                helper.n_active_hyps.append(len(hyps))
+
                 # batchfy all hypotheses for batch decoding
                 y = eouts.new_zeros(len(hyps), 1).long()
                 for j, beam in enumerate(hyps):
@@ -1100,11 +1138,13 @@ class RNNDecoder(DecoderBase):
                         prev_idx = beam['hyp'][-1]
                     y[j, 0] = prev_idx
                 cv = torch.cat([beam['cv'] for beam in hyps], dim=0)
-                aw = torch.cat([beam['aws'][-1] for beam in hyps], dim=0) if t > 0 else None
+                aw = torch.cat([beam['aw'] for beam in hyps], dim=0) if t > 0 else None
                 hxs = torch.cat([beam['dstates']['dstate'][0] for beam in hyps], dim=1)
                 if self.rnn_type == 'lstm':
                     cxs = torch.cat([beam['dstates']['dstate'][1] for beam in hyps], dim=1)
                 dstates = {'dstate': (hxs, cxs)}
+                if self.attn_type == 'gmm':
+                    self.score.myu = torch.cat([beam['myu'] for beam in hyps], dim=0) if t > 0 else None
 
                 # Update LM states for LM fusion
                 lmout, lmstate, scores_lm = None, None, None
@@ -1117,9 +1157,8 @@ class RNNDecoder(DecoderBase):
                         ys = y
 
                     if t > 0 or (t == 0 and trfm_lm and lm_state_CO and self.lmstate_final is not None):
-                        if isinstance(lm, RNNLM):
-                            lmstate = {'hxs': torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1),
-                                       'cxs': torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)}
+                        if rnn_lm:
+                            lmstate = concat_state([beam['lmstate'] for beam in hyps])
                         elif trfm_lm:
                             if isinstance(lm, TransformerLM):
                                 lmstate = [torch.cat([beam['lmstate'][lth] for beam in hyps], dim=0)
@@ -1127,17 +1166,25 @@ class RNNDecoder(DecoderBase):
                             elif t > 0:
                                 lmstate = [torch.cat([beam['lmstate'][lth] for beam in hyps], dim=0)
                                            for lth in range(lm.n_layers)]
+                        elif isinstance(lm, GatedConvLM):
+                            lmstate = [torch.cat([beam['lmstate'][lth] for beam in hyps], dim=0)
+                                       for lth in range(len(lm.blocks))]
 
                     if self.lm is not None:  # cold/deep fusion
                         lmout, lmstate, scores_lm = self.lm.predict(y, lmstate)
+                    elif use_lm_cache:  # shallow fusion with the prefix-keyed LM state cache
+                        lmout, lmstate, scores_lm = lm_state_cache.predict(
+                            lm, [beam['hyp'] for beam in hyps], ys, lmstate,
+                            cache=lmstate if cache_states else None, skip_output=lm_cand)
                     elif lm is not None:  # shallow fusion
                         lmout, lmstate, scores_lm = lm.predict(ys, lmstate,
                                                                mems=self.lmmemory,
-                                                               cache=lmstate if cache_states else None)
+                                                               cache=lmstate if cache_states else None,
+                                                               skip_output=lm_cand)
 
                 # for the main model
                 dstates, cv, aw, attn_v, _, _ = self.decode_step(
-                    eouts[b:b + 1, :elens[b]].repeat([cv.size(0), 1, 1]),
+                    eouts_b.expand(cv.size(0), -1, -1),
                     dstates, cv, self.dropout_emb(self.embed(y)), None, aw, lmout)
                 probs = torch.softmax(self.output(attn_v).squeeze(1) * softmax_smoothing, dim=1)
 
@@ -1153,19 +1200,26 @@ class RNNDecoder(DecoderBase):
                         dstates_e = {'dstate': (hxs_e, cxs_e)}
 
                         dstate_e, cv_e, aw_e, attn_v_e, _, _ = dec.decode_step(
-                            ensmbl_eouts[i_e][b:b + 1, :ensmbl_elens[i_e][b]].repeat([cv_e.size(0), 1, 1]),
+                            ensmbl_eouts_b[i_e].expand(cv_e.size(0), -1, -1),
                             dstates_e, cv_e, dec.dropout_emb(dec.embed(y)), None, aw_e, lmout)
 
                         ensmbl_dstate += [{'dstate': (beam['dstates'][i_e]['dstate'][0][:, j:j + 1],
                                                       beam['dstates'][i_e]['dstate'][1][:, j:j + 1])}]
                         ensmbl_cv += [cv_e[j:j + 1]]
-                        ensmbl_aws += [beam['ensmbl_aws'][i_e] + [aw_e[j:j + 1]]]
+                        ensmbl_aws += [[aw_e[j:j + 1]]]
                         probs += torch.softmax(dec.output(attn_v_e).squeeze(1), dim=1)
                         # NOTE: sum in the probability scale (not log-scale)
 
                 # Ensemble
                 scores_att = torch.log(probs / n_models)
 
+                # Candidate-restricted LM scoring for the top-K tokens of all hypotheses
+                if lm_cand:
+                    scores_att_prev = scores_att.new_tensor([beam['score_att'] for beam in hyps]).unsqueeze(1)
+                    _, cand_ids = torch.topk((scores_att_prev + scores_att) * (1 - ctc_weight),
+                                             k=beam_width, dim=1, largest=True, sorted=True)
+                    scores_lm = lm.score_candidates(lmout[:, -1], cand_ids)
+
                 new_hyps = []
                 for j, beam in enumerate(hyps):
                     # Attention scores
@@ -1173,10 +1227,17 @@ class RNNDecoder(DecoderBase):
                     total_scores = total_scores_att * (1 - ctc_weight)
 
                     # Add LM score <after> top-K selection
-                    total_scores_topk, topk_ids = torch.topk(
-                        total_scores, k=beam_width, dim=1, largest=True, sorted=True)
+                    if lm_cand:
+                        topk_ids = cand_ids[j:j + 1]
+                        total_scores_topk = total_scores.gather(1, topk_ids)
+                    else:
+                        total_scores_topk, topk_ids = torch.topk(
+                            total_scores, k=beam_width, dim=1, largest=True, sorted=True)
                     if lm is not None:
-                        total_scores_lm = beam['score_lm'] + scores_lm[j, -1, topk_ids[0]]
+                        if lm_cand:
+                            total_scores_lm = beam['score_lm'] + scores_lm[j]
+                        else:
+                            total_scores_lm = beam['score_lm'] + scores_lm[j, -1, topk_ids[0]]
                         total_scores_topk += total_scores_lm * lm_weight
                     else:
                         total_scores_lm = eouts.new_zeros(beam_width)
@@ -1191,21 +1252,21 @@ class RNNDecoder(DecoderBase):
 
                     # Add coverage penalty
                     if cp_weight > 0:
-                        aw_mat = torch.cat(beam['aws'][1:] + [aw[j:j + 1]], dim=2)  # `[B, H, L, T]`
-                        aw_mat = aw_mat[:, 0, :, :]  # `[B, L, T]`
+                        # NOTE: accumulate the coverage of the current step only
+                        # instead of concatenating all past attention weights
+                        aw_mat = aw[j:j + 1, 0]  # `[1, 1 (L), T]`
                         if gnmt_decoding:
                             aw_mat = torch.log(aw_mat.sum(-1))
                             cp = torch.where(aw_mat < 0, aw_mat, aw_mat.new_zeros(aw_mat.size())).sum()
                             # TODO(hirofumi): mask by elens[b]
-                            total_scores_topk += cp * cp_weight
                         else:
-                            # Recompute converage penalty at each step
                             if cp_threshold == 0:
                                 cp = aw_mat.sum() / self.score.n_heads
                             else:
                                 cp = torch.where(aw_mat > cp_threshold, aw_mat,
                                                  aw_mat.new_zeros(aw_mat.size())).sum() / self.score.n_heads
-                            total_scores_topk += cp * cp_weight
+                        cp = beam['score_cp'] + cp
+                        total_scores_topk += cp * cp_weight
                     else:
                         cp = 0.
 
@@ -1233,10 +1294,10 @@ class RNNDecoder(DecoderBase):
 
                         new_lmstate = None
                         if lmstate is not None:
-                            if isinstance(lm, RNNLM):
-                                new_lmstate = {'hxs': lmstate['hxs'][:, j:j + 1],
-                                               'cxs': lmstate['cxs'][:, j:j + 1]}
-                            elif trfm_lm:
+                            if rnn_lm:
+                                new_lmstate = {k: v[:, j:j + 1] if v is not None else None
+                                               for k, v in lmstate.items()}
+                            elif trfm_lm or isinstance(lm, GatedConvLM):
                                 new_lmstate = [lmstate_l[j:j + 1] for lmstate_l in lmstate]
                             else:
                                 raise ValueError(type(lm))
@@ -1254,21 +1315,28 @@ class RNNDecoder(DecoderBase):
                              'dstates': {'dstate': (dstates['dstate'][0][:, j:j + 1],
                                                     dstates['dstate'][1][:, j:j + 1])},
                              'cv': cv[j:j + 1],
-                             'aws': beam['aws'] + [aw[j:j + 1]],
+                             'aw': aw[j:j + 1],
+                             'aws': beam['aws'] + [aw[j:j + 1]] if store_aws else beam['aws'],
                              'lmstate': new_lmstate,
                              'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None,
                              'ensmbl_dstate': ensmbl_dstate,
                              'ensmbl_cv': ensmbl_cv,
-                             'ensmbl_aws': ensmbl_aws})
+                             'ensmbl_aws': ensmbl_aws,
+                             'myu': self.score.myu[j:j + 1] if self.attn_type == 'gmm' else None})
 
                 # Local pruning
                 new_hyps_sorted = sorted(new_hyps, key=lambda x: x['score'], reverse=True)[:beam_width]
+                new_hyps_sorted = helper.prune_by_score_margin(new_hyps_sorted)
 
                 # Remove complete hypotheses
                 new_hyps, end_hyps, is_finish = helper.remove_complete_hyp(new_hyps_sorted, end_hyps)
                 hyps = new_hyps[:]
-                if is_finish:
+                if is_finish or len(hyps) == 0:
                     break
+                if end_detect and helper.end_detect(end_hyps, t):
+                    break
+
+            self.update_beam_stats(helper, timeout)
 
             # Global pruning
             if len(end_hyps) == 0:
@@ -1282,7 +1350,7 @@ class RNNDecoder(DecoderBase):
 
             # backward secodn path LM rescoring
             if lm_second_bwd is not None:
-                self.lm_rescoring(end_hyps, lm_second_bwd, lm_weight_second_bwd, tag='second_bwd')
+                self.lm_rescoring(end_hyps, lm_second_bwd, lm_weight_second_bwd, reverse=True, tag='second_bwd')
 
             # Sort by score
             end_hyps = sorted(end_hyps, key=lambda x: x['score'], reverse=True)
@@ -1309,49 +1377,57 @@ class RNNDecoder(DecoderBase):
                                     (end_hyps[k]['score_lm_second'] * lm_weight_second))
                     if lm_second_bwd is not None:
                         logger.info('log prob (hyp, second-path lm, reverse): %.7f' %
-                                    (end_hyps[k]['score_lm_second_rev'] * lm_weight_second_bwd))
+                                    (end_hyps[k]['score_lm_second_bwd'] * lm_weight_second_bwd))
                     logger.info('-' * 50)
 
+            # Carry over the TransformerXL memory to the next utterance in the same session
+            if isinstance(lm, TransformerXL) and lm_state_CO and speakers is not None:
+                self.lmmemory = lm.update_memory_from_cache(self.lmmemory, end_hyps[0]['ys'],
+                                                            end_hyps[0]['lmstate'])
+                logger.info('LM memory: %d tokens' % self.lmmemory[0].size(1))
+
+            # Store ASR/LM state
+            self.dstates_final = end_hyps[0]['dstates']
+            if isinstance(lm, RNNLM) or isinstance(lm, NgramLM):
+                self.lmstate_final = end_hyps[0]['lmstate']
+            elif isinstance(lm, TransformerLM):
+                ys_final = end_hyps[0]['ys']
+                # Exclude the last state corresponding to <eos>
+                if ys_final[0, -1].item() == self.eos:
+                    ys_final = ys_final[:, :-1]
+                ys_final = ys_final[:, -lm.mem_len:]  # Truncate by BPTT length
+                self.lmstate_final = ys_final
+
             # N-best list
+            nbest_b = min(nbest, len(end_hyps))  # NOTE: fewer hypotheses may remain after early stopping
             if self.bwd:
                 # Reverse the order
-                nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:][::-1]) for n in range(nbest)]]
-                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:][::-1], dim=2).squeeze(0))]
+                nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:][::-1]) for n in range(nbest_b)]]
+                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:][::-1], dim=2).squeeze(0))
+                        if store_aws else None]
             else:
-                nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:]) for n in range(nbest)]]
-                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:], dim=2).squeeze(0))]
+                nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:]) for n in range(nbest_b)]]
+                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:], dim=2).squeeze(0))
+                        if store_aws else None]
             if length_norm:
-                scores += [[end_hyps[n]['score_att'] / len(end_hyps[n]['hyp'][1:]) for n in range(nbest)]]
+                scores += [[end_hyps[n]['score_att'] / len(end_hyps[n]['hyp'][1:]) for n in range(nbest_b)]]
             else:
-                scores += [[end_hyps[n]['score_att'] for n in range(nbest)]]
+                scores += [[end_hyps[n]['score_att'] for n in range(nbest_b)]]
 
             # Check <eos>
-            eos_flags.append([(end_hyps[n]['hyp'][-1] == self.eos) for n in range(nbest)])
+            eos_flags.append([(end_hyps[n]['hyp'][-1] == self.eos) for n in range(nbest_b)])
 
         # Exclude <eos> (<sos> in case of the backward decoder)
         if exclude_eos:
             if self.bwd:
                 nbest_hyps_idx = [[nbest_hyps_idx[b][n][1:] if eos_flags[b][n]
-                                   else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
+                                   else nbest_hyps_idx[b][n] for n in range(len(nbest_hyps_idx[b]))] for b in range(bs)]
             else:
                 nbest_hyps_idx = [[nbest_hyps_idx[b][n][:-1] if eos_flags[b][n]
-                                   else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
+                                   else nbest_hyps_idx[b][n] for n in range(len(nbest_hyps_idx[b]))] for b in range(bs)]
 
-        # Store ASR/LM state
-        self.dstates_final = end_hyps[0]['dstates']
-        if isinstance(lm, RNNLM):
-            self.lmstate_final = end_hyps[0]['lmstate']
-        elif trfm_lm:
-            if isinstance(lm, TransformerXL):
-                self.lmmemory = lm.update_memory(self.lmmemory, end_hyps[0]['lmstate'])
-                logging.info('Memory: %d' % self.lmmemory[0].size(1))
-            else:
-                ys = end_hyps[0]['ys']
-                # Exclude the last state corresponding to <eos>
-                if ys[0, -1].item() == self.eos:
-                    ys = ys[:, :-1]
-                ys = ys[:, -lm.mem_len:]  # Truncate by BPTT length
-            self.lmstate_final = ys
+        if speakers is not None:
+            self.drop_finished_sessions(speakers)
 
         return nbest_hyps_idx, aws, scores
 
@@ -1381,7 +1457,9 @@ class RNNDecoder(DecoderBase):
         ctc_state = None
 
         # For joint CTC-Attention decoding
-        self.ctc_prefix_scorer = None
+        if hyps is None:
+            # NOTE: the CTC prefix scorer is carried over from the previous chunk otherwise
+            self.ctc_prefix_scorer = None
         if ctc_log_probs is not None:
             assert ctc_weight > 0
             ctc_log_probs = tensor2np(ctc_log_probs)
@@ -1456,17 +1534,15 @@ class RNNDecoder(DecoderBase):
             lmout, lmstate, scores_lm = None, None, None
             if lm is not None or self.lm is not None:
                 if beam['lmstate'] is not None:
-                    lm_hxs = torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1)
-                    lm_cxs = torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)
-                    lmstate = {'hxs': lm_hxs, 'cxs': lm_cxs}
+                    lmstate = concat_state([beam['lmstate'] for beam in hyps])
                 if self.lm is not None:  # cold/deep fusion
                     lmout, lmstate, scores_lm = self.lm.predict(y, lmstate)
                 elif lm is not None:  # shallow fusion
                     lmout, lmstate, scores_lm = lm.predict(y, lmstate)
 
             dstates, cv, aw, attn_v, _, _ = self.decode_step(
-                eouts_c[0:1].repeat([cv.size(0), 1, 1]),
-                dstates, cv, self.dropout_emb(self.embed(y)), None, aw, lmout, cache=False)
+                eouts_c[0:1].expand(cv.size(0), -1, -1),
+                dstates, cv, self.dropout_emb(self.embed(y)), None, aw, lmout)
             scores_att = torch.log_softmax(self.output(attn_v).squeeze(1), dim=1)
 
             for j, beam in enumerate(hyps):
@@ -1528,9 +1604,9 @@ class RNNDecoder(DecoderBase):
                          'score_lm': total_scores_lm[k].item(),
                          'dstates': {'dstate': (dstates['dstate'][0][:, j:j + 1], dstates['dstate'][1][:, j:j + 1])},
                          'cv': cv[j:j + 1],
-                         'aws': beam['aws'] + [aw[j:j + 1]],
-                         'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                     'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
+                         'aws': [aw[j:j + 1]],  # only the last attention weights are used in the next step
+                         'lmstate': {k: v[:, j:j + 1] if v is not None else None
+                                     for k, v in lmstate.items()} if lmstate is not None else None,
                          'ctc_state': new_ctc_states[k] if self.ctc_prefix_scorer is not None else None,
                          'no_boundary': no_boundary})
 
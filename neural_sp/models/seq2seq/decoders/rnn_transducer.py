@@ -12,7 +12,9 @@ import numpy as np
 import random
 import torch
 import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
 
+from neural_sp.models.criterion import transducer_loss
 from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.seq2seq.decoders.beam_search import BeamSearch
 from neural_sp.models.seq2seq.decoders.ctc import CTC
@@ -58,6 +60,8 @@ class RNNTransducer(DecoderBase):
         global_weight (float):
         mtl_per_batch (bool):
         param_init (str): parameter initialization method
+        joint_chunk_size (int): number of frames per slice to compute the joint network
+            and the loss jointly. 0 means the full logit tensor is materialized.
 
     """
 
@@ -75,7 +79,8 @@ class RNNTransducer(DecoderBase):
                  external_lm=None,
                  global_weight=1.,
                  mtl_per_batch=False,
-                 param_init=0.1):
+                 param_init=0.1,
+                 joint_chunk_size=0):
 
         super(RNNTransducer, self).__init__()
 
@@ -94,6 +99,7 @@ class RNNTransducer(DecoderBase):
         self.ctc_weight = ctc_weight
         self.global_weight = global_weight
         self.mtl_per_batch = mtl_per_batch
+        self.joint_chunk_size = joint_chunk_size
 
         # for cache
         self.prev_spk = ''
@@ -163,6 +169,10 @@ class RNNTransducer(DecoderBase):
                                help='number of dimensions of the bottleneck layer before the softmax layer')
             group.add_argument('--emb_dim', type=int, default=512,
                                help='number of dimensions in the embedding layer')
+        # RNN-T specific
+        group.add_argument('--transducer_joint_chunk_size', type=int, default=0,
+                           help='number of frames per slice to compute the joint network and the loss '
+                                'without materializing the full logit tensor (0 means the full tensor)')
         return parser
 
     def reset_parameters(self, param_init):
@@ -244,6 +254,12 @@ class RNNTransducer(DecoderBase):
         ys_emb = self.dropout_emb(self.embed(ys_in))
         dout, _ = self.recurrency(ys_emb, None)
 
+        if self.joint_chunk_size > 0:
+            # Compute log-probabilities of <blank> and reference labels slice by slice
+            log_probs_blank, log_probs_label = self.joint_chunkwise(eouts, dout, ys_out)
+            loss = transducer_loss(log_probs_blank, log_probs_label, elens, ylens)
+            return loss
+
         # Compute output distribution
         logits = self.joint(eouts, dout)
 
@@ -260,11 +276,18 @@ class RNNTransducer(DecoderBase):
                                        reduction='mean',
                                        gather=False)
         else:
-            import warprnnt_pytorch
-            self.warprnnt_loss = warprnnt_pytorch.RNNTLoss()
-            loss = self.warprnnt_loss(log_probs, ys_out.int(), elens, ylens)
-            # NOTE: Transducer loss has already been normalized by bs
-            # NOTE: index 0 is reserved for blank in warprnnt_pytorch
+            try:
+                import warprnnt_pytorch
+                self.warprnnt_loss = warprnnt_pytorch.RNNTLoss()
+                loss = self.warprnnt_loss(log_probs, ys_out.int(), elens, ylens)
+                # NOTE: Transducer loss has already been normalized by bs
+                # NOTE: index 0 is reserved for blank in warprnnt_pytorch
+            except ImportError:
+                # pure PyTorch implementation
+                log_probs_blank = log_probs[:, :, :, self.blank]
+                log_probs_label = log_probs[:, :, :-1].gather(
+                    3, ys_out.unsqueeze(1).unsqueeze(3).expand(-1, log_probs.size(1), -1, -1)).squeeze(3)
+                loss = transducer_loss(log_probs_blank, log_probs_label, elens, ylens)
 
         return loss
 
@@ -284,6 +307,47 @@ class RNNTransducer(DecoderBase):
         out = self.output(out)
         return out
 
+    def joint_chunkwise(self, eouts, douts, ys_out):
+        """Compute log-probabilities of <blank> and reference labels slice by slice.
+
+        The joint network and the softmax are computed over `joint_chunk_size` frames
+        at a time, and only the log-probabilities needed for the forward-backward
+        recursion are kept. Each slice is recomputed in the backward pass, so the
+        `[B, T, L+1, vocab]` tensor never exists as a whole.
+
+        Args:
+            eouts (FloatTensor): `[B, T, enc_n_units]`
+            douts (FloatTensor): `[B, L+1, dec_n_units]`
+            ys_out (LongTensor): `[B, L]`
+        Returns:
+            log_probs_blank (FloatTensor): `[B, T, L+1]`
+            log_probs_label (FloatTensor): `[B, T, L]`
+
+        """
+        eouts = self.w_enc(eouts)  # `[B, T, bottleneck_dim]`
+        douts = self.w_dec(douts)  # `[B, L+1, bottleneck_dim]`
+        ys_out = ys_out.unsqueeze(1).unsqueeze(3)  # `[B, 1, L, 1]`
+
+        def _joint_gather(eouts_c, douts):
+            out = self.output(torch.tanh(eouts_c.unsqueeze(2) + douts.unsqueeze(1)))
+            log_probs = torch.log_softmax(out, dim=-1)  # `[B, chunk, L+1, vocab]`
+            log_probs_blank = log_probs[:, :, :, self.blank]
+            log_probs_label = log_probs[:, :, :-1].gather(
+                3, ys_out.expand(-1, eouts_c.size(1), -1, -1)).squeeze(3)
+            return log_probs_blank, log_probs_label
+
+        log_probs_blank, log_probs_label = [], []
+        for t in range(0, eouts.size(1), self.joint_chunk_size):
+            eouts_c = eouts[:, t:t + self.joint_chunk_size]
+            if torch.is_grad_enabled() and (eouts_c.requires_grad or douts.requires_grad):
+                # NOTE: the reentrant checkpoint needs an input requiring gradients
+                blank_c, label_c = checkpoint(_joint_gather, eouts_c, douts)
+            else:
+                blank_c, label_c = _joint_gather(eouts_c, douts)
+            log_probs_blank.append(blank_c)
+            log_probs_label.append(label_c)
+        return torch.cat(log_probs_blank, dim=1), torch.cat(log_probs_label, dim=1)
+
     def recurrency(self, ys_emb, dstate):
         """Update prediction network.
 
@@ -400,6 +464,12 @@ class RNNTransducer(DecoderBase):
                     ensmbl_eouts=None, ensmbl_elens=None, ensmbl_decs=[]):
         """Beam search decoding.
 
+        Up to `recog_max_sym_exp` labels can be emitted per frame. All active
+        hypotheses are fed to the joint network in a single call at every expansion,
+        and hypotheses reaching the same label sequence through different alignments
+        are merged by log-sum-exp. Outputs of the prediction network (and LM) are
+        cached by prefix so that each prefix is computed only once per utterance.
+
         Args:
             eouts (FloatTensor): `[B, T, enc_n_units]`
             elens (IntTensor): `[B]`
@@ -430,6 +500,9 @@ class RNNTransducer(DecoderBase):
         lm_weight = params['recog_lm_weight']
         lm_weight_second = params['recog_lm_second_weight']
         lm_weight_second_bwd = params['recog_lm_bwd_weight']
+        max_sym_exp = max(1, params['recog_max_sym_exp'])
+        beam_margin = params['recog_beam_margin']
+        time_budget = params['recog_time_budget']
         # asr_state_carry_over = params['recog_asr_state_carry_over']
         lm_state_carry_over = params['recog_lm_state_carry_over']
 
@@ -447,13 +520,13 @@ class RNNTransducer(DecoderBase):
             assert ctc_weight > 0
             ctc_log_probs = tensor2np(ctc_log_probs)
 
+        def _total_score(score_rnnt, score_lm, score_ctc):
+            return score_rnnt * (1 - ctc_weight) + score_lm * lm_weight + score_ctc * ctc_weight
+
         nbest_hyps_idx = []
         eos_flags = []
         for b in range(bs):
             # Initialization per utterance
-            y = eouts.new_zeros(bs, 1).fill_(self.eos).long()
-            y_emb = self.dropout_emb(self.embed(y))
-            dout, dstate = self.recurrency(y_emb, None)
             lmstate = None
 
             # For joint CTC-Attention decoding
@@ -462,139 +535,127 @@ class RNNTransducer(DecoderBase):
                 ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
 
             if speakers is not None:
-                if speakers[b] == self.prev_spk:
-                    if lm_state_carry_over and isinstance(lm, RNNLM):
-                        lmstate = self.lmstate_final
-                self.prev_spk = speakers[b]
+                if speakers[b] != self.prev_spk:
+                    # restore states of the session (None for a new session)
+                    self.switch_session(speakers[b])
+                if lm_state_carry_over and isinstance(lm, RNNLM):
+                    lmstate = self.lmstate_final
+
+            # Reset state cache
+            self.state_cache = OrderedDict()
 
-            helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device_id)
+            helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device_id,
+                                score_margin=beam_margin, time_budget=time_budget)
 
-            end_hyps = []
             hyps = [{'hyp': [self.eos],
-                     'ref_id': [self.eos],
                      'score': 0.,
                      'score_rnnt': 0.,
                      'score_lm': 0.,
                      'score_ctc': 0.,
-                     'dout': dout,
-                     'dstate': dstate,
+                     'dout': None,
+                     'dstate': None,
                      'lmstate': lmstate,
+                     'lm_log_probs': None,
                      'ctc_state': ctc_prefix_scorer.initial_state() if ctc_prefix_scorer is not None else None}]
+            self.update_prefix_states(hyps, lm)
+
+            timeout = False
             for t in range(elens[b]):
-                # preprocess for batch decoding
-                douts = torch.cat([beam['dout'] for beam in hyps], dim=0)
-                outs = self.joint(eouts[b:b + 1, t:t + 1].repeat([douts.size(0), 1, 1]), douts)
-                scores_rnnt = torch.log_softmax(outs.squeeze(2).squeeze(1), dim=-1)
-
-                # Update LM states for shallow fusion
-                y = eouts.new_zeros(len(hyps), 1).long()
-                for j, beam in enumerate(hyps):
-                    y[j, 0] = beam['hyp'][-1]
-                lmstate, scores_lm = None, None
-                if lm is not None:
-                    if hyps[0]['lmstate'] is not None:
-                        lm_hxs = torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1)
-                        lm_cxs = torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)
-                        lmstate = {'hxs': lm_hxs, 'cxs': lm_cxs}
-                    lmout, lmstate, scores_lm = lm.predict(y, lmstate)
-
-                new_hyps = []
-                for j, beam in enumerate(hyps):
-                    dout = douts[j:j + 1]
-                    dstate = beam['dstate']
-                    lmstate = beam['lmstate']
-
-                    # Attention scores
-                    total_scores_rnnt = beam['score_rnnt'] + scores_rnnt[j:j + 1]
+                if helper.is_timeout():
+                    logger.info('Beam search is terminated by the time budget at the %d-th frame.' % t)
+                    timeout = True
+                    break
+                helper.n_active_hyps.append(len(hyps))
+
+                hyps_t = OrderedDict()  # hypotheses emitting <blank> at the t-th frame
+                for n in range(max_sym_exp):
+                    # Evaluate the joint network for all active hypotheses at once
+                    douts = torch.cat([beam['dout'] for beam in hyps], dim=0)
+                    outs = self.joint(eouts[b:b + 1, t:t + 1].expand(douts.size(0), -1, -1), douts)
+                    scores_rnnt = torch.log_softmax(outs.squeeze(2).squeeze(1), dim=-1)  # `[N, vocab]`
+
+                    # Emit <blank> and move to the next frame
+                    scores_blank = tensor2np(scores_rnnt[:, self.blank])
+                    for j, beam in enumerate(hyps):
+                        new_hyp = beam.copy()
+                        new_hyp['score_rnnt'] = beam['score_rnnt'] + float(scores_blank[j])
+                        hyp_str = ' '.join(list(map(str, beam['hyp'])))
+                        if hyp_str in hyps_t.keys():
+                            # Merge hypotheses having the same token sequences
+                            new_hyp['score_rnnt'] = float(np.logaddexp(hyps_t[hyp_str]['score_rnnt'],
+                                                                       new_hyp['score_rnnt']))
+                        new_hyp['score'] = _total_score(new_hyp['score_rnnt'], new_hyp['score_lm'],
+                                                        new_hyp['score_ctc'])
+                        hyps_t[hyp_str] = new_hyp
+
+                    if n == max_sym_exp - 1:
+                        break
+
+                    # Expand non-blank labels over all hypotheses jointly
+                    total_scores_rnnt = scores_rnnt + scores_rnnt.new_tensor(
+                        [beam['score_rnnt'] for beam in hyps]).unsqueeze(1)
                     total_scores = total_scores_rnnt * (1 - ctc_weight)
-
-                    # Add LM score <after> top-K selection
-                    total_scores_topk, topk_ids = torch.topk(
-                        total_scores, k=beam_width, dim=-1, largest=True, sorted=True)
                     if lm is not None:
-                        total_scores_lm = beam['score_lm'] + scores_lm[j, -1, topk_ids[0]]
-                        total_scores_topk += total_scores_lm * lm_weight
-                    else:
-                        total_scores_lm = eouts.new_zeros(beam_width)
+                        total_scores_lm = torch.cat([beam['lm_log_probs'] for beam in hyps], dim=0)
+                        total_scores_lm += total_scores_lm.new_tensor(
+                            [beam['score_lm'] for beam in hyps]).unsqueeze(1)
+                        total_scores += total_scores_lm * lm_weight
+                    total_scores[:, self.blank] = LOG_0
+                    total_scores[:, self.eos] = LOG_0
+                    _, topk_ids = torch.topk(total_scores.view(-1), k=min(beam_width, total_scores.numel()),
+                                             dim=0, largest=True, sorted=True)
+                    js = tensor2np(topk_ids) // self.vocab
+                    ks = tensor2np(topk_ids) % self.vocab
 
                     # Add CTC score
-                    new_ctc_states, total_scores_ctc, total_scores_topk = helper.add_ctc_score(
-                        beam['hyp'], topk_ids, beam['ctc_state'],
-                        total_scores_topk, ctc_prefix_scorer)
-
-                    for k in range(beam_width):
-                        idx = topk_ids[0, k].item()
-
-                        if idx == self.blank:
-                            beam['score'] = total_scores_topk[0, k].item()
-                            beam['score_rnnt'] = total_scores_topk[0, k].item()
-                            new_hyps.append(beam.copy())
+                    scores_ctc, ctc_states = [0.] * len(js), [None] * len(js)
+                    if ctc_prefix_scorer is not None:
+                        for j in sorted(set(js.tolist())):
+                            pos = np.where(js == j)[0]
+                            ctc_scores_j, ctc_states_j = ctc_prefix_scorer(
+                                hyps[j]['hyp'], ks[pos], hyps[j]['ctc_state'])
+                            for i_p, p in enumerate(pos):
+                                scores_ctc[p] = float(ctc_scores_j[i_p])
+                                ctc_states[p] = ctc_states_j[i_p]
+
+                    # Prune expansions which can never enter the beam,
+                    # since scores do not increase by further expansion
+                    scores_t = sorted([v['score'] for v in hyps_t.values()], reverse=True)
+                    score_min = scores_t[beam_width - 1] if len(scores_t) >= beam_width else LOG_0
+
+                    new_hyps = []
+                    for i_k, (j, idx) in enumerate(zip(js.tolist(), ks.tolist())):
+                        beam = hyps[j]
+                        score_rnnt = total_scores_rnnt[j, idx].item()
+                        score_lm = total_scores_lm[j, idx].item() if lm is not None else 0.
+                        score_ctc = scores_ctc[i_k]
+                        score = _total_score(score_rnnt, score_lm, score_ctc)
+                        if score <= score_min:
                             continue
-
-                        # skip blank-dominant frames
-                        # if total_scores_topk[0, self.blank].item() > 0.7:
-                        #     continue
-
-                        # Update prediction network only when predicting non-blank labels
-                        hyp_id = beam['hyp'] + [idx]
-                        hyp_str = ' '.join(list(map(str, hyp_id)))
-                        # if hyp_str in self.state_cache.keys():
-                        #     # from cache
-                        #     dout = self.state_cache[hyp_str]['dout']
-                        #     new_dstate = self.state_cache[hyp_str]['dstate']
-                        #     lmstate = self.state_cache[hyp_str]['lmstate']
-                        # else:
-                        y = eouts.new_zeros(1, 1).fill_(idx).long()
-                        y_emb = self.dropout_emb(self.embed(y))
-                        dout, new_dstate = self.recurrency(y_emb, dstate)
-
-                        # store in cache
-                        self.state_cache[hyp_str] = {
-                            'dout': dout,
-                            'dstate': new_dstate,
-                            'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                        'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
-                        }
-
-                        new_hyps.append({'hyp': hyp_id,
-                                         'score': total_scores_topk[0, k].item(),
-                                         'score_rnnt': total_scores_rnnt[0, idx].item(),
-                                         'score_ctc': total_scores_ctc[k].item(),
-                                         'score_lm': total_scores_lm[k].item(),
-                                         'dout': dout,
-                                         'dstate': new_dstate,
-                                         'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                                     'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
-                                         'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None})
-
-                # Merge hypotheses having the same token sequences
-                new_hyps_merged = {}
-                for beam in new_hyps:
-                    hyp_str = ' '.join(list(map(str, beam['hyp'])))
-                    if hyp_str not in new_hyps_merged.keys():
-                        new_hyps_merged[hyp_str] = beam
-                    elif hyp_str in new_hyps_merged.keys():
-                        if beam['score'] > new_hyps_merged[hyp_str]['score']:
-                            new_hyps_merged[hyp_str] = beam
-                new_hyps = [v for v in new_hyps_merged.values()]
+                        new_hyps.append({'hyp': beam['hyp'] + [idx],
+                                         'score': score,
+                                         'score_rnnt': score_rnnt,
+                                         'score_lm': score_lm,
+                                         'score_ctc': score_ctc,
+                                         'dout': None,
+                                         'dstate': beam['dstate'],
+                                         'lmstate': beam['lmstate'],
+                                         'lm_log_probs': None,
+                                         'ctc_state': ctc_states[i_k]})
+                    if len(new_hyps) == 0:
+                        break
+
+                    # Update prediction network (and LM) only for new prefixes
+                    hyps = sorted(new_hyps, key=lambda x: x['score'], reverse=True)[:beam_width]
+                    self.update_prefix_states(hyps, lm)
 
                 # Local pruning
-                new_hyps_tmp = sorted(new_hyps, key=lambda x: x['score'], reverse=True)[:beam_width]
-
-                # Remove complete hypotheses
-                new_hyps = []
-                for hyp in new_hyps_tmp:
-                    new_hyps += [hyp]
-                if len(end_hyps) >= beam_width:
-                    end_hyps = end_hyps[:beam_width]
-                    break
-                hyps = new_hyps[:]
+                hyps = sorted(hyps_t.values(), key=lambda x: x['score'], reverse=True)[:beam_width]
+                hyps = helper.prune_by_score_margin(hyps)
+
+            self.update_beam_stats(helper, timeout)
 
-            # Global pruning
-            if len(end_hyps) == 0:
-                end_hyps = hyps[:]
-            elif len(end_hyps) < nbest and nbest > 1:
-                end_hyps.extend(hyps[:nbest - len(end_hyps)])
+            end_hyps = hyps[:]
 
             # forward second path LM rescoring
             if lm_second is not None:
@@ -602,10 +663,13 @@ class RNNTransducer(DecoderBase):
 
             # backward secodn path LM rescoring
             if lm_second_bwd is not None:
-                self.lm_rescoring(end_hyps, lm_second_bwd, lm_weight_second_bwd, tag='second_rev')
+                self.lm_rescoring(end_hyps, lm_second_bwd, lm_weight_second_bwd, reverse=True, tag='second_rev')
 
             end_hyps = sorted(end_hyps, key=lambda x: x['score'], reverse=True)
 
+            # LM state carry over
+            self.lmstate_final = end_hyps[0]['lmstate']
+
             # Reset state cache
             self.state_cache = OrderedDict()
 
@@ -625,9 +689,70 @@ class RNNTransducer(DecoderBase):
                     logger.info('-' * 50)
 
             # N-best list
-            nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:]) for n in range(nbest)]]
+            nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:]) for n in range(min(nbest, len(end_hyps)))]]
 
             # Check <eos>
-            eos_flags.append([(end_hyps[n]['hyp'][-1] == self.eos) for n in range(nbest)])
+            eos_flags.append([(end_hyps[n]['hyp'][-1] == self.eos) for n in range(min(nbest, len(end_hyps)))])
+
+        if speakers is not None:
+            self.drop_finished_sessions(speakers)
 
         return nbest_hyps_idx, None, None
+
+    def update_prefix_states(self, hyps, lm=None):
+        """Update the prediction network (and LM) states for the last token of each hypothesis.
+
+        States are cached by prefix, and all uncached prefixes are computed in a single batch.
+
+        Args:
+            hyps (list): hypotheses, each of which contains the states of its parent prefix.
+                `dout`, `dstate`, `lmstate`, and `lm_log_probs` are overwritten in place.
+            lm (RNNLM): LM for shallow fusion
+
+        """
+        hyps_uncached = []
+        for beam in hyps:
+            hyp_str = ' '.join(list(map(str, beam['hyp'])))
+            if hyp_str not in self.state_cache.keys() and hyp_str not in [h[0] for h in hyps_uncached]:
+                hyps_uncached.append((hyp_str, beam))
+
+        if len(hyps_uncached) > 0:
+            w = next(self.parameters())
+            y = w.new_zeros(len(hyps_uncached), 1).long()
+            for j, (_, beam) in enumerate(hyps_uncached):
+                y[j, 0] = beam['hyp'][-1]
+
+            dstate = None
+            if hyps_uncached[0][1]['dstate'] is not None:
+                dstate = {'hxs': torch.cat([beam['dstate']['hxs'] for _, beam in hyps_uncached], dim=1),
+                          'cxs': None}
+                if self.rnn_type == 'lstm_transducer':
+                    dstate['cxs'] = torch.cat([beam['dstate']['cxs'] for _, beam in hyps_uncached], dim=1)
+            douts, dstate = self.recurrency(self.dropout_emb(self.embed(y)), dstate)
+
+            lmstate, scores_lm = None, None
+            if lm is not None:
+                if hyps_uncached[0][1]['lmstate'] is not None:
+                    lmstate = {'hxs': torch.cat([beam['lmstate']['hxs'] for _, beam in hyps_uncached], dim=1),
+                               'cxs': None}
+                    if lm.rnn_type == 'lstm':
+                        lmstate['cxs'] = torch.cat([beam['lmstate']['cxs'] for _, beam in hyps_uncached], dim=1)
+                _, lmstate, scores_lm = lm.predict(y, lmstate)
+
+            for j, (hyp_str, _) in enumerate(hyps_uncached):
+                self.state_cache[hyp_str] = {
+                    'dout': douts[j:j + 1],
+                    'dstate': {'hxs': dstate['hxs'][:, j:j + 1],
+                               'cxs': dstate['cxs'][:, j:j + 1] if dstate['cxs'] is not None else None},
+                    'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
+                                'cxs': lmstate['cxs'][:, j:j + 1] if lmstate['cxs'] is not None else None}
+                    if lmstate is not None else None,
+                    'lm_log_probs': scores_lm[j:j + 1, -1] if scores_lm is not None else None,
+                }
+
+        for beam in hyps:
+            cache = self.state_cache[' '.join(list(map(str, beam['hyp'])))]
+            beam['dout'] = cache['dout']
+            beam['dstate'] = cache['dstate']
+            beam['lmstate'] = cache['lmstate']
+            beam['lm_log_probs'] = cache['lm_log_probs']
@@ -16,6 +16,7 @@ import torch
 import torch.nn as nn
 
 from neural_sp.models.criterion import cross_entropy_lsm
+from neural_sp.models.lm.lm_state_cache import concat_state
 from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.modules.initialization import init_like_transformer_xl
 from neural_sp.models.modules.positional_embedding import PositionalEncoding
@@ -626,6 +627,7 @@ class TransformerDecoder(DecoderBase):
         Returns:
             nbest_hyps_idx (list): length `B`, each of which contains list of N hypotheses
             aws (list): length `B`, each of which contains arrays of size `[H, L, T]`
+                (None unless `recog_store_attention` is set)
             scores (list):
 
         """
@@ -646,6 +648,15 @@ class TransformerDecoder(DecoderBase):
         lm_state_carry_over = params['recog_lm_state_carry_over']
         softmax_smoothing = params['recog_softmax_smoothing']
         eps_wait = params['recog_mma_delay_threshold']
+        store_aws = params['recog_store_attention']
+        beam_margin = params['recog_beam_margin']
+        end_detect = params['recog_end_detect']
+        ctc_max_len_ratio = params['recog_ctc_max_len_ratio']
+        time_budget = params['recog_time_budget']
+        lm_cache_size = params['recog_lm_state_cache_size']
+        lm_n_cands = min(max(params['recog_lm_n_cands'], beam_width), self.vocab)
+        lm_cand = params['recog_lm_n_cands'] > 0 and lm is not None and lm.restricted_scoring
+        # NOTE: tokens out of the pre-beam are never selected, so the results can change
 
         if lm is not None:
             assert lm_weight > 0
@@ -657,6 +668,8 @@ class TransformerDecoder(DecoderBase):
             assert lm_weight_bwd > 0
             lm_bwd.eval()
 
+        lm_state_cache = self.get_lm_state_cache(lm_cache_size) if lm is not None else None
+
         if ctc_log_probs is not None:
             assert ctc_weight > 0
             ctc_log_probs = tensor2np(ctc_log_probs)
@@ -677,15 +690,22 @@ class TransformerDecoder(DecoderBase):
                     ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
 
             if speakers is not None:
-                if speakers[b] == self.prev_spk:
-                    if lm_state_carry_over and isinstance(lm, RNNLM):
-                        lmstate = self.lmstate_final
-                self.prev_spk = speakers[b]
+                if speakers[b] != self.prev_spk:
+                    # restore states of the session (None for a new session)
+                    self.switch_session(speakers[b])
+                if lm_state_carry_over and isinstance(lm, RNNLM):
+                    lmstate = self.lmstate_final
+
+            # LM states are shared by prefixes only when the LM starts from scratch
+            use_lm_cache = lm_state_cache is not None and lmstate is None
 
-            helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device_id)
+            helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device_id,
+                                score_margin=beam_margin, time_budget=time_budget)
 
             end_hyps = []
             ymax = math.ceil(elens[b] * max_len_ratio)
+            if ctc_max_len_ratio > 0 and ctc_log_probs is not None:
+                ymax = min(ymax, helper.max_len_ctc(ctc_log_probs[b, :elens[b]], self.blank, ctc_max_len_ratio))
             hyps = [{'hyp': [self.eos],
                      'ys': ys,
                      'cache': None,
@@ -693,14 +713,24 @@ class TransformerDecoder(DecoderBase):
                      'score_attn': 0.,
                      'score_ctc': 0.,
                      'score_lm': 0.,
+                     'aw': None,
                      'aws': [None],
                      'lmstate': lmstate,
                      'ensmbl_aws':[[None]] * (n_models - 1),
                      'ctc_state': ctc_prefix_scorer.initial_state() if ctc_prefix_scorer is not None else None,
+                     'n_quantity': 0,
                      'streamable': True,
-                     'streaming_failed_point': 1000}]
+                     'streaming_failed_point': 1000,
+                     'aw_last_success': None}]
             streamable_global = True
+            timeout = False
             for t in range(ymax):
+                if helper.is_timeout():
+                    logger.info('Beam search is terminated by the time budget at the %d-th step.' % t)
+                    timeout = True
+                    break
+                helper.n_active_hyps.append(len(hyps))
+
                 # batchfy all hypotheses for batch decoding
                 cache = [None] * self.n_layers
                 if cache_states and t > 0:
@@ -710,19 +740,21 @@ class TransformerDecoder(DecoderBase):
                 for j, beam in enumerate(hyps):
                     ys[j, :] = beam['ys']
                 if t > 0:
-                    xy_aws_prev = torch.cat([beam['aws'][-1] for beam in hyps], dim=0)  # `[B, n_layers, H_ma, 1, klen]`
+                    xy_aws_prev = torch.cat([beam['aw'] for beam in hyps], dim=0)  # `[B, n_layers, H_ma, 1, klen]`
                 else:
                     xy_aws_prev = None
 
                 # Update LM states for shallow fusion
-                lmstate, scores_lm = None, None
+                lmout, lmstate, scores_lm = None, None, None
                 if lm is not None:
                     if hyps[0]['lmstate'] is not None:
-                        lm_hxs = torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1)
-                        lm_cxs = torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)
-                        lmstate = {'hxs': lm_hxs, 'cxs': lm_cxs}
+                        lmstate = concat_state([beam['lmstate'] for beam in hyps])
                     y = ys[:, -1:].clone()  # NOTE: this is important
-                    _, lmstate, scores_lm = lm.predict(y, lmstate)
+                    if use_lm_cache:
+                        lmout, lmstate, scores_lm = lm_state_cache.predict(
+                            lm, [beam['hyp'] for beam in hyps], y, lmstate, skip_output=lm_cand)
+                    else:
+                        lmout, lmstate, scores_lm = lm.predict(y, lmstate, skip_output=lm_cand)
 
                 # for the main model
                 causal_mask = eouts.new_ones(t + 1, t + 1).byte()
@@ -791,6 +823,13 @@ class TransformerDecoder(DecoderBase):
                 # Ensemble in log-scale
                 scores_attn = torch.log(probs) / n_models
 
+                # Candidate-restricted LM scoring for the pre-beam of all hypotheses
+                if lm_cand:
+                    scores_attn_prev = scores_attn.new_tensor([beam['score_attn'] for beam in hyps]).unsqueeze(1)
+                    _, cand_ids = torch.topk((scores_attn_prev + scores_attn) * (1 - ctc_weight),
+                                             k=lm_n_cands, dim=1, largest=True, sorted=True)
+                    scores_lm = lm.score_candidates(lmout[:, -1], cand_ids)
+
                 new_hyps = []
                 for j, beam in enumerate(hyps):
                     # Attention scores
@@ -798,7 +837,13 @@ class TransformerDecoder(DecoderBase):
                     total_scores = total_scores_attn * (1 - ctc_weight)
 
                     # Add LM score <before> top-K selection
-                    if lm is not None:
+                    if lm_cand:
+                        # NOTE: tokens out of the pre-beam are not scored by the LM
+                        total_scores_lm = beam['score_lm'] + scores_lm[j:j + 1]
+                        total_scores = total_scores.gather(1, cand_ids[j:j + 1]) + total_scores_lm * lm_weight
+                        total_scores_lm = eouts.new_zeros(1, self.vocab).scatter_(
+                            1, cand_ids[j:j + 1], total_scores_lm)
+                    elif lm is not None:
                         total_scores_lm = beam['score_lm'] + scores_lm[j:j + 1, -1]
                         total_scores += total_scores_lm * lm_weight
                     else:
@@ -806,6 +851,8 @@ class TransformerDecoder(DecoderBase):
 
                     total_scores_topk, topk_ids = torch.topk(
                         total_scores, k=beam_width, dim=1, largest=True, sorted=True)
+                    if lm_cand:
+                        topk_ids = cand_ids[j:j + 1].gather(1, topk_ids)
 
                     # Add length penalty
                     if lp_weight > 0:
@@ -816,9 +863,11 @@ class TransformerDecoder(DecoderBase):
                         beam['hyp'], topk_ids, beam['ctc_state'],
                         total_scores_topk, ctc_prefix_scorer)
 
-                    new_aws = beam['aws'] + [xy_aws_all_layers[j:j + 1, :, :, -1:]]
-                    aws_j = torch.cat(new_aws[1:], dim=3)  # `[1, H, n_layers, L, T]`
+                    aw_j = xy_aws_all_layers[j:j + 1, :, :, -1:]  # `[1, n_layers, H, 1, T]`
+                    # NOTE: accumulate the number of boundaries instead of concatenating all past attention weights
+                    n_quantity_j = beam['n_quantity'] + aw_j.int().sum().item() if 'mocha' in self.attn_type else 0
                     streaming_failed_point = beam['streaming_failed_point']
+                    aw_last_success = beam['aw_last_success']
 
                     # forward direction
                     for k in range(beam_width):
@@ -839,13 +888,13 @@ class TransformerDecoder(DecoderBase):
                         quantity_rate = 1.
                         if 'mocha' in self.attn_type:
                             n_tokens_hyp_k = t + 1
-                            n_quantity_k = aws_j[:, :, :, :n_tokens_hyp_k].int().sum().item()
+                            n_quantity_k = n_quantity_j
                             quantity_diff = n_tokens_hyp_k * n_heads_total - n_quantity_k
 
                             if quantity_diff != 0:
                                 if idx == self.eos:
                                     n_tokens_hyp_k -= 1  # NOTE: do not count <eos> for streamability
-                                    n_quantity_k = aws_j[:, :, :, :n_tokens_hyp_k].int().sum().item()
+                                    n_quantity_k = beam['n_quantity']
                                 else:
                                     streamable_global = False
                                 if n_tokens_hyp_k * n_heads_total == 0:
@@ -855,6 +904,7 @@ class TransformerDecoder(DecoderBase):
 
                             if beam['streamable'] and not streamable_global:
                                 streaming_failed_point = t
+                                aw_last_success = beam['aw'] if t > 0 else aw_j
 
                         new_hyps.append(
                             {'hyp': beam['hyp'] + [idx],
@@ -864,25 +914,33 @@ class TransformerDecoder(DecoderBase):
                              'score_attn': total_scores_attn[0, idx].item(),
                              'score_ctc': total_scores_ctc[k].item(),
                              'score_lm': total_scores_lm[0, idx].item(),
-                             'aws': new_aws,
-                             'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                         'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
+                             'aw': aw_j,
+                             'aws': beam['aws'] + [aw_j] if store_aws else beam['aws'],
+                             'lmstate': {k: v[:, j:j + 1] if v is not None else None
+                                         for k, v in lmstate.items()} if lmstate is not None else None,
                              'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None,
                              'ensmbl_cache': ensmbl_new_cache,
                              'streamable': streamable_global,
+                             'n_quantity': n_quantity_j,
                              'streaming_failed_point': streaming_failed_point,
+                             'aw_last_success': aw_last_success,
                              'quantity_rate': quantity_rate})
 
                 # Local pruning
                 new_hyps_sorted = sorted(new_hyps, key=lambda x: x['score'], reverse=True)[:beam_width]
+                new_hyps_sorted = helper.prune_by_score_margin(new_hyps_sorted)
 
                 # Remove complete hypotheses
                 new_hyps, end_hyps, is_finish = helper.remove_complete_hyp(
                     new_hyps_sorted, end_hyps, prune=True)
                 hyps = new_hyps[:]
-                if is_finish:
+                if is_finish or len(hyps) == 0:
+                    break
+                if end_detect and helper.end_detect(end_hyps, t):
                     break
 
+            self.update_beam_stats(helper, timeout)
+
             # Global pruning
             if len(end_hyps) == 0:
                 end_hyps = hyps[:]
@@ -895,7 +953,7 @@ class TransformerDecoder(DecoderBase):
 
             # backward secodn path LM rescoring
             if lm_bwd is not None and lm_weight_bwd > 0:
-                self.lm_rescoring(end_hyps, lm_bwd, lm_weight_bwd, tag='second_bwd')
+                self.lm_rescoring(end_hyps, lm_bwd, lm_weight_bwd, reverse=True, tag='second_bwd')
 
             # Sort by score
             end_hyps = sorted(end_hyps, key=lambda x: x['score'], reverse=True)
@@ -940,36 +998,44 @@ class TransformerDecoder(DecoderBase):
 
                 if 'mocha' in self.attn_type and end_hyps[0]['streaming_failed_point'] < 1000:
                     assert not self.streamable
-                    aws_last_success = end_hyps[0]['aws'][1:][end_hyps[0]['streaming_failed_point'] - 1]
+                    aws_last_success = end_hyps[0]['aw_last_success']
+                    aws_last_success = aws_last_success.view(1, -1, aws_last_success.size(-2),
+                                                             aws_last_success.size(-1))
                     rightmost_frame = max(0, aws_last_success[0, :, 0].nonzero()[:, -1].max().item()) + 1
                     frame_ratio = rightmost_frame * 100 / xmax
                     self.last_success_frame_ratio = frame_ratio
                     logger.info('streaming last success frame ratio: %.2f' % frame_ratio)
 
+            # Store ASR/LM state
+            if len(end_hyps) > 0:
+                self.lmstate_final = end_hyps[0]['lmstate']
+
             # N-best list
+            nbest_b = min(nbest, len(end_hyps))  # NOTE: fewer hypotheses may remain after early stopping
             if self.bwd:
                 # Reverse the order
-                nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:][::-1]) for n in range(nbest)]]
-                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:][::-1], dim=2).squeeze(0))]
+                nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:][::-1]) for n in range(nbest_b)]]
+                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:][::-1], dim=2).squeeze(0))
+                        if store_aws else None]
             else:
-                nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:]) for n in range(nbest)]]
-                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:], dim=2).squeeze(0))]
-            scores += [[end_hyps[n]['score_attn'] for n in range(nbest)]]
+                nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:]) for n in range(nbest_b)]]
+                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:], dim=2).squeeze(0))
+                        if store_aws else None]
+            scores += [[end_hyps[n]['score_attn'] for n in range(nbest_b)]]
 
             # Check <eos>
-            eos_flags.append([(end_hyps[n]['hyp'][-1] == self.eos) for n in range(nbest)])
+            eos_flags.append([(end_hyps[n]['hyp'][-1] == self.eos) for n in range(nbest_b)])
 
         # Exclude <eos> (<sos> in case of the backward decoder)
         if exclude_eos:
             if self.bwd:
                 nbest_hyps_idx = [[nbest_hyps_idx[b][n][1:] if eos_flags[b][n]
-                                   else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
+                                   else nbest_hyps_idx[b][n] for n in range(len(nbest_hyps_idx[b]))] for b in range(bs)]
             else:
                 nbest_hyps_idx = [[nbest_hyps_idx[b][n][:-1] if eos_flags[b][n]
-                                   else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
+                                   else nbest_hyps_idx[b][n] for n in range(len(nbest_hyps_idx[b]))] for b in range(bs)]
 
-        # Store ASR/LM state
-        if len(end_hyps) > 0:
-            self.lmstate_final = end_hyps[0]['lmstate']
+        if speakers is not None:
+            self.drop_finished_sessions(speakers)
 
         return nbest_hyps_idx, aws, scores
@@ -20,6 +20,11 @@ from neural_sp.models.modules.relative_multihead_attention import RelativeMultih
 from neural_sp.models.seq2seq.encoders.conv import ConvEncoder
 from neural_sp.models.seq2seq.encoders.encoder_base import EncoderBase
 from neural_sp.models.seq2seq.encoders.utils import chunkwise
+from neural_sp.models.seq2seq.encoders.utils import concat_memory_cache
+from neural_sp.models.seq2seq.encoders.utils import make_memory_mask
+from neural_sp.models.seq2seq.encoders.utils import split_memory_cache
+from neural_sp.models.seq2seq.encoders.utils import stitch_chunk_attention
+from neural_sp.models.seq2seq.encoders.utils import update_memory_cache
 from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import tensor2np
 
@@ -90,6 +95,7 @@ class ConformerEncoder(EncoderBase):
         self.d_model = d_model
         self.n_layers = n_layers
         self.n_heads = n_heads
+        self.kernel_size = kernel_size
         self.pe_type = pe_type
         self.scale = math.sqrt(d_model)
 
@@ -185,6 +191,9 @@ class ConformerEncoder(EncoderBase):
 
         self.reset_parameters(param_init)
 
+        # for streaming encoding with cache
+        self.reset_cache()
+
     @staticmethod
     def add_args(parser, args):
         """Add arguments."""
@@ -245,6 +254,34 @@ class ConformerEncoder(EncoderBase):
                 nn.init.xavier_uniform_(self.bridge_sub2.weight)
                 nn.init.constant_(self.bridge_sub2.bias, 0.)
 
+    def reset_cache(self):
+        self.cache = None
+        logger.debug('Reset cache.')
+
+    def get_cache(self):
+        """Return the states of the previous chunks for streaming encoding.
+
+        Returns:
+            cache (dict):
+                mems (list): length `n_layers`, each of which contains inputs of the self-attention
+                    layer in the previous frames `[B, chunk_size_left // subsampling_factor, d_model]`
+                mlens (list): `[B]`, number of valid frames in memory
+                convs (list): length `n_layers`, each of which contains inputs of the depthwise
+                    convolution in the previous frames `[B, d_model, kernel_size // 2]`
+
+        """
+        return self.cache
+
+    def set_cache(self, cache):
+        """Set the states of the previous chunks (None to reset)."""
+        self.cache = cache
+
+    def concat_cache(self, caches):
+        return concat_memory_cache(caches)
+
+    def split_cache(self, cache, bs):
+        return split_memory_cache(cache, bs)
+
     def forward(self, xs, xlens, task, use_cache=False, streaming=False):
         """Forward computation.
 
@@ -252,8 +289,8 @@ class ConformerEncoder(EncoderBase):
             xs (FloatTensor): `[B, T, input_dim]`
             xlens (list): `[B]`
             task (str): not supported now
-            use_cache (bool):
-            streaming (bool): streaming encoding
+            use_cache (bool): attend to the cached states of the previous chunks
+            streaming (bool): encode a single chunk with the cache (see `encode_chunk()`)
         Returns:
             eouts (dict):
                 xs (FloatTensor): `[B, T, d_model]`
@@ -264,6 +301,14 @@ class ConformerEncoder(EncoderBase):
                  'ys_sub1': {'xs': None, 'xlens': None},
                  'ys_sub2': {'xs': None, 'xlens': None}}
 
+        if streaming and self.latency_controlled:
+            xs, xlens = self.encode_chunk(xs, xlens, use_cache)
+            xs = self.norm_out(xs)
+            if self.bridge is not None:
+                xs = self.bridge(xs)
+            eouts['ys']['xs'], eouts['ys']['xlens'] = xs, xlens
+            return eouts
+
         N_l = self.chunk_size_left
         N_c = self.chunk_size_current
         N_r = self.chunk_size_right
@@ -286,8 +331,6 @@ class ConformerEncoder(EncoderBase):
             # streaming Conformer encoder
             _N_l = max(0, N_l // self.subsampling_factor)
             _N_c = N_c // self.subsampling_factor
-
-            n_chunks = xs.size(0) // bs
             emax = math.ceil(xmax / self.subsampling_factor)
 
             xs = xs * self.scale
@@ -296,18 +339,10 @@ class ConformerEncoder(EncoderBase):
 
             xx_mask = None  # NOTE: no mask
             for lth, layer in enumerate(self.layers):
-                xs = layer(xs, xx_mask, pos_embs=pos_embs)
+                xs, _ = layer(xs, xx_mask, pos_embs=pos_embs)
                 if not self.training:
-                    n_heads = layer.xx_aws.size(1)
-                    xx_aws = layer.xx_aws[:, :, _N_l:_N_l + _N_c, _N_l:_N_l + _N_c]
-                    xx_aws = xx_aws.view(bs, n_chunks, n_heads, _N_c, _N_c)
-                    xx_aws_center = xx_aws.new_zeros(bs, n_heads, emax, emax)
-                    for chunk_idx in range(n_chunks):
-                        offset = chunk_idx * _N_c
-                        emax_blc = xx_aws_center[:, :, offset:offset + _N_c].size(2)
-                        xx_aws_chunk = xx_aws[:, chunk_idx, :, :emax_blc, :emax_blc]
-                        xx_aws_center[:, :, offset:offset + _N_c, offset:offset + _N_c] = xx_aws_chunk
-                    self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(xx_aws_center)
+                    xx_aws = stitch_chunk_attention(layer.xx_aws, bs, _N_l, _N_c, emax)
+                    self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(xx_aws)
 
             # Extract the center region
             xs = xs[:, _N_l:_N_l + _N_c]  # `[B * n_chunks, _N_c, d_model]`
@@ -325,14 +360,14 @@ class ConformerEncoder(EncoderBase):
             pos_embs = self.pos_emb(pos_idxs, self.device_id)
 
             for lth, layer in enumerate(self.layers):
-                xs = layer(xs, xx_mask, pos_embs=pos_embs)
+                xs, _ = layer(xs, xx_mask, pos_embs=pos_embs)
                 if not self.training:
                     self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(layer.xx_aws)
 
                 # Pick up outputs in the sub task before the projection layer
                 if lth == self.n_layers_sub1 - 1:
                     xs_sub1 = self.layer_sub1(
-                        xs, xx_mask, pos_embs=pos_embs) if self.task_specific_layer else xs.clone()
+                        xs, xx_mask, pos_embs=pos_embs)[0] if self.task_specific_layer else xs.clone()
                     xs_sub1 = self.norm_out_sub1(xs_sub1)
                     if self.bridge_sub1 is not None:
                         xs_sub1 = self.bridge_sub1(xs_sub1)
@@ -341,7 +376,7 @@ class ConformerEncoder(EncoderBase):
                         return eouts
                 if lth == self.n_layers_sub2 - 1:
                     xs_sub2 = self.layer_sub2(
-                        xs, xx_mask, pos_embs=pos_embs) if self.task_specific_layer else xs.clone()
+                        xs, xx_mask, pos_embs=pos_embs)[0] if self.task_specific_layer else xs.clone()
                     xs_sub2 = self.norm_out_sub2(xs_sub2)
                     if self.bridge_sub2 is not None:
                         xs_sub2 = self.bridge_sub2(xs_sub2)
@@ -363,6 +398,64 @@ class ConformerEncoder(EncoderBase):
             eouts['ys_sub2']['xs'], eouts['ys_sub2']['xlens'] = xs_sub2, xlens
         return eouts
 
+    def encode_chunk(self, xs, xlens, use_cache=False):
+        """Encode a single chunk with the cached states of the previous chunks.
+
+        Instead of re-encoding the left context frames with every chunk as in
+        `chunkwise()`, inputs of the last `chunk_size_left` frames to each self-attention
+        layer and inputs of the last `kernel_size // 2` frames to each depthwise
+        convolution are cached. Only the current and right context frames are computed.
+        Frames in the right context are not cached.
+
+        Args:
+            xs (FloatTensor): `[B, T_chunk, input_dim]`, where T_chunk is at most
+                chunk_size_current + chunk_size_right
+            xlens (IntTensor): `[B]`
+            use_cache (bool): attend to the cache (start a new segment otherwise)
+        Returns:
+            xs (FloatTensor): `[B, T_chunk', d_model]`, outputs of the current frames
+            xlens (IntTensor): `[B]`
+
+        """
+        _N_l = max(0, self.chunk_size_left // self.subsampling_factor)
+        _N_c = self.chunk_size_current // self.subsampling_factor
+        n_context = self.kernel_size // 2
+
+        if self.conv is None:
+            xs = self.embed(xs)
+        else:
+            # Path through CNN blocks
+            xs, xlens = self.conv(xs, xlens)
+        bs, qlen = xs.size()[:2]
+        n_cur = min(_N_c, qlen)  # number of frames except for the right context
+
+        if use_cache and self.cache is not None:
+            mems, mlens, convs = self.cache['mems'], self.cache['mlens'], self.cache['convs']
+        else:
+            # NOTE: empty memory is masked out, and zero convolution states are the same as
+            # the left padding in offline encoding
+            mems, mlens = [xs.new_zeros(bs, _N_l, self.d_model)] * self.n_layers, [0] * bs
+            convs = [xs.new_zeros(bs, self.d_model, n_context)] * self.n_layers
+        mlen = mems[0].size(1)
+        xx_mask = make_memory_mask(mlens, mlen, qlen, self.device_id)
+
+        xs = xs * self.scale
+        pos_idxs = torch.arange(mlen + qlen - 1, -1, -1.0, dtype=torch.float)
+        pos_embs = self.pos_emb(pos_idxs, self.device_id)
+
+        new_mems, new_convs = [], []
+        for lth, layer in enumerate(self.layers):
+            xs, new_cache = layer(xs, xx_mask, pos_embs=pos_embs,
+                                  cache={'memory': mems[lth], 'conv': convs[lth]})
+            new_mems.append(update_memory_cache(mems[lth], new_cache['memory'][:, :n_cur]))
+            new_convs.append(new_cache['conv'][:, :, n_cur:n_cur + n_context].detach())
+
+        self.cache = {'mems': new_mems,
+                      'mlens': [min(_N_l, m + n_cur) for m in mlens],
+                      'convs': new_convs}
+
+        return xs[:, :n_cur], xlens.clamp(max=n_cur)
+
 
 class ConformerEncoderBlock(nn.Module):
     """A single layer of the Conformer encoder.
@@ -427,24 +520,30 @@ class ConformerEncoderBlock(nn.Module):
     def reset_visualization(self):
         self._xx_aws = None
 
-    def forward(self, xs, xx_mask=None, pos_embs=None, u=None, v=None):
+    def forward(self, xs, xx_mask=None, pos_embs=None, u=None, v=None, cache=None):
         """Conformer encoder layer definition.
 
         Args:
             xs (FloatTensor): `[B, T, d_model]`
-            xx_mask (ByteTensor): `[B, T, T]`
+            xx_mask (ByteTensor): `[B, T, mlen + T]`
             pos_embs (LongTensor): `[L, 1, d_model]`
             u (FloatTensor): global parameter for relative positinal embedding
             v (FloatTensor): global parameter for relative positinal embedding
+            cache (dict): states of the previous frames for streaming encoding
+                memory (FloatTensor): `[B, mlen, d_model]`, inputs of the self-attention layer
+                conv (FloatTensor): `[B, d_model, kernel_size // 2]`, inputs of the depthwise convolution
         Returns:
             xs (FloatTensor): `[B, T, d_model]`
+            new_cache (dict): states including the current frames (None if cache is not given)
+                memory (FloatTensor): `[B, T, d_model]`
+                conv (FloatTensor): `[B, d_model, kernel_size // 2 + T]`
 
         """
         self.reset_visualization()
 
         # LayerDrop
         if self.dropout_layer > 0 and self.training and random.random() >= self.dropout_layer:
-            return xs
+            return xs, None
 
         # first half FFN
         residual = xs
@@ -455,7 +554,7 @@ class ConformerEncoderBlock(nn.Module):
         # conv
         residual = xs
         xs = self.norm2(xs)
-        xs = self.conv(xs)
+        xs, new_cache_conv = self.conv(xs, cache['conv'] if cache is not None else None)
         xs = self.dropout(xs) + residual
 
         # self-attention
@@ -463,13 +562,19 @@ class ConformerEncoderBlock(nn.Module):
         xs = self.norm3(xs)
         # relative positional encoding
         memory = None
+        if cache is not None and cache['memory'].size(1) > 0:
+            memory = self.norm3(cache['memory'])  # memory holds inputs before normalization
         xs, self._xx_aws = self.self_attn(xs, xs, memory, pos_embs, xx_mask, u, v)
         xs = self.dropout(xs) + residual
 
+        new_cache = None
+        if cache is not None:
+            new_cache = {'memory': residual, 'conv': new_cache_conv}
+
         # second half FFN
         residual = xs
         xs = self.norm4(xs)
         xs = self.feed_forward2(xs)
         xs = self.fc_factor * self.dropout(xs) + residual  # Macaron FFN
 
-        return xs
+        return xs, new_cache
@@ -46,6 +46,22 @@ class EncoderBase(ModelBase):
     def forward(self, xs, xlens, task):
         raise NotImplementedError
 
+    def get_cache(self):
+        """Return the cached state for streaming encoding (None if stateless)."""
+        return None
+
+    def set_cache(self, cache):
+        """Set the cached state for streaming encoding."""
+        pass
+
+    def concat_cache(self, caches):
+        """Concatenate cached states of streams in the batch dimension for `set_cache()`."""
+        return None
+
+    def split_cache(self, cache, bs):
+        """Split a cached state returned by `get_cache()` into those of streams."""
+        return [None] * bs
+
     def turn_on_ceil_mode(self, encoder):
         if isinstance(encoder, torch.nn.Module):
             for name, module in encoder.named_children():
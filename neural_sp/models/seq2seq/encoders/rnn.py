@@ -21,6 +21,7 @@ from neural_sp.models.seq2seq.encoders.conv import update_lens_1d
 from neural_sp.models.seq2seq.encoders.encoder_base import EncoderBase
 from neural_sp.models.seq2seq.encoders.gated_conv import GatedConvEncoder
 from neural_sp.models.seq2seq.encoders.tds import TDSEncoder
+from neural_sp.models.seq2seq.encoders.utils import chunkwise
 
 
 logger = logging.getLogger(__name__)
@@ -271,6 +272,53 @@ class RNNEncoder(EncoderBase):
         self.hx_fwd = [None] * self.n_layers
         logger.debug('Reset cache.')
 
+    def get_cache(self):
+        """Return the forward RNN states of all layers.
+
+        Returns:
+            cache (list): length `n_layers`, each of which contains (h, c) for LSTM
+                or h for GRU of size `[1, B, n_units]`, or None before the first chunk
+
+        """
+        return list(self.hx_fwd)
+
+    def set_cache(self, cache):
+        """Set the forward RNN states of all layers (None to reset)."""
+        if cache is None:
+            self.reset_cache()
+        else:
+            self.hx_fwd = list(cache)
+
+    def concat_cache(self, caches):
+        """Concatenate forward RNN states of streams in the batch dimension.
+
+        Args:
+            caches (list): length `B`, caches returned by `split_cache()`
+                with the batch size of 1, None at the beginning of a segment
+        Returns:
+            cache (list): batched cache, None if all caches are None
+
+        """
+        ref = next((c for c in caches if c is not None), None)
+        if ref is None:
+            return None
+        return [_concat_states([c[lth] if c is not None else None for c in caches])
+                for lth in range(len(ref))]
+
+    def split_cache(self, cache, bs):
+        """Split batched forward RNN states into those of streams.
+
+        Args:
+            cache (list): batched cache returned by `get_cache()`
+            bs (int): batch size
+        Returns:
+            caches (list): length `B`, caches with the batch size of 1
+
+        """
+        if cache is None:
+            return [None] * bs
+        return [[_select_states(h, b) for h in cache] for b in range(bs)]
+
     def forward(self, xs, xlens, task, use_cache=False, streaming=False,
                 lookback=False, lookahead=False):
         """Forward computation.
@@ -297,7 +345,12 @@ class RNNEncoder(EncoderBase):
 
         # Sort by lenghts in the descending order for pack_padded_sequence
         if not self.lc_bidir:
-            xlens, perm_ids = torch.IntTensor(xlens).sort(0, descending=True)
+            if streaming:
+                # NOTE: sequences are not packed, and the order of the cached states is kept
+                xlens = torch.IntTensor(xlens)
+                perm_ids = torch.arange(len(xlens))
+            else:
+                xlens, perm_ids = torch.IntTensor(xlens).sort(0, descending=True)
             xs = xs[perm_ids]
             _, perm_ids_unsort = perm_ids.sort()
 
@@ -419,59 +472,104 @@ class RNNEncoder(EncoderBase):
         n_chunks = math.ceil(xmax / _N_l)
         if streaming:
             xlens = torch.IntTensor(bs).fill_(_N_l)
+            n_chunks = 1
+            xmax = min(xmax, _N_l + _N_r)
+
+        # Fold chunks into the batch dimension in the chunk-major order
+        xs = chunkwise(xs, 0, _N_l, _N_r)  # `[B * n_chunks', _N_l+_N_r, idim]`
+        xs = xs.view(bs, -1, _N_l + _N_r, xs.size(2))[:, :n_chunks].transpose(0, 1)
+        xs = xs.contiguous().view(n_chunks * bs, _N_l + _N_r, -1)  # `[n_chunks * B, _N_l+_N_r, idim]`
+        clens = [min(_N_l + _N_r, xmax - t) for t in range(0, _N_l * n_chunks, _N_l)]
+
+        # Indices to reverse only valid frames in each chunk for the backward direction
+        # NOTE: padded frames follow valid frames in the reversed order
+        rev_idxs = torch.arange(_N_l + _N_r).repeat(n_chunks, 1)
+        for chunk_idx, clen in enumerate(clens):
+            rev_idxs[chunk_idx, :clen] = torch.arange(clen - 1, -1, -1)
+        rev_idxs = rev_idxs.repeat_interleave(bs, dim=0).unsqueeze(2).to(xs.device)
+
+        for lth in range(self.n_layers):
+            self.rnn[lth].flatten_parameters()  # for multi-GPUs
+            self.rnn_bwd[lth].flatten_parameters()  # for multi-GPUs
+            # bwd (all chunks at once)
+            xs_bwd = torch.gather(xs, 1, rev_idxs.expand_as(xs))
+            xs_bwd, _ = self.rnn_bwd[lth](xs_bwd, hx=None)
+            xs_bwd = torch.gather(xs_bwd, 1, rev_idxs.expand_as(xs_bwd))  # `[n_chunks * B, _N_l+_N_r, n_units]`
+            # fwd
+            xs_fwd = self._forward_fwd_lc(lth, xs, clens, bs)
+            if self.bidir_sum:
+                xs = xs_fwd + xs_bwd
+            else:
+                xs = torch.cat([xs_fwd, xs_bwd], dim=-1)
+            xs = self.dropout(xs)
 
-        xs_chunks = []
-        xs_chunks_sub1 = []
-        for chunk_idx, t in enumerate(range(0, _N_l * n_chunks, _N_l)):
-            xs_chunk = xs[:, t:t + (_N_l + _N_r)]
-            for lth in range(self.n_layers):
-                self.rnn[lth].flatten_parameters()  # for multi-GPUs
-                self.rnn_bwd[lth].flatten_parameters()  # for multi-GPUs
-                # bwd
-                xs_chunk_bwd = torch.flip(xs_chunk, dims=[1])
-                xs_chunk_bwd, _ = self.rnn_bwd[lth](xs_chunk_bwd, hx=None)
-                xs_chunk_bwd = torch.flip(xs_chunk_bwd, dims=[1])  # `[B, _N_l+_N_r, n_units]`
-                # fwd
-                if xs_chunk.size(1) <= _N_l:
-                    xs_chunk_fwd, self.hx_fwd[lth] = self.rnn[lth](xs_chunk,
-                                                                   hx=self.hx_fwd[lth])
-                else:
-                    xs_chunk_fwd1, self.hx_fwd[lth] = self.rnn[lth](xs_chunk[:, :_N_l],
-                                                                    hx=self.hx_fwd[lth])
-                    xs_chunk_fwd2, _ = self.rnn[lth](xs_chunk[:, _N_l:],
-                                                     hx=self.hx_fwd[lth])
-                    xs_chunk_fwd = torch.cat([xs_chunk_fwd1, xs_chunk_fwd2], dim=1)  # `[B, _N_l+_N_r, n_units]`
-                    # NOTE: xs_chunk_fwd2 is for xs_chunk_bwd in the next layer
-                if self.bidir_sum:
-                    xs_chunk = xs_chunk_fwd + xs_chunk_bwd
-                else:
-                    xs_chunk = torch.cat([xs_chunk_fwd, xs_chunk_bwd], dim=-1)
-                xs_chunk = self.dropout(xs_chunk)
+            # Pick up outputs in the sub task before the projection layer
+            if lth == self.n_layers_sub1 - 1:
+                xs_sub1 = xs.clone()
+                if self.bridge_sub1 is not None:
+                    xs_sub1 = self.bridge_sub1(xs_sub1)
+                xs_sub1 = _stitch_chunks(xs_sub1, bs, _N_l, xmax)
+                if task == 'ys_sub1':
+                    return None, xlens, xs_sub1
 
-                # Pick up outputs in the sub task before the projection layer
-                if lth == self.n_layers_sub1 - 1:
-                    xs_chunk_sub1 = xs_chunk.clone()
-                    if self.bridge_sub1 is not None:
-                        xs_chunk_sub1 = self.bridge_sub1(xs_chunk_sub1)
-                    if task == 'ys_sub1':
-                        return None, xlens, xs_chunk_sub1
+            # Projection layer (exclude the last layer)
+            if self.proj is not None and lth != self.n_layers - 1:
+                xs = torch.tanh(self.proj[lth](xs))
 
-                # Projection layer (exclude the last layer)
-                if self.proj is not None and lth != self.n_layers - 1:
-                    xs_chunk = torch.tanh(self.proj[lth](xs_chunk))
+        xs = _stitch_chunks(xs, bs, _N_l, xmax)
 
-            xs_chunks.append(xs_chunk[:, :_N_l])
-            if self.n_layers_sub1 > 0:
-                xs_chunks_sub1.append(xs_chunk_sub1[:, :_N_l])
+        return xs, xlens, xs_sub1
 
-            if streaming:
-                break
+    def _forward_fwd_lc(self, lth, xs, clens, bs):
+        """Forward direction of the latency-controlled bidirectional encoder.
 
-        xs = torch.cat(xs_chunks, dim=1)
-        if self.n_layers_sub1 > 0:
-            xs_sub1 = torch.cat(xs_chunks_sub1, dim=1)
+        Current frames of all chunks are encoded as a continuous sequence, and right
+        context frames of all chunks are encoded at once from the states at the end
+        of the current frames.
 
-        return xs, xlens, xs_sub1
+        Args:
+            lth (int): layer index
+            xs (FloatTensor): `[n_chunks * B, N_l + N_r, idim]`, chunks in the chunk-major order
+            clens (list): `[n_chunks]`, number of valid frames in each chunk
+            bs (int): batch size
+        Returns:
+            xs_fwd (FloatTensor): `[n_chunks * B, N_l + N_r, n_units]`
+
+        """
+        _N_l = self.chunk_size_left // self.subsampling_factor
+        n_chunks = len(clens)
+        xs = xs.view(n_chunks, bs, xs.size(1), xs.size(2))
+
+        xs_cur = xs[:, :, :_N_l].transpose(0, 1).contiguous().view(bs, n_chunks * _N_l, -1)
+        cur_len = sum([min(_N_l, clen) for clen in clens])  # exclude padded frames
+        if isinstance(self.rnn[lth], nn.GRU):
+            xs_fwd_cur, _ = self.rnn[lth](xs_cur[:, :cur_len], hx=self.hx_fwd[lth])
+            # NOTE: hidden states of GRU are outputs
+            states = [xs_fwd_cur[:, min(_N_l * (c + 1), cur_len) - 1].unsqueeze(0)
+                      for c in range(n_chunks)]
+        else:
+            # NOTE: intermediate cell states of LSTM are not returned, so the state is carried chunk by chunk
+            xs_fwd_cur, states = [], []
+            hx = self.hx_fwd[lth]
+            for t in range(0, cur_len, _N_l):
+                xs_fwd_cur_c, hx = self.rnn[lth](xs_cur[:, t:min(t + _N_l, cur_len)], hx=hx)
+                xs_fwd_cur.append(xs_fwd_cur_c)
+                states.append(hx)
+            xs_fwd_cur = torch.cat(xs_fwd_cur, dim=1)
+        self.hx_fwd[lth] = states[-1]
+
+        if cur_len < n_chunks * _N_l:
+            xs_fwd_cur = torch.cat([xs_fwd_cur, xs_fwd_cur.new_zeros(
+                bs, n_chunks * _N_l - cur_len, xs_fwd_cur.size(2))], dim=1)
+        xs_fwd_cur = xs_fwd_cur.view(bs, n_chunks, _N_l, -1).transpose(0, 1)
+        xs_fwd_cur = xs_fwd_cur.contiguous().view(n_chunks * bs, _N_l, -1)
+        if xs.size(2) == _N_l:
+            return xs_fwd_cur
+
+        # NOTE: states are not carried over from right context frames
+        xs_fwd_right, _ = self.rnn[lth](xs[:, :, _N_l:].contiguous().view(n_chunks * bs, -1, xs.size(3)),
+                                        hx=_concat_states(states))
+        return torch.cat([xs_fwd_cur, xs_fwd_right], dim=1)
 
     def sub_module(self, xs, xlens, perm_ids_unsort, module='sub1'):
         if self.task_specific_layer:
@@ -626,3 +724,38 @@ class NiN(nn.Module):
         xs = torch.relu(self.batch_norm(self.conv(xs)))  # `[B, n_unis (*2), T, 1]`
         xs = xs.transpose(2, 1).squeeze(3)  # `[B, T, n_unis (*2)]`
         return xs
+
+
+def _stitch_chunks(xs, bs, N_c, xmax):
+    """Connect outputs of the current frames of chunks folded in the batch dimension.
+
+    Args:
+        xs (FloatTensor): `[n_chunks * B, N_c + N_r, n_units]`, chunks in the chunk-major order
+        bs (int): batch size
+        N_c (int): number of frames for current context
+        xmax (int): number of frames in the utterance
+    Returns:
+        xs (FloatTensor): `[B, xmax, n_units]`
+
+    """
+    n_chunks = xs.size(0) // bs
+    xs = xs[:, :N_c].contiguous().view(n_chunks, bs, N_c, -1).transpose(0, 1)
+    return xs.contiguous().view(bs, n_chunks * N_c, -1)[:, :xmax]
+
+
+def _concat_states(hs):
+    ref = next((h for h in hs if h is not None), None)
+    if ref is None:
+        return None
+    if isinstance(ref, tuple):  # LSTM
+        return tuple([_concat_states([h[i] if h is not None else None for h in hs]) for i in range(len(ref))])
+    # NOTE: zero states are the same as no initial states
+    return torch.cat([h if h is not None else ref.new_zeros(ref.size()) for h in hs], dim=1)
+
+
+def _select_states(h, b):
+    if h is None:
+        return None
+    if isinstance(h, tuple):  # LSTM
+        return tuple([_select_states(h_i, b) for h_i in h])
+    return h[:, b:b + 1]
@@ -22,6 +22,11 @@ from neural_sp.models.modules.relative_multihead_attention import RelativeMultih
 from neural_sp.models.seq2seq.encoders.conv import ConvEncoder
 from neural_sp.models.seq2seq.encoders.encoder_base import EncoderBase
 from neural_sp.models.seq2seq.encoders.utils import chunkwise
+from neural_sp.models.seq2seq.encoders.utils import concat_memory_cache
+from neural_sp.models.seq2seq.encoders.utils import make_memory_mask
+from neural_sp.models.seq2seq.encoders.utils import split_memory_cache
+from neural_sp.models.seq2seq.encoders.utils import stitch_chunk_attention
+from neural_sp.models.seq2seq.encoders.utils import update_memory_cache
 from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import tensor2np
 
@@ -198,6 +203,9 @@ class TransformerEncoder(EncoderBase):
 
         self.reset_parameters(param_init)
 
+        # for streaming encoding with cache
+        self.reset_cache()
+
     @staticmethod
     def add_args(parser, args):
         """Add arguments."""
@@ -302,6 +310,33 @@ class TransformerEncoder(EncoderBase):
 
         return new_mems
 
+    def reset_cache(self):
+        self.cache = None
+        logger.debug('Reset cache.')
+
+    def get_cache(self):
+        """Return the states of the previous chunks for streaming encoding.
+
+        Returns:
+            cache (dict):
+                mems (list): length `n_layers`, each of which contains inputs of
+                    the previous frames `[B, chunk_size_left // subsampling_factor, d_model]`
+                mlens (list): `[B]`, number of valid frames in memory
+                convs (None): not used
+
+        """
+        return self.cache
+
+    def set_cache(self, cache):
+        """Set the states of the previous chunks (None to reset)."""
+        self.cache = cache
+
+    def concat_cache(self, caches):
+        return concat_memory_cache(caches)
+
+    def split_cache(self, cache, bs):
+        return split_memory_cache(cache, bs)
+
     def forward(self, xs, xlens, task, use_cache=False, streaming=False):
         """Forward computation.
 
@@ -309,8 +344,8 @@ class TransformerEncoder(EncoderBase):
             xs (FloatTensor): `[B, T, input_dim]`
             xlens (list): `[B]`
             task (str): not supported now
-            use_cache (bool):
-            streaming (bool): streaming encoding
+            use_cache (bool): attend to the cached states of the previous chunks
+            streaming (bool): encode a single chunk with the cache (see `encode_chunk()`)
         Returns:
             eouts (dict):
                 xs (FloatTensor): `[B, T, d_model]`
@@ -321,6 +356,14 @@ class TransformerEncoder(EncoderBase):
                  'ys_sub1': {'xs': None, 'xlens': None},
                  'ys_sub2': {'xs': None, 'xlens': None}}
 
+        if streaming and self.latency_controlled:
+            xs, xlens = self.encode_chunk(xs, xlens, use_cache)
+            xs = self.norm_out(xs)
+            if self.bridge is not None:
+                xs = self.bridge(xs)
+            eouts['ys']['xs'], eouts['ys']['xlens'] = xs, xlens
+            return eouts
+
         N_l = self.chunk_size_left
         N_c = self.chunk_size_current
         N_r = self.chunk_size_right
@@ -343,8 +386,6 @@ class TransformerEncoder(EncoderBase):
             # streaming Transformer encoder
             _N_l = max(0, N_l // self.subsampling_factor)
             _N_c = N_c // self.subsampling_factor
-
-            n_chunks = xs.size(0) // bs
             emax = math.ceil(xmax / self.subsampling_factor)
 
             pos_embs = None
@@ -359,16 +400,8 @@ class TransformerEncoder(EncoderBase):
             for lth, layer in enumerate(self.layers):
                 xs = layer(xs, xx_mask, pos_embs=pos_embs)
                 if not self.training:
-                    n_heads = layer.xx_aws.size(1)
-                    xx_aws = layer.xx_aws[:, :, _N_l:_N_l + _N_c, _N_l:_N_l + _N_c]
-                    xx_aws = xx_aws.view(bs, n_chunks, n_heads, _N_c, _N_c)
-                    xx_aws_center = xx_aws.new_zeros(bs, n_heads, emax, emax)
-                    for blc_id in range(n_chunks):
-                        offset = blc_id * _N_c
-                        emax_blc = xx_aws_center[:, :, offset:offset + _N_c].size(2)
-                        xx_aws_chunk = xx_aws[:, blc_id, :, :emax_blc, :emax_blc]
-                        xx_aws_center[:, :, offset:offset + _N_c, offset:offset + _N_c] = xx_aws_chunk
-                    self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(xx_aws_center)
+                    xx_aws = stitch_chunk_attention(layer.xx_aws, bs, _N_l, _N_c, emax)
+                    self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(xx_aws)
 
             # Extract the center region
             xs = xs[:, _N_l:_N_l + _N_c]  # `[B * n_chunks, _N_c, d_model]`
@@ -426,6 +459,67 @@ class TransformerEncoder(EncoderBase):
             eouts['ys_sub2']['xs'], eouts['ys_sub2']['xlens'] = xs_sub2, xlens
         return eouts
 
+    def encode_chunk(self, xs, xlens, use_cache=False):
+        """Encode a single chunk with the cached states of the previous chunks.
+
+        Instead of re-encoding the left context frames with every chunk as in
+        `chunkwise()`, inputs of the last `chunk_size_left` frames to each layer are
+        cached and attended to as memory. Only the current and right context frames
+        are computed. Frames in the right context are not cached.
+
+        Args:
+            xs (FloatTensor): `[B, T_chunk, input_dim]`, where T_chunk is at most
+                chunk_size_current + chunk_size_right
+            xlens (IntTensor): `[B]`
+            use_cache (bool): attend to the cache (start a new segment otherwise)
+        Returns:
+            xs (FloatTensor): `[B, T_chunk', d_model]`, outputs of the current frames
+            xlens (IntTensor): `[B]`
+
+        """
+        _N_l = max(0, self.chunk_size_left // self.subsampling_factor)
+        _N_c = self.chunk_size_current // self.subsampling_factor
+
+        if self.conv is None:
+            xs = self.embed(xs)
+        else:
+            # Path through CNN blocks
+            xs, xlens = self.conv(xs, xlens)
+        bs, qlen = xs.size()[:2]
+        n_cur = min(_N_c, qlen)  # number of frames except for the right context
+
+        if use_cache and self.cache is not None:
+            mems, mlens = self.cache['mems'], self.cache['mlens']
+        else:
+            # NOTE: empty memory is masked out
+            mems, mlens = [xs.new_zeros(bs, _N_l, self.d_model)] * self.n_layers, [0] * bs
+        mlen = mems[0].size(1)
+        xx_mask = make_memory_mask(mlens, mlen, qlen, self.device_id)
+
+        pos_embs = None
+        mems_in = list(mems)
+        if self.pe_type == 'relative':
+            xs = xs * self.scale
+            pos_idxs = torch.arange(mlen + qlen - 1, -1, -1.0, dtype=torch.float)
+            pos_embs = self.pos_emb(pos_idxs, self.device_id)
+        new_mems = [update_memory_cache(mems[0], xs[:, :n_cur])]
+        if self.pe_type != 'relative':
+            # NOTE: inputs to the first layer are cached before the absolute positional
+            # encoding, which is added over [memory; chunk] as in chunkwise encoding
+            xs = self.pos_enc(torch.cat([mems[0], xs], dim=1), scale=True)
+            mems_in[0], xs = xs[:, :mlen], xs[:, mlen:]
+
+        for lth, layer in enumerate(self.layers):
+            if lth > 0:
+                new_mems.append(update_memory_cache(mems[lth], xs[:, :n_cur]))
+            xs = layer(xs, xx_mask, pos_embs=pos_embs, memory=mems_in[lth])
+
+        self.cache = {'mems': new_mems,
+                      'mlens': [min(_N_l, m + n_cur) for m in mlens],
+                      'convs': None}
+
+        return xs[:, :n_cur], xlens.clamp(max=n_cur)
+
 
 class TransformerEncoderBlock(nn.Module):
     """A single layer of the Transformer encoder.
@@ -487,9 +581,9 @@ class TransformerEncoderBlock(nn.Module):
 
         Args:
             xs (FloatTensor): `[B, T, d_model]`
-            xx_mask (ByteTensor): `[B, T (query), T (key)]`
+            xx_mask (ByteTensor): `[B, T (query), mlen + T (key)]`
             pos_embs (LongTensor): `[L, 1, d_model]`
-            memory (FloatTensor): `[B, mlen, d_model]`
+            memory (FloatTensor): `[B, mlen, d_model]`, inputs of the previous frames
             u (FloatTensor): global parameter for relative positional embedding
             v (FloatTensor): global parameter for relative positional embedding
         Returns:
@@ -505,8 +599,13 @@ class TransformerEncoderBlock(nn.Module):
         # self-attention
         residual = xs
         xs = self.norm1(xs)
+        if memory is not None and memory.dim() > 1:
+            memory = self.norm1(memory)  # memory holds layer inputs before normalization
         if self.relative_attention:
             xs, self._xx_aws = self.self_attn(xs, xs, memory, pos_embs, xx_mask, u, v)  # k/q/m
+        elif memory is not None and memory.dim() > 1:
+            key = torch.cat([memory, xs], dim=1)
+            xs, self._xx_aws = self.self_attn(key, key, xs, mask=xx_mask)[:2]  # k/v/q
         else:
             xs, self._xx_aws = self.self_attn(xs, xs, xs, mask=xx_mask)[:2]  # k/v/q
         xs = self.dropout(xs) + residual
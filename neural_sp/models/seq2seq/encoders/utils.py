@@ -31,13 +31,125 @@ def chunkwise(xs, N_l, N_c, N_r):
     bs, xmax, idim = xs.size()
 
     n_chunks = math.ceil(xmax / N_c)
-    xs_tmp = xs.new_zeros(bs, n_chunks, N_l + N_c + N_r, idim)
+    # NOTE: pad once so that the last chunk is also filled up to N_l + N_c + N_r frames
     xs_pad = torch.cat([xs.new_zeros(bs, N_l, idim),
                         xs,
-                        xs.new_zeros(bs, N_r, idim)], dim=1)
-    for chunk_idx, t in enumerate(range(N_l, N_l + xmax, N_c)):
-        xs_chunk = xs_pad[:, t - N_l:t + (N_c + N_r)]
-        xs_tmp[:, chunk_idx, :xs_chunk.size(1), :] = xs_chunk
-    xs = xs_tmp.view(bs * n_chunks, N_l + N_c + N_r, idim)
+                        xs.new_zeros(bs, n_chunks * N_c - xmax + N_r, idim)], dim=1)
+    # overlapping windows are viewed with strides, and copied only once to be contiguous
+    xs = xs_pad.unfold(1, N_l + N_c + N_r, N_c)  # `[B, n_chunks, input_dim, N_l + N_c + N_r]`
+    xs = xs.transpose(2, 3).contiguous().view(bs * n_chunks, N_l + N_c + N_r, idim)
 
     return xs
+
+
+def stitch_chunk_attention(xx_aws, bs, N_l, N_c, xmax):
+    """Place attention weights among the current frames of each chunk on the
+        diagonal blocks of a single matrix over the whole utterance.
+
+    Args:
+        xx_aws (FloatTensor): `[B * n_chunks, H, N_l + N_c + N_r, N_l + N_c + N_r]`
+        bs (int): batch size
+        N_l (int): number of frames for left context
+        N_c (int): number of frames for current context
+        xmax (int): number of frames in the utterance
+    Returns:
+        xx_aws (FloatTensor): `[B, H, xmax, xmax]`
+
+    """
+    n_chunks = xx_aws.size(0) // bs
+    n_heads = xx_aws.size(1)
+    xx_aws = xx_aws[:, :, N_l:N_l + N_c, N_l:N_l + N_c]
+    xx_aws = xx_aws.contiguous().view(bs, n_chunks, n_heads, N_c, N_c)
+    xx_aws_center = xx_aws.new_zeros(bs, n_heads, n_chunks, N_c, n_chunks, N_c)
+    idx = torch.arange(n_chunks, device=xx_aws.device)
+    # NOTE: the dimension of advanced indices comes first
+    xx_aws_center[:, :, idx, :, idx] = xx_aws.transpose(0, 1)
+    xx_aws_center = xx_aws_center.view(bs, n_heads, n_chunks * N_c, n_chunks * N_c)
+    return xx_aws_center[:, :, :xmax, :xmax]
+
+
+def make_memory_mask(mlens, mlen, qlen, device_id=-1):
+    """Make a self-attention mask for memory of a fixed length.
+
+    Memory is filled from the right, and the leftmost `mlen - mlens[b]` frames are masked out.
+
+    Args:
+        mlens (list): `[B]`, number of valid frames in memory
+        mlen (int): length of memory
+        qlen (int): number of query frames
+        device_id (int):
+    Returns:
+        mask (ByteTensor): `[B, qlen, mlen + qlen]` (None if no frames are padded)
+
+    """
+    if all([m == mlen for m in mlens]):
+        return None
+    mask = torch.ones(len(mlens), qlen, mlen + qlen, dtype=torch.uint8)
+    for b, m in enumerate(mlens):
+        mask[b, :, :mlen - m] = 0
+    if device_id >= 0:
+        mask = mask.cuda(device_id)
+    return mask
+
+
+def concat_memory_cache(caches):
+    """Concatenate streaming caches of Transformer-based encoders in the batch dimension.
+
+    Args:
+        caches (list): length `B`, each of which is a dict (None at the beginning of a segment)
+            mems (list): length `n_layers`, each of which contains `[1, mem_len, d_model]`
+            mlens (list): `[1]`, number of valid frames in memory
+            convs (list): length `n_layers`, each of which contains `[1, d_model, n_frames]`
+                (None if not used)
+    Returns:
+        cache (dict): caches concatenated in the batch dimension, None if all caches are None
+
+    """
+    ref = next((c for c in caches if c is not None), None)
+    if ref is None:
+        return None
+    # NOTE: empty memory is masked out, and zero convolution states are the same as
+    # the left padding in offline encoding
+    mems = [torch.cat([c['mems'][lth] if c is not None else m_ref.new_zeros(m_ref.size())
+                       for c in caches], dim=0)
+            for lth, m_ref in enumerate(ref['mems'])]
+    mlens = sum([c['mlens'] if c is not None else [0] for c in caches], [])
+    convs = None
+    if ref['convs'] is not None:
+        convs = [torch.cat([c['convs'][lth] if c is not None else c_ref.new_zeros(c_ref.size())
+                            for c in caches], dim=0)
+                 for lth, c_ref in enumerate(ref['convs'])]
+    return {'mems': mems, 'mlens': mlens, 'convs': convs}
+
+
+def split_memory_cache(cache, bs):
+    """Split a batched streaming cache of Transformer-based encoders into those of streams.
+
+    Args:
+        cache (dict): batched cache (see `concat_memory_cache()`)
+        bs (int): batch size
+    Returns:
+        caches (list): length `B`, caches with the batch size of 1
+
+    """
+    if cache is None:
+        return [None] * bs
+    return [{'mems': [m[b:b + 1] for m in cache['mems']],
+             'mlens': cache['mlens'][b:b + 1],
+             'convs': None if cache['convs'] is None else [c[b:b + 1] for c in cache['convs']]}
+            for b in range(bs)]
+
+
+def update_memory_cache(mems, xs):
+    """Append inputs of the current frames to memory of a fixed length.
+
+    Args:
+        mems (FloatTensor): `[B, mem_len, d_model]`
+        xs (FloatTensor): `[B, T, d_model]`
+    Returns:
+        mems (FloatTensor): `[B, mem_len, d_model]`
+
+    """
+    mem_len = mems.size(1)
+    mems = torch.cat([mems, xs], dim=1)
+    return mems[:, mems.size(1) - mem_len:].detach()
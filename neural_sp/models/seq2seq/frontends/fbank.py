@@ -0,0 +1,189 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Online log-mel filterbank feature extraction from raw waveforms.
+
+Features are compatible with `compute-fbank-feats` in Kaldi with the configuration
+in `examples/*/s5/conf/fbank.conf` (hamming window, no energy, --snip-edges=true)
+except for dithering, which is disabled for deterministic streaming recognition.
+
+"""
+
+import kaldiio
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EPSILON = np.finfo(np.float32).eps
+
+
+def mel_scale(freq):
+    return 1127. * np.log(1. + freq / 700.)
+
+
+def mel_banks(n_mels, n_fft, sample_rate, low_freq=20., high_freq=0.):
+    """Compute triangular mel filterbanks in the same way as Kaldi.
+
+    Args:
+        n_mels (int): number of mel bins
+        n_fft (int): FFT size
+        sample_rate (int): sampling rate [Hz]
+        low_freq (float): low cutoff frequency [Hz]
+        high_freq (float): high cutoff frequency [Hz] (offset from the Nyquist frequency if <= 0)
+    Returns:
+        banks (np.ndarray): `[n_fft // 2 + 1, n_mels]`
+
+    """
+    nyquist = sample_rate / 2.
+    if high_freq <= 0:
+        high_freq += nyquist
+    mel_low = mel_scale(low_freq)
+    mel_high = mel_scale(high_freq)
+    mel_delta = (mel_high - mel_low) / (n_mels + 1)
+    left = mel_low + np.arange(n_mels) * mel_delta
+    center = left + mel_delta
+    right = center + mel_delta
+
+    # NOTE: the Nyquist bin is not used
+    mel = mel_scale(np.arange(n_fft // 2) * sample_rate / n_fft)[:, None]
+    up = (mel - left) / (center - left)
+    down = (right - mel) / (right - center)
+    banks = np.maximum(0., np.minimum(up, down))
+    banks = np.concatenate([banks, np.zeros((1, n_mels))], axis=0)
+    return banks
+
+
+def load_cmvn(cmvn_path):
+    """Load global CMVN statistics computed by `compute-cmvn-stats` in Kaldi.
+
+    Args:
+        cmvn_path (str): path to the statistics `[2, feat_dim + 1]`
+    Returns:
+        mean (np.ndarray): `[feat_dim]`
+        std (np.ndarray): `[feat_dim]`
+
+    """
+    stats = kaldiio.load_mat(cmvn_path).astype(np.float64)
+    count = stats[0, -1]
+    mean = stats[0, :-1] / count
+    var = np.maximum(stats[1, :-1] / count - mean ** 2, 1e-20)
+    return mean, np.sqrt(var)
+
+
+class OnlineFbank(object):
+    """Incremental log-mel filterbank feature extractor.
+
+    A waveform can be fed in blocks of arbitrary sizes. Samples not covered by
+    complete frames are kept until the next block, so that the output is identical
+    to that of feeding the whole waveform at once.
+
+    Args:
+        sample_rate (int): sampling rate [Hz]
+        n_mels (int): number of mel bins
+        frame_length (float): window length [ms]
+        frame_shift (float): window shift [ms]
+        preemphasis (float): coefficient of the pre-emphasis filter
+        window_type (str): hamming/hanning/povey/rectangular
+        low_freq (float): low cutoff frequency of mel bins [Hz]
+        high_freq (float): high cutoff frequency of mel bins [Hz]
+        cmvn_path (str): path to global CMVN statistics (no normalization if None)
+
+    """
+
+    def __init__(self, sample_rate=16000, n_mels=80, frame_length=25., frame_shift=10.,
+                 preemphasis=0.97, window_type='hamming', low_freq=20., high_freq=0.,
+                 cmvn_path=None):
+
+        super(OnlineFbank, self).__init__()
+
+        self.sample_rate = sample_rate
+        self.n_mels = n_mels
+        self.window_size = int(sample_rate * frame_length / 1000)
+        self.window_shift = int(sample_rate * frame_shift / 1000)
+        self.preemphasis = preemphasis
+        self.n_fft = 1 << (self.window_size - 1).bit_length()
+
+        n = np.arange(self.window_size)
+        a = 2 * np.pi / (self.window_size - 1)
+        if window_type == 'hamming':
+            self.window = 0.54 - 0.46 * np.cos(a * n)
+        elif window_type == 'hanning':
+            self.window = 0.5 - 0.5 * np.cos(a * n)
+        elif window_type == 'povey':
+            self.window = (0.5 - 0.5 * np.cos(a * n)) ** 0.85
+        elif window_type == 'rectangular':
+            self.window = np.ones(self.window_size)
+        else:
+            raise NotImplementedError(window_type)
+
+        self.banks = mel_banks(n_mels, self.n_fft, sample_rate, low_freq, high_freq)
+
+        self.mean, self.std = None, None
+        if cmvn_path is not None:
+            self.mean, self.std = load_cmvn(cmvn_path)
+            assert len(self.mean) == n_mels
+
+        self.reset()
+
+    def reset(self):
+        """Reset the buffer for a new stream."""
+        self.buffer = np.zeros(0, dtype=np.float64)
+
+    def accept_waveform(self, wav):
+        """Extract features of frames completed by a new block of samples.
+
+        Args:
+            wav (np.ndarray): `[n_samples]`, in the scale of 16-bit PCM
+        Returns:
+            feats (np.ndarray): `[n_frames, n_mels]`
+
+        """
+        self.buffer = np.concatenate([self.buffer, np.asarray(wav, dtype=np.float64)])
+        n_frames = 0
+        if len(self.buffer) >= self.window_size:
+            n_frames = 1 + (len(self.buffer) - self.window_size) // self.window_shift
+        if n_frames == 0:
+            return np.zeros((0, self.n_mels), dtype=np.float32)
+
+        idx = np.arange(self.window_size)[None, :] + self.window_shift * np.arange(n_frames)[:, None]
+        frames = self.buffer[idx]
+        # Keep the overlap with the next frame
+        self.buffer = self.buffer[n_frames * self.window_shift:]
+        return self.compute_frames(frames)
+
+    def compute_frames(self, frames):
+        """Compute features of frames.
+
+        Args:
+            frames (np.ndarray): `[n_frames, window_size]`
+        Returns:
+            feats (np.ndarray): `[n_frames, n_mels]`
+
+        """
+        frames = frames - frames.mean(axis=1, keepdims=True)  # remove DC offset
+        frames = np.concatenate([frames[:, :1] * (1 - self.preemphasis),
+                                 frames[:, 1:] - self.preemphasis * frames[:, :-1]], axis=1)
+        frames = frames * self.window
+        power = np.abs(np.fft.rfft(frames, n=self.n_fft, axis=1)) ** 2
+        feats = np.log(np.maximum(power.dot(self.banks), EPSILON))
+        if self.mean is not None:
+            feats = (feats - self.mean) / self.std
+        return feats.astype(np.float32)
+
+    def compute(self, wav):
+        """Extract features of a whole waveform (the buffer is reset).
+
+        Args:
+            wav (np.ndarray): `[n_samples]`
+        Returns:
+            feats (np.ndarray): `[n_frames, n_mels]`
+
+        """
+        self.reset()
+        feats = self.accept_waveform(wav)
+        self.reset()
+        return feats
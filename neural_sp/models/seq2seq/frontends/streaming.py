@@ -29,8 +29,9 @@ class Streaming(object):
         # latency
         self.factor = encoder.subsampling_factor
         self.N_l = encoder.chunk_size_left
-        # self.N_c = getattr(encoder, 'chunk_size_current', -1)  # for Transformer
-        self.N_c = encoder.chunk_size_left  # for Transformer
+        self.N_c = getattr(encoder, 'chunk_size_current', -1)  # for Transformer
+        if self.N_c <= 0:
+            self.N_c = encoder.chunk_size_left  # for LC-BLSTM
         self.N_r = encoder.chunk_size_right
         if self.N_c == 0 and self.N_r == 0:
             # self.N_c = params['lc_chunk_size_left']  # for unidirectional encoder
@@ -76,7 +77,7 @@ class Streaming(object):
 
         is_last_chunk = (j + c - 1) >= len(self.x_whole) - 1
         self.bd_offset = -1  # reset
-        self.n_accum_frames += x_chunk.shape[1]
+        self.n_accum_frames += x_chunk.shape[0]
 
         return x_chunk, is_last_chunk
 
@@ -90,34 +91,74 @@ class Streaming(object):
                 labels are generated above the pre-defined threshold (BLANK_THRESHOLD)
 
         """
-        is_reset = False  # detect the first boundary in the same chunk
-
-        # Segmentation strategy 1:
-        # If any segmentation points are not found in the current chunk,
-        # encoder states will be carried over to the next chunk.
-        # Otherwise, the current chunk is segmented at the point where
-        # n_blanks surpasses the threshold.
-        if self.n_accum_frames >= self.MAX_N_ACCUM_FRAMES:
-            _, topk_ids_chunk = torch.topk(
-                ctc_probs_chunk, k=1, dim=-1, largest=True, sorted=True)
-
-            for j in range(ctc_probs_chunk.size(1)):
-                if topk_ids_chunk[0, j, 0] == self.blank:
-                    self.n_blanks += 1
-                    # print('CTC (T:%d): <blank>' % (self.offset + j * self.factor))
-
-                elif ctc_probs_chunk[0, j, topk_ids_chunk[0, j, 0]] < self.SPIKE_THRESHOLD:
-                    self.n_blanks += 1
-                    # print('CTC (T:%d): <blank>' % (self.offset + j * self.factor))
-
-                else:
-                    self.n_blanks = 0
-                    # print('CTC (T:%d): %s' % (self.offset + j * self.factor,
-                    #                           self.idx2token([topk_ids_chunk[0, j, 0].item()])))
-
-                if not is_reset and self.n_blanks > self.BLANK_THRESHOLD:
-                    self.bd_offset = j  # select the most right blank offset
-                    self.next_start_offset = self.offset + j
-                    is_reset = True
-
+        return ctc_vad_batch([self], ctc_probs_chunk)[0]
+
+
+def detect_blank_runs(ctc_probs, n_blanks, blank, blank_threshold, spike_threshold):
+    """Detect the first frame where successive blank frames exceed a threshold.
+
+    A frame is regarded as blank if the top-1 label is blank or its probability
+    is below spike_threshold. Lengths of blank runs are computed with cumulative
+    sums, and runs continued from the previous chunk are counted.
+
+    Args:
+        ctc_probs (FloatTensor): `[B, T, vocab]`
+        n_blanks (LongTensor): `[B]`, number of successive blank frames at the end of the previous chunk
+        blank (int): index for <blank>
+        blank_threshold (int): threshold of the number of successive blank frames
+        spike_threshold (float): threshold of the probability of non-blank labels
+    Returns:
+        bd_offsets (LongTensor): `[B]`, first frame exceeding blank_threshold (-1 if not found)
+        n_blanks (LongTensor): `[B]`, number of successive blank frames at the end of the chunk
+
+    """
+    topk_probs, topk_ids = ctc_probs.max(dim=-1)
+    is_blank = (topk_ids == blank) | (topk_probs < spike_threshold)  # `[B, T]`
+
+    n_blanks_cum = torch.cumsum(is_blank.long(), dim=1)
+    # number of blank frames before the last non-blank frame
+    n_blanks_cum_last = torch.cummax(n_blanks_cum.masked_fill(is_blank, 0), dim=1)[0]
+    run_lens = n_blanks_cum - n_blanks_cum_last
+    # runs from the beginning of the chunk are continued from the previous chunk
+    is_continued = torch.cumsum((~is_blank).long(), dim=1) == 0
+    run_lens = run_lens + is_continued.long() * n_blanks.unsqueeze(1)
+
+    is_bd = run_lens > blank_threshold
+    bd_offsets = torch.where(is_bd.any(dim=1), is_bd.long().argmax(dim=1),
+                             torch.full_like(n_blanks, -1))
+    return bd_offsets, run_lens[:, -1]
+
+
+def ctc_vad_batch(streamings, ctc_probs):
+    """Voice activity detection with CTC posterior probabilities for a batch of streams.
+
+    Args:
+        streamings (list): length `B`, Streaming of each stream
+        ctc_probs (FloatTensor): `[B, T_chunk, vocab]`
+    Returns:
+        is_reset (list): length `B`, reset encoder/decoder states if successive blank
+            labels are generated above the pre-defined threshold (BLANK_THRESHOLD)
+
+    """
+    # Segmentation strategy 1:
+    # If any segmentation points are not found in the current chunk,
+    # encoder states will be carried over to the next chunk.
+    # Otherwise, the current chunk is segmented at the point where
+    # n_blanks surpasses the threshold.
+    is_reset = [False] * len(streamings)
+    active = [b for b, s in enumerate(streamings) if s.n_accum_frames >= s.MAX_N_ACCUM_FRAMES]
+    if len(active) == 0:
         return is_reset
+
+    s0 = streamings[active[0]]
+    n_blanks = torch.LongTensor([streamings[b].n_blanks for b in active]).to(ctc_probs.device)
+    bd_offsets, n_blanks = detect_blank_runs(ctc_probs[active], n_blanks, s0.blank,
+                                             s0.BLANK_THRESHOLD, s0.SPIKE_THRESHOLD)
+    for i, b in enumerate(active):
+        s = streamings[b]
+        s.n_blanks = n_blanks[i].item()
+        if bd_offsets[i] >= 0:
+            s.bd_offset = bd_offsets[i].item()  # select the most right blank offset
+            s.next_start_offset = s.offset + s.bd_offset
+            is_reset[b] = True
+    return is_reset
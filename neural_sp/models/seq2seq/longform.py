@@ -0,0 +1,178 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Long-form offline decoding with overlapped windows and hypothesis stitching."""
+
+import logging
+import numpy as np
+import torch
+
+from neural_sp.models.torch_utils import np2tensor
+from neural_sp.models.torch_utils import pad_list
+
+logger = logging.getLogger(__name__)
+
+
+def split_windows(n_frames, window, overlap):
+    """Split frames into overlapped windows.
+
+    Windows are shifted by `window - overlap` frames, and the last window is
+    aligned with the end of the input so that every window has the full length.
+
+    Args:
+        n_frames (int): number of input frames
+        window (int): window size [frames]
+        overlap (int): number of frames shared by adjacent windows
+    Returns:
+        windows (list): (start, end) of each window
+        boundaries (list): frame where each window hands over to the next one
+
+    """
+    assert 0 <= overlap < window
+    shift = window - overlap
+    starts = [0]
+    while starts[-1] + window < n_frames:
+        starts.append(starts[-1] + shift)
+    starts[-1] = max(0, min(starts[-1], n_frames - window))
+    windows = [(s, min(s + window, n_frames)) for s in starts]
+    # hand over at the center of the overlapped region
+    boundaries = [(windows[i + 1][0] + windows[i][1]) // 2 for i in range(len(windows) - 1)]
+    return windows, boundaries
+
+
+def stitch_hyps(hyps, timestamps, windows, boundaries):
+    """Stitch hypotheses of overlapped windows.
+
+    Each window keeps tokens whose timestamps fall between the boundaries with its
+    neighbours, so that tokens in overlapped regions are emitted only once.
+
+    Args:
+        hyps (list): hypotheses of windows, each of which is an array of size `[L]`
+        timestamps (list): global timestamps of tokens of each hypothesis [frames]
+        windows (list): (start, end) of each window
+        boundaries (list): frame where each window hands over to the next one
+    Returns:
+        hyp (np.ndarray): `[L]`
+
+    """
+    hyp = []
+    for i in range(len(windows)):
+        left = boundaries[i - 1] if i > 0 else -1
+        right = boundaries[i] if i < len(boundaries) else float('inf')
+        hyp += [token for token, t in zip(hyps[i], timestamps[i]) if left <= t < right]
+    return np.array(hyp, dtype=np.int64)
+
+
+def ctc_timestamps(ctc, eouts, elens, hyps, device_id):
+    """Compute timestamps of tokens in hypotheses by CTC forced alignment.
+
+    Each token is timestamped at the first frame of its CTC spike. Tokens of a
+    hypothesis that cannot be aligned (e.g., an attention-based hypothesis longer
+    than the CTC path allows or containing blank) are spread uniformly instead.
+
+    Args:
+        ctc (CTC): CTC module
+        eouts (FloatTensor): `[B, T, enc_n_units]`
+        elens (IntTensor): `[B]`
+        hyps (list): length `B`, each of which contains arrays of size `[L]`
+        device_id (int): index of the device
+    Returns:
+        timestamps (list): length `B`, each of which contains encoder frame indices of tokens
+
+    """
+    timestamps = [np.linspace(0, elens[b].item(), len(hyps[b]), endpoint=False).astype(np.int64).tolist()
+                  for b in range(len(hyps))]
+    # NOTE: the CTC path needs a blank between repeated tokens
+    n_repeats = [int(np.sum(hyp[1:] == hyp[:-1])) for hyp in hyps]
+    aligned = [b for b in range(len(hyps))
+               if 0 < len(hyps[b]) and ctc.blank not in hyps[b] and len(hyps[b]) + n_repeats[b] <= elens[b]]
+    if len(aligned) == 0:
+        return timestamps
+
+    ys = pad_list([np2tensor(np.array(hyps[b], dtype=np.int64), device_id) for b in aligned], 0)
+    ylens = torch.IntTensor([len(hyps[b]) for b in aligned])
+    logits = ctc.output(eouts[aligned])
+    trigger_points = ctc.forced_aligner.align(logits, elens[aligned].cpu(), ys, ylens)
+    for i, b in enumerate(aligned):
+        timestamps[b] = trigger_points[i, :len(hyps[b])].tolist()
+    return timestamps
+
+
+def decode_longform(model, x, params, idx2token=None):
+    """Decode a long recording by overlapped windows.
+
+    Input features are split into windows of `recog_longform_window` frames that
+    overlap by `recog_longform_overlap` frames. Up to `recog_longform_batch_size`
+    windows are encoded and decoded at once, so that memory and time of global
+    self-attention are bounded by the window size. Hypotheses of windows are
+    timestamped by CTC forced alignment and stitched at the center of overlapped
+    regions.
+
+    Args:
+        model (Speech2Text): ASR model with CTC
+        x (np.ndarray): `[T, input_dim]`
+        params (dict): hyperparameters for decoding (`recog_*`)
+        idx2token (): converter from index to token
+    Returns:
+        hyp (np.ndarray): `[L]`
+
+    """
+    dec = model.dec_fwd
+    assert getattr(dec, 'ctc', None) is not None, 'CTC is required.'
+    factor = model.enc.subsampling_factor * model.n_stacks
+    batch_size = params['recog_longform_batch_size']
+
+    windows, boundaries = split_windows(len(x), params['recog_longform_window'],
+                                        params['recog_longform_overlap'])
+    logger.info('Long-form decoding: %d frames, %d windows' % (len(x), len(windows)))
+
+    hyps, timestamps = [], []
+    with torch.no_grad():
+        for i in range(0, len(windows), batch_size):
+            windows_mb = windows[i:i + batch_size]
+            eout_dict = model.encode([x[s:e] for s, e in windows_mb], 'ys')
+            eouts, elens = eout_dict['ys']['xs'], eout_dict['ys']['xlens']
+            hyps_mb = decode_windows(model, eouts, elens, params, idx2token)
+            hyps_mb = [np.array(hyp, dtype=np.int64) for hyp in hyps_mb]
+            timestamps_mb = ctc_timestamps(dec.ctc, eouts, elens, hyps_mb, model.device_id)
+            for (s, _), hyp, ts in zip(windows_mb, hyps_mb, timestamps_mb):
+                hyps.append(hyp)
+                timestamps.append([s + t * factor for t in ts])
+
+    return stitch_hyps(hyps, timestamps, windows, boundaries)
+
+
+def decode_windows(model, eouts, elens, params, idx2token=None):
+    """Decode encoder outputs of windows in the same way as `Speech2Text.decode()`.
+
+    Forward-backward attention and ensembles are not supported.
+
+    Args:
+        model (Speech2Text): ASR model
+        eouts (FloatTensor): `[B, T, enc_n_units]`
+        elens (IntTensor): `[B]`
+        params (dict): hyperparameters for decoding (`recog_*`)
+        idx2token (): converter from index to token
+    Returns:
+        hyps (list): length `B`, each of which contains arrays of size `[L]` without <eos>
+
+    """
+    dec = model.dec_fwd
+    lm = getattr(model, 'lm_fwd', None)
+    lm_second = getattr(model, 'lm_second', None)
+    if (model.fwd_weight == 0 and model.bwd_weight == 0) or (model.ctc_weight > 0 and params['recog_ctc_weight'] == 1):
+        return dec.decode_ctc(eouts, elens, params, idx2token, lm, lm_second, None, 1)
+    if params['recog_beam_width'] == 1:
+        hyps, _ = dec.greedy(eouts, elens, params['recog_max_len_ratio'], idx2token, exclude_eos=True)
+        return hyps
+
+    ctc_log_probs = None
+    if params['recog_ctc_weight'] > 0:
+        ctc_log_probs = dec.ctc_log_probs(eouts)
+    nbest_hyps, _, _ = dec.beam_search(eouts, elens, params, idx2token,
+                                       lm, lm_second, getattr(model, 'lm_bwd', None), ctc_log_probs,
+                                       1, True)
+    return [nbest_hyps_b[0] for nbest_hyps_b in nbest_hyps]
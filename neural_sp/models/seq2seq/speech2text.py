@@ -14,6 +14,7 @@ import torch
 import torch.nn as nn
 
 from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.datasets.teacher_store import TeacherStore
 from neural_sp.models.base import ModelBase
 from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.seq2seq.decoders.build import build_decoder
@@ -25,6 +26,7 @@ from neural_sp.models.seq2seq.frontends.gaussian_noise import add_gaussian_noise
 from neural_sp.models.seq2seq.frontends.sequence_summary import SequenceSummaryNetwork
 from neural_sp.models.seq2seq.frontends.spec_augment import SpecAugment
 from neural_sp.models.seq2seq.frontends.splicing import splice
+from neural_sp.models.seq2seq.longform import decode_longform
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import tensor2np
 from neural_sp.models.torch_utils import pad_list
@@ -231,7 +233,7 @@ class Speech2Text(ModelBase):
             task (str): all/ys*/ys_sub*
             is_eval (bool): evaluation mode
                 This should be used in inference model for memory efficiency.
-            teacher (Speech2Text): used for knowledge distillation from ASR
+            teacher (Speech2Text or TeacherStore): used for knowledge distillation from ASR
             teacher_lm (RNNLM): used for knowledge distillation from LM
         Returns:
             loss (FloatTensor): `[1]`
@@ -266,7 +268,9 @@ class Speech2Text(ModelBase):
         # for the forward decoder in the main task
         if (self.fwd_weight > 0 or (self.bwd_weight == 0 and self.ctc_weight > 0) or self.mbr_training) and task in ['all', 'ys', 'ys.ctc', 'ys.mbr']:
             teacher_logits = None
-            if teacher is not None:
+            if isinstance(teacher, TeacherStore):
+                teacher_logits = teacher.lookup(batch['utt_ids'], self.device_id)
+            elif teacher is not None:
                 teacher.eval()
                 teacher_logits = teacher.generate_logits(batch)
                 # TODO(hirofumi): label smoothing, scheduled sampling, dropout?
@@ -340,11 +344,11 @@ class Speech2Text(ModelBase):
         eos = next(lm.parameters()).new_zeros(1).fill_(self.eos).long()
         ys = [np2tensor(np.fromiter(y, dtype=np.int64), self.device_id)for y in ys]
         ys_in = pad_list([torch.cat([eos, y], dim=0) for y in ys], self.pad)
-        lmout, _ = lm.decode(ys_in, None)
-        logits = lm.output(lmout)
+        logits, _, _ = lm.decode(ys_in, None)
         return logits
 
-    def encode(self, xs, task='all', use_cache=False, streaming=False):
+    def encode(self, xs, task='all', use_cache=False, streaming=False,
+               lookback=False, lookahead=False):
         """Encode acoustic or text features.
 
         Args:
@@ -352,6 +356,8 @@ class Speech2Text(ModelBase):
             task (str): all/ys*/ys_sub1*/ys_sub2*
             use_cache (bool): use the cached forward encoder state in the previous chunk as the initial state
             streaming (bool): streaming encoding
+            lookback (bool): truncate the left context frames of CNN (only for RNNEncoder)
+            lookahead (bool): truncate the right context frames of CNN (only for RNNEncoder)
         Returns:
             eout_dict (dict):
 
@@ -390,7 +396,11 @@ class Speech2Text(ModelBase):
             # TODO(hirofumi): fix for Transformer
 
         # encoder
-        eout_dict = self.enc(xs, xlens, task.split('.')[0], use_cache, streaming)
+        if lookback or lookahead:
+            eout_dict = self.enc(xs, xlens, task.split('.')[0], use_cache, streaming,
+                                 lookback=lookback, lookahead=lookahead)
+        else:
+            eout_dict = self.enc(xs, xlens, task.split('.')[0], use_cache, streaming)
 
         if self.main_weight < 1 and self.enc_type in ['conv', 'tds', 'gated_conv', 'transformer', 'conv_transformer']:
             for sub in ['sub1', 'sub2']:
@@ -502,6 +512,7 @@ class Speech2Text(ModelBase):
 
                 if is_reset:
                     # Global decoding over the segmented region
+                    # NOTE: chunk-synchronous decoding already has the result of this segment
                     if not params['recog_chunk_sync']:
                         eout = torch.cat(streaming.eout_chunks, dim=1)
                         elens = torch.IntTensor([eout.size(1)])
@@ -514,15 +525,6 @@ class Speech2Text(ModelBase):
                         # print('Offline MoChA (T:%d): %s' %
                         #       (streaming.offset + eout_chunk.size(1) * streaming.factor,
                         #        idx2token(nbest_hyps_id_offline[0][0])))
-                    eout = torch.cat(streaming.eout_chunks, dim=1)
-                    elens = torch.IntTensor([eout.size(1)])
-                    ctc_log_probs = None
-                    nbest_hyps_id_offline, _, _ = self.dec_fwd.beam_search(
-                        eout, elens, global_params, idx2token, lm, lm_second,
-                        ctc_log_probs=ctc_log_probs)
-                    # print('Offline MoChA (T:%d): %s' %
-                    #       (streaming.offset + eout_chunk.size(1) * streaming.factor,
-                    #        idx2token(nbest_hyps_id_offline[0][0])))
 
                     # pick up the best hyp from ended and active hypotheses
                     if not params['recog_chunk_sync']:
@@ -630,6 +632,11 @@ class Speech2Text(ModelBase):
             self.utt_id_prev = utt_ids[0]
 
         self.eval()
+
+        # Long-form decoding with overlapped windows
+        if params['recog_longform_window'] > 0 and dir == 'fwd' and len(ensemble_models) == 0:
+            return [decode_longform(self, x, params, idx2token) for x in xs], None
+
         with torch.no_grad():
             # Encode input features
             if self.input_type == 'speech' and self.mtl_per_batch and 'bwd' in dir:
@@ -657,6 +664,10 @@ class Speech2Text(ModelBase):
             else:
                 assert params['recog_batch_size'] == 1
 
+                # attention weights are required for forward-backward attention and UNK resolution
+                if params['recog_fwd_bwd_attention'] or params['recog_resolving_unk']:
+                    params = dict(params, recog_store_attention=True)
+
                 ctc_log_probs = None
                 if params['recog_ctc_weight'] > 0:
                     ctc_log_probs = self.dec_fwd.ctc_log_probs(eout_dict[task]['xs'])
@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Scheduler of chunks of many live streams for batched streaming encoding."""
+
+from collections import OrderedDict
+import logging
+import torch
+
+from neural_sp.models.seq2seq.frontends.streaming import ctc_vad_batch
+from neural_sp.models.seq2seq.streaming_session import (
+    encode_chunks,
+    StreamingSession
+)
+
+logger = logging.getLogger(__name__)
+
+
+class StreamScheduler(object):
+    """Scheduler of chunks of many live streams for batched streaming encoding.
+
+    Pending chunks of all streams are collected and encoded by one encoder forward
+    per group of chunks with the same shape. Encoder caches (e.g., forward states of
+    LC-BLSTM) are concatenated in the batch dimension before the forward and scattered
+    back to the streams after it. CTC posteriors and CTC-based VAD are also computed
+    for the batch, and beam search is performed in each stream.
+
+    Args:
+        model (Speech2Text): streamable ASR model shared by streams
+        params (dict): hyperparameters for decoding (`recog_*`)
+        idx2token (): converter from index to token
+        max_batch_size (int): maximum number of chunks in one encoder forward
+
+    """
+
+    def __init__(self, model, params, idx2token=None, max_batch_size=64):
+
+        super(StreamScheduler, self).__init__()
+
+        self.model = model
+        self.params = params
+        self.idx2token = idx2token
+        self.max_batch_size = max_batch_size
+        self.sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def open(self, stream_id, frontend=None):
+        """Start a new stream.
+
+        Args:
+            stream_id (str): stream ID
+            frontend (OnlineFbank): feature extractor for `push_waveform()`
+
+        """
+        assert stream_id not in self.sessions, 'Stream %s already exists.' % stream_id
+        self.sessions[stream_id] = StreamingSession(self.model, self.params, self.idx2token,
+                                                    frontend=frontend)
+
+    def push_features(self, stream_id, x):
+        """Buffer a block of input features of a stream.
+
+        Chunks are not encoded until `step()` is called.
+
+        Args:
+            stream_id (str): stream ID
+            x (np.ndarray): `[T_block, input_dim]`
+
+        """
+        self.sessions[stream_id].append_features(x)
+
+    def push_waveform(self, stream_id, wav):
+        """Buffer features of a block of raw samples of a stream.
+
+        Args:
+            stream_id (str): stream ID
+            wav (np.ndarray): `[n_samples]`
+
+        """
+        session = self.sessions[stream_id]
+        assert session.frontend is not None, 'Set frontend.'
+        session.append_features(session.frontend.accept_waveform(wav))
+
+    def partial(self, stream_id):
+        """Return the partial result of a stream (see `StreamingSession.partial()`)."""
+        return self.sessions[stream_id].partial()
+
+    def close(self, stream_id):
+        """Decode the remaining frames of a stream and remove it.
+
+        Returns:
+            hyp (np.ndarray): `[L]`, final result
+
+        """
+        return self.sessions.pop(stream_id).finalize()
+
+    def step(self):
+        """Encode one pending chunk of every ready stream in batches and decode them.
+
+        Returns:
+            stream_ids (list): IDs of streams whose chunk was processed
+
+        """
+        # Group chunks by the shape for batching
+        groups = OrderedDict()
+        for stream_id, session in self.sessions.items():
+            if not session.ready():
+                continue
+            x_chunk, lookback, lookahead, is_last_chunk = session.next_chunk()
+            key = (len(x_chunk), lookback, lookahead)
+            if key not in groups:
+                groups[key] = []
+            groups[key].append((stream_id, x_chunk))
+
+        stream_ids = []
+        for (_, lookback, lookahead), chunks in groups.items():
+            for i in range(0, len(chunks), self.max_batch_size):
+                chunks_batch = chunks[i:i + self.max_batch_size]
+                sessions = [self.sessions[stream_id] for stream_id, _ in chunks_batch]
+                eouts = encode_chunks(self.model, sessions,
+                                      [x_chunk for _, x_chunk in chunks_batch],
+                                      lookback, lookahead)
+                with torch.no_grad():
+                    # NOTE: the right context is not emitted
+                    eouts = eouts[:, :sessions[0].N_c_out]
+                    ctc_log_probs = self.model.dec_fwd.ctc_log_probs(eouts)
+                    is_reset = [False] * len(sessions)
+                    if self.params['recog_ctc_vad']:
+                        is_reset = ctc_vad_batch([session.streaming for session in sessions],
+                                                 torch.exp(ctc_log_probs))
+                for b, session in enumerate(sessions):
+                    session.decode_chunk(eouts[b:b + 1], is_last_chunk=False,
+                                         ctc_log_probs_chunk=ctc_log_probs[b:b + 1],
+                                         is_reset=is_reset[b])
+                stream_ids += [stream_id for stream_id, _ in chunks_batch]
+        return stream_ids
+
+    def run(self):
+        """Process all pending chunks.
+
+        Returns:
+            n_chunks (dict): number of processed chunks per stream
+
+        """
+        n_chunks = {}
+        while True:
+            stream_ids = self.step()
+            if len(stream_ids) == 0:
+                break
+            for stream_id in stream_ids:
+                n_chunks[stream_id] = n_chunks.get(stream_id, 0) + 1
+        return n_chunks
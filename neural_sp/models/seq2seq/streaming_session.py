@@ -0,0 +1,297 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Stateful session for incremental streaming decoding."""
+
+import logging
+import numpy as np
+import torch
+
+from neural_sp.models.seq2seq.encoders.rnn import RNNEncoder
+from neural_sp.models.seq2seq.frontends.streaming import Streaming
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingSession(object):
+    """Stateful session for incremental streaming decoding.
+
+    Input features are pushed block by block. Every time enough frames for the
+    next chunk are buffered, only the new chunk is encoded with the cached encoder
+    state and decoded with the beam carried over from the previous chunks.
+    Segments detected by CTC-based VAD are committed without global re-decoding.
+    The encoder cache is kept in each session, so that sessions can share the model
+    and their chunks can be encoded at once (see `StreamScheduler`).
+
+    Decoding is performed by the chunk-synchronous beam search of MoChA if
+    `recog_chunk_sync` is True, and by CTC prefix beam search otherwise.
+
+    Args:
+        model (Speech2Text): streamable ASR model
+        params (dict): hyperparameters for decoding (`recog_*`)
+        idx2token (): converter from index to token
+        frontend (OnlineFbank): feature extractor for `push_waveform()`
+
+    """
+
+    def __init__(self, model, params, idx2token=None, frontend=None):
+
+        super(StreamingSession, self).__init__()
+
+        assert model.input_type == 'speech'
+        assert getattr(model, 'dec_fwd', None) is not None
+        assert getattr(model.dec_fwd, 'ctc', None) is not None, 'CTC is required.'
+        if params['recog_chunk_sync']:
+            assert getattr(model.dec_fwd, 'attn_type', None) == 'mocha', 'Chunk-synchronous decoding requires MoChA.'
+
+        self.model = model
+        self.enc = model.enc
+        self.dec = model.dec_fwd
+        self.params = params
+        self.idx2token = idx2token
+        self.frontend = frontend
+        self.chunk_sync = params['recog_chunk_sync']
+        self.lm = getattr(model, 'lm_fwd', None)
+
+        # CTC-based VAD
+        self.streaming = Streaming(None, params, self.enc, idx2token)
+        self.is_ctc_vad = params['recog_ctc_vad']
+
+        # chunk sizes in input frames (before frame stacking)
+        self.n_stacks = model.n_stacks
+        self.factor = self.enc.subsampling_factor * self.n_stacks
+        self.N_c = self.streaming.N_c * self.n_stacks
+        self.N_r = self.streaming.N_r * self.n_stacks
+        self.N_c_out = -(-self.N_c // self.factor)  # number of encoder outputs per chunk
+        self.context = 0
+        if getattr(self.enc, 'conv', None) is not None and isinstance(self.enc, RNNEncoder):
+            self.context = self.enc.conv.n_frames_context * self.n_stacks
+
+        self.reset()
+
+    def reset(self):
+        """Reset all states for a new stream."""
+        self.x_buf = None
+        self.buf_offset = 0  # global index of the first buffered frame
+        self.n_frames = 0  # number of pushed frames
+        self.offset = 0  # global index of the first frame of the next chunk
+        self.committed = []
+        self._reset_segment()
+
+    def _reset_segment(self):
+        """Reset encoder and decoder states at a segment boundary."""
+        self.enc_cache = None
+        self.streaming.reset()
+        # CTC prefix beam search
+        self.beam = self.dec.ctc.initial_beam()
+        # chunk-synchronous attention decoding
+        self.hyps = None
+        self.ctc_prefix_scorer = None
+        self.best_hyp_sync = []
+
+    def append_features(self, x):
+        """Buffer a block of input features without decoding.
+
+        Args:
+            x (np.ndarray): `[T_block, input_dim]`
+
+        """
+        self.x_buf = x if self.x_buf is None else np.concatenate([self.x_buf, x], axis=0)
+        self.n_frames += len(x)
+
+    def ready(self):
+        """Return True if the next chunk (including the right context) is buffered."""
+        # NOTE: wait for one more frame after the lookahead frames of CNN
+        # so that they are truncated in the same way as in offline encoding
+        margin = 2 if self.context > 0 else 0
+        return self.n_frames >= self.offset + self.N_c + self.N_r + self.context + margin
+
+    def push_features(self, x):
+        """Push a block of input features and decode all completed chunks.
+
+        Args:
+            x (np.ndarray): `[T_block, input_dim]`
+        Returns:
+            hyp (np.ndarray): `[L]`, partial result (see `partial()`)
+
+        """
+        self.append_features(x)
+        while self.ready():
+            self._step()
+        return self.partial()
+
+    def push_waveform(self, wav):
+        """Push a block of raw samples and decode all completed chunks.
+
+        Args:
+            wav (np.ndarray): `[n_samples]`
+        Returns:
+            hyp (np.ndarray): `[L]`, partial result (see `partial()`)
+
+        """
+        assert self.frontend is not None, 'Set frontend.'
+        return self.push_features(self.frontend.accept_waveform(wav))
+
+    def partial(self):
+        """Return the committed tokens and the current best hypothesis.
+
+        Returns:
+            hyp (np.ndarray): `[L]`
+
+        """
+        return np.array(self.committed + self._best_hyp(), dtype=np.int64)
+
+    def finalize(self):
+        """Decode the remaining frames and close the stream.
+
+        Returns:
+            hyp (np.ndarray): `[L]`, final result
+            The session is reset for the next stream.
+
+        """
+        # NOTE: the rightmost frames less than the subsampling factor of CNN are dropped
+        # as in offline encoding
+        min_n_frames = self.factor if getattr(self.enc, 'conv', None) is not None else 1
+        while self.n_frames - self.offset >= min_n_frames:
+            self._step(final=True)
+        self.committed += self._best_hyp()
+        hyp = np.array(self.committed, dtype=np.int64)
+        self.reset()
+        if self.frontend is not None:
+            self.frontend.reset()
+        return hyp
+
+    def _best_hyp(self):
+        if self.chunk_sync:
+            return list(self.best_hyp_sync)
+        return list(self.beam[0]['hyp'][1:])
+
+    def _step(self, final=False):
+        x_chunk, lookback, lookahead, is_last_chunk = self.next_chunk(final)
+        eout_chunk = encode_chunks(self.model, [self], [x_chunk], lookback, lookahead)
+        self.decode_chunk(eout_chunk, is_last_chunk)
+
+    def next_chunk(self, final=False):
+        """Cut out the next chunk from the buffer.
+
+        Args:
+            final (bool): no more features are pushed
+        Returns:
+            x_chunk (np.ndarray): `[T_chunk, input_dim]`
+            lookback (bool): the chunk has lookback frames for CNN
+            lookahead (bool): the chunk has lookahead frames for CNN
+            is_last_chunk (bool): the chunk reaches the end of the stream
+
+        """
+        start = max(0, self.offset - self.context)
+        end = self.offset + self.N_c + self.N_r + self.context
+        x_chunk = self.x_buf[start - self.buf_offset:end - self.buf_offset]
+        lookback = self.context > 0 and start > 0
+        lookahead = self.context > 0 and (not final or end < self.n_frames - 1)
+        is_last_chunk = final and self.offset + self.N_c >= self.n_frames
+        self.streaming.bd_offset = -1
+        self.streaming.n_accum_frames += len(x_chunk)
+        return x_chunk, lookback, lookahead, is_last_chunk
+
+    def decode_chunk(self, eout_chunk, is_last_chunk, ctc_log_probs_chunk=None, is_reset=None):
+        """Decode encoder outputs of the chunk cut out by `next_chunk()`.
+
+        Args:
+            eout_chunk (FloatTensor): `[1, T_chunk, enc_units]`
+            is_last_chunk (bool): the chunk reaches the end of the stream
+            ctc_log_probs_chunk (FloatTensor): `[1, T_chunk, vocab]`,
+                computed from eout_chunk if None
+            is_reset (bool): result of CTC-based VAD, performed in this session if None
+
+        """
+        with torch.no_grad():
+            # NOTE: the right context is not emitted
+            eout_chunk = eout_chunk[:, :self.N_c_out]
+
+            if ctc_log_probs_chunk is None:
+                ctc_log_probs_chunk = self.dec.ctc_log_probs(eout_chunk)
+            if is_reset is None:
+                is_reset = False
+                if self.is_ctc_vad:
+                    is_reset = self.streaming.ctc_vad(torch.exp(ctc_log_probs_chunk))
+            if is_reset and not is_last_chunk:
+                eout_chunk = eout_chunk[:, :self.streaming.bd_offset + 1]
+                ctc_log_probs_chunk = ctc_log_probs_chunk[:, :self.streaming.bd_offset + 1]
+
+            if self.chunk_sync:
+                is_eos = self._decode_chunk_sync(eout_chunk, ctc_log_probs_chunk)
+                if is_eos and not is_reset:
+                    # segmentation by <eos> from the decoder
+                    self.streaming.bd_offset = eout_chunk.size(1) - 1
+                    is_reset = True
+            else:
+                self.beam = self.dec.ctc.beam_search_chunk(
+                    ctc_log_probs_chunk[0], self.beam, self.params, self.lm)
+
+        hop = self.N_c
+        if is_reset:
+            self.committed += self._best_hyp()
+            self._reset_segment()
+            # next chunk will start from the frame next to the boundary
+            if not is_last_chunk and self.streaming.bd_offset >= 0:
+                hop = min(hop, (self.streaming.bd_offset + 1) * self.factor)
+        self.offset += hop
+
+        # Release frames no longer needed
+        n_release = max(0, self.offset - self.context) - self.buf_offset
+        self.x_buf = self.x_buf[n_release:]
+        self.buf_offset += n_release
+
+    def _decode_chunk_sync(self, eout_chunk, ctc_log_probs_chunk):
+        """Chunk-synchronous attention decoding over a new chunk.
+
+        Args:
+            eout_chunk (FloatTensor): `[1, T_chunk, enc_units]`
+            ctc_log_probs_chunk (FloatTensor): `[1, T_chunk, vocab]`
+        Returns:
+            is_eos (bool): <eos> is emitted from the best hypothesis
+
+        """
+        # NOTE: the CTC prefix scorer is kept in the decoder during the beam search,
+        # so it is swapped with that of this session
+        self.dec.ctc_prefix_scorer = self.ctc_prefix_scorer
+        end_hyps, self.hyps, _ = self.dec.beam_search_chunk_sync(
+            eout_chunk, self.params, self.idx2token, self.lm,
+            ctc_log_probs=ctc_log_probs_chunk if self.params['recog_ctc_weight'] > 0 else None,
+            hyps=self.hyps, state_carry_over=False,
+            ignore_eos=getattr(self.enc, 'rnn_type', None) in ['lstm', 'conv_lstm'])
+        self.ctc_prefix_scorer = self.dec.ctc_prefix_scorer
+
+        merged_hyps = sorted(end_hyps + self.hyps, key=lambda x: x['score'], reverse=True)
+        if len(merged_hyps) == 0:
+            return False
+        best_hyp = list(merged_hyps[0]['hyp'][1:])
+        is_eos = len(best_hyp) > 0 and best_hyp[-1] == self.model.eos
+        self.best_hyp_sync = best_hyp[:-1] if is_eos else best_hyp
+        return is_eos
+
+
+def encode_chunks(model, sessions, x_chunks, lookback=False, lookahead=False):
+    """Encode chunks of streams at once with the encoder cache of each stream.
+
+    Args:
+        model (Speech2Text): ASR model shared by sessions
+        sessions (list): length `B`, StreamingSession
+        x_chunks (list): length `B`, each of which contains `[T_chunk, input_dim]`
+            of the same length
+        lookback (bool): the chunks have lookback frames for CNN
+        lookahead (bool): the chunks have lookahead frames for CNN
+    Returns:
+        eouts (FloatTensor): `[B, T_chunk', enc_units]`
+
+    """
+    model.enc.set_cache(model.enc.concat_cache([s.enc_cache for s in sessions]))
+    with torch.no_grad():
+        eouts = model.encode(x_chunks, 'ys', use_cache=True, streaming=True,
+                             lookback=lookback, lookahead=lookahead)['ys']['xs']
+    for s, cache in zip(sessions, model.enc.split_cache(model.enc.get_cache(), len(sessions))):
+        s.enc_cache = cache
+    return eouts
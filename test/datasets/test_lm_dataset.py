@@ -0,0 +1,184 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for the LM dataset."""
+
+import glob
+import importlib
+import numpy as np
+import os
+import pytest
+
+
+VOCAB = 20  # including <blank>, <unk>, <eos> and <pad>
+EOS = 2
+
+
+def make_dataset(tmp_path, n_utts=30, seed=0, tsv_name='train.tsv'):
+    """Write a dataset tsv file with random token IDs and a word dictionary."""
+    rng = np.random.RandomState(seed)
+    with open(str(tmp_path / 'dict.txt'), 'w') as f:
+        for i, w in enumerate(['<unk>', '<eos>', '<pad>'] + ['w%d' % i for i in range(VOCAB - 4)]):
+            f.write('%s %d\n' % (w, i + 1))
+
+    records = {}
+    for i in rng.permutation(n_utts):
+        utt_id = 'spk%d_%04d' % (i % 3, i)
+        records[utt_id] = rng.randint(4, VOCAB, rng.randint(1, 9)).tolist()
+    with open(str(tmp_path / tsv_name), 'w') as f:
+        f.write('\t'.join(['utt_id', 'speaker', 'feat_path', 'xlen', 'xdim',
+                           'text', 'token_id', 'ylen', 'ydim']) + '\n')
+        for utt_id, token_ids in records.items():
+            text = ' '.join(['w%d' % (i - 4) for i in token_ids])
+            f.write('\t'.join([utt_id, utt_id.split('_')[0], '', '0', '0', text,
+                               ' '.join(map(str, token_ids)), str(len(token_ids)), str(VOCAB)]) + '\n')
+    return records
+
+
+def reference_batches(records, batch_size, bptt, backward, is_test, min_n_tokens):
+    """Mini-batches of one epoch from a single concatenated sentence reshaped into `batch_size` rows."""
+    concat_ids = []
+    utt_ids = sorted(records.keys())
+    if backward:
+        utt_ids = utt_ids[::-1]
+    for utt_id in utt_ids:
+        ylen = len(records[utt_id])
+        if (is_test and ylen > 0) or (not is_test and ylen >= min_n_tokens):
+            concat_ids += [EOS] + records[utt_id]
+    concat_ids += [EOS]
+    concat_ids = concat_ids[:len(concat_ids) // batch_size * batch_size]
+    concat_ids = np.array(concat_ids).reshape((batch_size, -1))
+
+    batches = []
+    offset = 0
+    while True:
+        batches.append(concat_ids[:, offset:offset + bptt])
+        offset += bptt - 1
+        if (offset + 1) * batch_size >= concat_ids.size:
+            break
+    return batches
+
+
+def epoch_batches(dataset):
+    batches = []
+    while True:
+        ys, is_new_epoch = dataset.next()
+        batches.append(ys)
+        if is_new_epoch:
+            break
+    return batches
+
+
+def make_args(**kwargs):
+    args = dict(
+        unit='word',
+        batch_size=3,
+        bptt=5,
+        min_n_tokens=3,
+        is_test=False,
+        shuffle=False,
+        backward=False,
+    )
+    args.update(kwargs)
+    return args
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'batch_size': 1}),
+        ({'batch_size': 4, 'bptt': 2}),
+        ({'bptt': 50}),
+        ({'backward': True}),
+        ({'is_test': True}),
+        ({'is_test': True, 'backward': True}),
+        ({'min_n_tokens': 1}),
+    ]
+)
+def test_batch_parity(tmp_path, args):
+    args = make_args(**args)
+    records = make_dataset(tmp_path)
+
+    module = importlib.import_module('neural_sp.datasets.lm')
+    for token_stream_dir in [False, str(tmp_path / 'stream'), str(tmp_path / 'stream')]:
+        dataset = module.Dataset(tsv_path=str(tmp_path / 'train.tsv'),
+                                 dict_path=str(tmp_path / 'dict.txt'),
+                                 token_stream_dir=token_stream_dir,
+                                 **args)
+        batches_ref = reference_batches(records, args['batch_size'], args['bptt'],
+                                        args['backward'], args['is_test'], args['min_n_tokens'])
+        # NOTE: consecutive mini-batches share one token
+        assert len(dataset) == args['batch_size'] * (sum([ys.shape[1] - 1 for ys in batches_ref]) + 1)
+        # two epochs without shuffling are identical
+        for _ in range(2):
+            batches = epoch_batches(dataset)
+            assert len(batches) == len(batches_ref)
+            for ys, ys_ref in zip(batches, batches_ref):
+                assert np.array_equal(ys, ys_ref)
+
+
+def test_shuffle(tmp_path):
+    records = make_dataset(tmp_path)
+    sents = sorted([token_ids for token_ids in records.values() if len(token_ids) >= 2])
+
+    module = importlib.import_module('neural_sp.datasets.lm')
+    dataset = module.Dataset(tsv_path=str(tmp_path / 'train.tsv'),
+                             dict_path=str(tmp_path / 'dict.txt'),
+                             **make_args(batch_size=1, min_n_tokens=2, shuffle=True))
+    orders = []
+    for _ in range(3):
+        orders.append(dataset.order.copy())
+        batches = epoch_batches(dataset)
+        # restore the stream from overlapping mini-batches
+        stream = np.concatenate([batches[0][0]] + [ys[0, 1:] for ys in batches[1:]])
+        assert stream[0] == EOS and stream[-1] == EOS
+        boundaries = np.where(stream == EOS)[0]
+        sents_epoch = [stream[s + 1:e].tolist() for s, e in zip(boundaries[:-1], boundaries[1:])]
+        assert sorted(sents_epoch) == sents
+    assert any(not np.array_equal(orders[0], order) for order in orders[1:])
+
+
+def test_token_stream_cache(tmp_path):
+    module = importlib.import_module('neural_sp.datasets.lm')
+    stream_dir = str(tmp_path / 'stream')
+    tsv_path = str(tmp_path / 'train.tsv')
+    dict_path = str(tmp_path / 'dict.txt')
+    args = make_args()
+
+    def load(records):
+        dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path,
+                                 token_stream_dir=stream_dir, **args)
+        batches_ref = reference_batches(records, args['batch_size'], args['bptt'],
+                                        args['backward'], args['is_test'], args['min_n_tokens'])
+        batches = epoch_batches(dataset)
+        assert len(batches) == len(batches_ref)
+        for ys, ys_ref in zip(batches, batches_ref):
+            assert np.array_equal(ys, ys_ref)
+        return len(glob.glob(os.path.join(stream_dir, '*.offsets.npy')))
+
+    records = make_dataset(tmp_path, seed=0)
+    assert load(records) == 1
+    # the same stream is reused
+    assert load(records) == 1
+
+    # modify the tsv file
+    mtime = os.path.getmtime(tsv_path)
+    records = make_dataset(tmp_path, seed=1)
+    os.utime(tsv_path, (mtime + 10, mtime + 10))
+    assert load(records) == 2
+
+    # modify the dictionary
+    key = module.token_stream_key(tsv_path, dict_path, 'word', None, False)
+    with open(dict_path, 'a') as f:
+        f.write('w%d %d\n' % (VOCAB - 4, VOCAB))
+    os.utime(dict_path, (mtime + 20, mtime + 20))
+    assert module.token_stream_key(tsv_path, dict_path, 'word', None, False) != key
+    assert load(records) == 3
+
+    # another tsv file of the same name in a different directory
+    os.makedirs(str(tmp_path / 'other'))
+    records_other = make_dataset(tmp_path / 'other', seed=2)
+    tsv_path = str(tmp_path / 'other' / 'train.tsv')
+    os.utime(tsv_path, (mtime + 20, mtime + 20))
+    assert load(records_other) == 4
@@ -3,8 +3,10 @@
 
 """Test for attention-based RNN decoder."""
 
+import argparse
 import importlib
 import numpy as np
+import pandas as pd
 import pytest
 import torch
 
@@ -136,3 +138,366 @@ def test_forward(args):
     assert loss.size(0) == 1
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+@pytest.mark.parametrize("topk", [VOCAB, 3])
+def test_forward_teacher_store(tmp_path, topk):
+    args = make_args(distillation_weight=0.5)
+
+    batch_size = 4
+    emax = 40
+    device_id = -1
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([len(x) for x in eouts])
+    eouts = pad_list([np2tensor(x, device_id).float() for x in eouts], 0.)
+
+    ylens = [4, 5, 3, 7]
+    ys = [np.random.randint(0, VOCAB, ylen).astype(np.int32) for ylen in ylens]
+    utt_ids = ['utt%d' % b for b in range(batch_size)]
+    teacher_logits = torch.randn(batch_size, max(ylens) + 1, VOCAB)
+
+    # dump teacher outputs of two mini-batches
+    module_store = importlib.import_module('neural_sp.datasets.teacher_store')
+    writer = module_store.TeacherStoreWriter(str(tmp_path), topk)
+    writer.add(utt_ids[2:], teacher_logits[2:], [ylen + 1 for ylen in ylens[2:]])
+    writer.add(utt_ids[:2], teacher_logits[:2], [ylen + 1 for ylen in ylens[:2]])
+    writer.close()
+    store = module_store.TeacherStore(str(tmp_path))
+    assert len(store) == batch_size
+    topk_ids, topk_log_probs = store.lookup(utt_ids)
+    assert topk_ids.size() == (batch_size, max(ylens) + 1, topk)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec.eval()
+    with torch.no_grad():
+        loss, _ = dec(eouts, elens, ys, task='all', teacher_logits=(topk_ids, topk_log_probs))
+        assert loss.item() >= 0
+        if topk == VOCAB:
+            # top-k covering the vocabulary is equivalent to the online teacher
+            loss_ref, _ = dec(eouts, elens, ys, task='all', teacher_logits=teacher_logits)
+            assert abs(loss.item() - loss_ref.item()) < 1e-3
+
+
+def make_decode_params(**kwargs):
+    args = dict(
+        recog_beam_width=4,
+        recog_ctc_weight=0.0,
+        recog_max_len_ratio=1.0,
+        recog_min_len_ratio=0.0,
+        recog_length_penalty=0.0,
+        recog_coverage_penalty=0.0,
+        recog_coverage_threshold=0.0,
+        recog_length_norm=False,
+        recog_lm_weight=0.0,
+        recog_lm_second_weight=0.0,
+        recog_lm_bwd_weight=0.0,
+        recog_gnmt_decoding=False,
+        recog_eos_threshold=1.0,
+        recog_asr_state_carry_over=False,
+        recog_lm_state_carry_over=False,
+        recog_softmax_smoothing=1.0,
+        recog_store_attention=False,
+        recog_beam_margin=0.0,
+        recog_end_detect=False,
+        recog_ctc_max_len_ratio=0.0,
+        recog_time_budget=0.0,
+        recog_lm_state_cache_size=0,
+        recog_lm_n_cands=0,
+    )
+    args.update(kwargs)
+    return args
+
+
+def make_lm(lm_type, recog_mem_len=0):
+    if lm_type == 'transformer':
+        args = dict(lm_type='transformer', transformer_attn_type='scaled_dot',
+                    transformer_n_heads=4, n_layers=2, transformer_d_model=32, transformer_d_ff=64,
+                    transformer_layer_norm_eps=1e-12, transformer_ffn_activation='relu',
+                    transformer_pe_type='add', vocab=VOCAB,
+                    dropout_in=0.1, dropout_hidden=0.1, dropout_att=0.1, dropout_layer=0.0,
+                    lsm_prob=0.0, transformer_param_init='xavier_uniform', mem_len=0, recog_mem_len=0,
+                    adaptive_softmax=False, tie_embedding=False)
+        module = importlib.import_module('neural_sp.models.lm.transformerlm')
+        return module.TransformerLM(argparse.Namespace(**args))
+    if lm_type == 'transformer_xl':
+        args = dict(lm_type='transformer_xl', transformer_n_heads=4, n_layers=2,
+                    transformer_d_model=32, transformer_d_ff=64,
+                    transformer_layer_norm_eps=1e-12, transformer_ffn_activation='relu', vocab=VOCAB,
+                    dropout_in=0.1, dropout_hidden=0.1, dropout_att=0.1, dropout_layer=0.0,
+                    lsm_prob=0.0, transformer_param_init='xavier_uniform', mem_len=0, bptt=10,
+                    recog_mem_len=recog_mem_len, zero_center_offset=False,
+                    adaptive_softmax=False, tie_embedding=False)
+        module = importlib.import_module('neural_sp.models.lm.transformer_xl')
+        return module.TransformerXL(argparse.Namespace(**args))
+    if 'gated_conv' in lm_type:
+        args = dict(lm_type=lm_type, n_units=32, n_projs=0, n_layers=2, kernel_size=3, emb_dim=16,
+                    vocab=VOCAB, dropout_in=0.1, dropout_hidden=0.1, lsm_prob=0.0, param_init=0.1,
+                    adaptive_softmax=False, tie_embedding=False)
+        module = importlib.import_module('neural_sp.models.lm.gated_convlm')
+        return module.GatedConvLM(argparse.Namespace(**args))
+    args = dict(lm_type=lm_type, n_units=32, n_projs=0, n_layers=2, residual=False, use_glu=False,
+                n_units_null_context=0, bottleneck_dim=32, emb_dim=16, vocab=VOCAB,
+                dropout_in=0.1, dropout_hidden=0.1, lsm_prob=0.0, param_init=0.1,
+                adaptive_softmax=False, tie_embedding=False)
+    module = importlib.import_module('neural_sp.models.lm.rnnlm')
+    return module.RNNLM(argparse.Namespace(**args))
+
+
+@pytest.mark.parametrize(
+    "args, params", [
+        ({'attn_type': 'location'}, {}),
+        ({'attn_type': 'add'}, {}),
+        ({'attn_type': 'luong_concat'}, {}),
+        ({'attn_type': 'gmm', 'gmm_attn_n_mixtures': 5}, {}),
+        ({'attn_type': 'add', 'attn_n_heads': 4}, {}),
+        ({'attn_type': 'mocha', 'mocha_chunk_size': 4}, {}),
+        # coverage penalty
+        ({'attn_type': 'location'}, {'recog_coverage_penalty': 0.5}),
+        ({'attn_type': 'location'}, {'recog_coverage_penalty': 0.5, 'recog_coverage_threshold': 0.1}),
+        ({'attn_type': 'location'}, {'recog_coverage_penalty': 0.5, 'recog_gnmt_decoding': True}),
+        # attention weights for plotting
+        ({'attn_type': 'location'}, {'recog_store_attention': True}),
+        # pruning and early stopping
+        ({'attn_type': 'location'}, {'recog_beam_margin': 1.0}),
+        ({'attn_type': 'location'}, {'recog_end_detect': True}),
+        ({'attn_type': 'location'}, {'recog_time_budget': 1e-6}),
+    ]
+)
+def test_decoding(args, params):
+    args = make_args(**args)
+    params = make_decode_params(**params)
+
+    batch_size = 2
+    emax = 20
+    device_id = -1
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([emax, emax - 4])
+    eouts = pad_list([np2tensor(x, device_id).float() for x in eouts], 0.)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec.eval()
+
+    with torch.no_grad():
+        nbest_hyps, aws, _ = dec.beam_search(eouts, elens, params, nbest=params['recog_beam_width'])
+    assert len(nbest_hyps) == batch_size
+    for b in range(batch_size):
+        assert 1 <= len(nbest_hyps[b]) <= params['recog_beam_width']
+        if params['recog_store_attention']:
+            assert aws[b].shape == (1, len(nbest_hyps[b][0]), elens[b])
+        else:
+            assert aws[b] is None
+    assert dec.beam_stats['n_utts'] == batch_size
+    assert dec.beam_stats['max_active_hyps'] <= params['recog_beam_width']
+
+
+@pytest.mark.parametrize(
+    "lm_type, params", [
+        # prefix-keyed LM state cache
+        ('lstm', {'recog_lm_state_cache_size': 100}),
+        ('transformer', {'recog_lm_state_cache_size': 100}),
+        ('gated_conv_custom', {'recog_lm_state_cache_size': 100}),
+        # candidate-restricted LM scoring (ignored for the full softmax)
+        ('lstm', {'recog_lm_n_cands': 4}),
+        ('transformer', {'recog_lm_n_cands': 4}),
+        ('gated_conv_custom', {'recog_lm_n_cands': 4}),
+        ('lstm', {'recog_lm_n_cands': 4, 'recog_lm_state_cache_size': 100}),
+    ]
+)
+def test_decoding_lm(lm_type, params):
+    args = make_args()
+
+    batch_size = 2
+    emax = 20
+    device_id = -1
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([emax, emax - 4])
+    eouts = pad_list([np2tensor(x, device_id).float() for x in eouts], 0.)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec.eval()
+    lm = make_lm(lm_type)
+    # NOTE: use double precision to avoid flipping near-tie hypotheses by rounding errors
+    dec.double()
+    lm.double()
+    eouts = eouts.double()
+
+    with torch.no_grad():
+        params_ref = make_decode_params(recog_lm_weight=0.5)
+        nbest_hyps_ref, _, scores_ref = dec.beam_search(eouts, elens, params_ref, lm=lm,
+                                                        nbest=params_ref['recog_beam_width'])
+        params = make_decode_params(recog_lm_weight=0.5, **params)
+        nbest_hyps, _, scores = dec.beam_search(eouts, elens, params, lm=lm,
+                                                nbest=params['recog_beam_width'])
+
+    # LM scores of the top-K candidates must not change the results
+    for b in range(batch_size):
+        assert len(nbest_hyps[b]) == len(nbest_hyps_ref[b])
+        for n in range(len(nbest_hyps[b])):
+            assert np.array_equal(nbest_hyps[b][n], nbest_hyps_ref[b][n])
+    if params['recog_lm_state_cache_size'] > 0:
+        # <sos> is shared by all utterances
+        assert dec.lm_state_cache.n_hits >= batch_size - 1
+        assert len(dec.lm_state_cache) <= params['recog_lm_state_cache_size']
+
+
+def make_ngram_lm(tmp_path):
+    """Bigram LM over all tokens except for <blank> and <pad>."""
+    rng = np.random.RandomState(0)
+    with open(str(tmp_path / 'dict.txt'), 'w') as f:
+        f.write('<unk> 1\n<eos> 2\n<pad> 3\n')
+        for i in range(4, VOCAB):
+            f.write('w%d %d\n' % (i, i))
+    words = ['<s>', '</s>', '<unk>'] + ['w%d' % i for i in range(4, VOCAB)]
+    bigrams = [(w1, w2) for w1 in words for w2 in words[1:] if w1 != '</s>' and rng.rand() < 0.5]
+    with open(str(tmp_path / 'lm.arpa'), 'w') as f:
+        f.write('\\data\\\nngram 1=%d\nngram 2=%d\n' % (len(words), len(bigrams)))
+        f.write('\n\\1-grams:\n')
+        for w in words:
+            f.write('%.4f\t%s\t%.4f\n' % (np.log10(rng.uniform(0.01, 1)) if w != '<s>' else -99,
+                                          w, np.log10(rng.uniform(0.1, 1))))
+        f.write('\n\\2-grams:\n')
+        for ng in bigrams:
+            f.write('%.4f\t%s\n' % (np.log10(rng.uniform(0.01, 1)), ' '.join(ng)))
+        f.write('\n\\end\\\n')
+    module = importlib.import_module('neural_sp.models.lm.ngram')
+    return module.NgramLM(str(tmp_path / 'lm.arpa'), str(tmp_path / 'dict.txt'))
+
+
+@pytest.mark.parametrize(
+    "params", [
+        ({'recog_lm_state_cache_size': 100}),
+        ({'recog_lm_n_cands': 4}),
+        ({'recog_lm_n_cands': 4, 'recog_lm_state_cache_size': 100}),
+        ({'recog_lm_state_carry_over': True}),
+    ]
+)
+def test_decoding_ngram_lm(tmp_path, params):
+    args = make_args()
+
+    batch_size = 2
+    emax = 20
+    device_id = -1
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([emax, emax - 4])
+    eouts = pad_list([np2tensor(x, device_id).float() for x in eouts], 0.)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec.eval()
+    lm = make_ngram_lm(tmp_path)
+
+    with torch.no_grad():
+        params_ref = make_decode_params(recog_lm_weight=0.5)
+        nbest_hyps_ref, _, _ = dec.beam_search(eouts, elens, params_ref, lm=lm,
+                                               nbest=params_ref['recog_beam_width'])
+        params = make_decode_params(recog_lm_weight=0.5, **params)
+        nbest_hyps, _, _ = dec.beam_search(eouts, elens, params, lm=lm,
+                                           speakers=['spk1', 'spk1'],
+                                           nbest=params['recog_beam_width'])
+
+    assert len(nbest_hyps) == batch_size
+    if params['recog_lm_state_carry_over']:
+        # the LM state is carried over to the next utterance
+        assert dec.lmstate_final['hxs'].size() == (1, 1)
+        return
+    for b in range(batch_size):
+        assert len(nbest_hyps[b]) == len(nbest_hyps_ref[b])
+        for n in range(len(nbest_hyps[b])):
+            assert np.array_equal(nbest_hyps[b][n], nbest_hyps_ref[b][n])
+
+
+@pytest.mark.parametrize("recog_mem_len", [5, 100])
+def test_decoding_lm_memory_carry_over(recog_mem_len):
+    args = make_args()
+    params = make_decode_params(recog_lm_weight=0.5, recog_lm_state_carry_over=True)
+
+    batch_size = 3
+    emax = 20
+    device_id = -1
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([emax, emax - 4, emax - 8])
+    eouts = pad_list([np2tensor(x, device_id).float() for x in eouts], 0.)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec.eval()
+    lm = make_lm('transformer_xl', recog_mem_len)
+    lm.eval()
+
+    with torch.no_grad():
+        # TransformerXL memory grows over utterances in the same session
+        nbest_hyps, _, _ = dec.beam_search(eouts[:2], elens[:2], params, lm=lm,
+                                           speakers=['spk1', 'spk1'])
+        # NOTE: <sos> is fed to the LM per utterance while <eos> is not
+        mlen = sum([len(nbest_hyps[b][0]) for b in range(2)])
+        assert dec.lmmemory[0].size(1) == min(mlen, recog_mem_len)
+        assert len(dec.lmmemory) == lm.n_layers
+
+        # a new session starts from scratch
+        nbest_hyps, _, _ = dec.beam_search(eouts[2:], elens[2:], params, lm=lm,
+                                           speakers=['spk2'])
+        assert dec.lmmemory[0].size(1) == min(len(nbest_hyps[0][0]), recog_mem_len)
+
+        # no carry over across utterances without sessions
+        dec.reset_carry_over()
+        dec.beam_search(eouts, elens, params, lm=lm)
+        assert dec.lmmemory is None
+
+
+@pytest.mark.parametrize("lm_type", ['lstm', 'transformer', 'transformer_xl'])
+def test_decoding_interleaved_sessions(lm_type):
+    args = make_args()
+    params = make_decode_params(recog_lm_weight=0.5, recog_asr_state_carry_over=True,
+                                recog_lm_state_carry_over=True)
+
+    sessions = ['spk1'] * 3 + ['spk2'] * 2 + ['spk3'] + ['spk4'] * 2
+    n_utts = len(sessions)
+    emax = 20
+    device_id = -1
+    eouts = np.random.randn(n_utts, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([emax - np.random.randint(0, 8) for _ in range(n_utts)])
+    eouts = pad_list([np2tensor(x, device_id).double() for x in eouts], 0.)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec.eval()
+    lm = make_lm(lm_type, recog_mem_len=100)
+    lm.eval()
+    # NOTE: use double precision to avoid flipping near-tie hypotheses by rounding errors
+    dec.double()
+    lm.double()
+
+    # each row of mini-batches is a different session
+    module_ds = importlib.import_module('neural_sp.datasets.asr')
+    buckets = module_ds.Dataset.session_interleaving(
+        argparse.Namespace(df=pd.DataFrame({'session': sessions})), batch_size=2)
+    assert sorted(sum(buckets, [])) == list(range(n_utts))
+    for ids in buckets:
+        assert len(ids) <= 2
+        assert len(set([sessions[i] for i in ids])) == len(ids)
+
+    with torch.no_grad():
+        # utterances decoded one by one in the order of sessions
+        dec.reset_carry_over()
+        refs = []
+        for i in range(n_utts):
+            nbest_hyps, _, _ = dec.beam_search(eouts[i:i + 1], elens[i:i + 1], params, lm=lm,
+                                               speakers=[sessions[i]])
+            refs.append(nbest_hyps[0][0])
+
+        # sessions decoded in parallel
+        dec.reset_carry_over()
+        hyps = [None] * n_utts
+        for ids in buckets:
+            nbest_hyps, _, _ = dec.beam_search(eouts[ids], elens[ids], params, lm=lm,
+                                               speakers=[sessions[i] for i in ids])
+            for i, nbest_hyps_b in zip(ids, nbest_hyps):
+                hyps[i] = nbest_hyps_b[0]
+            # states of finished sessions are discarded
+            assert len(dec.session_states) < len(ids)
+
+    for i in range(n_utts):
+        assert np.array_equal(hyps[i], refs[i])
@@ -0,0 +1,135 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for long-form decoding with overlapped windows."""
+
+import importlib
+import numpy as np
+import pytest
+import torch
+
+from neural_sp.bin.args_asr import (
+    build_parser,
+    register_args_decoder,
+    register_args_encoder
+)
+
+INPUT_DIM = 16
+VOCAB = 10
+
+
+def parse_args(argv):
+    parser = build_parser()
+    args, _ = parser.parse_known_args(argv)
+    parser = register_args_encoder(parser, args)
+    args, _ = parser.parse_known_args(argv)
+    parser = register_args_decoder(parser, args)
+    args = parser.parse_args(argv)
+    args.vocab = VOCAB
+    args.vocab_sub1 = 0
+    args.vocab_sub2 = 0
+    args.input_dim = INPUT_DIM
+    return args
+
+
+def make_argv(**kwargs):
+    argv = dict(
+        enc_type='blstm',
+        enc_n_units=16,
+        enc_n_layers=2,
+        dec_type='lstm',
+        dec_n_units=16,
+        attn_dim=16,
+        emb_dim=16,
+        ctc_weight=1.0,
+    )
+    argv.update(kwargs)
+    return sum([['--' + k, str(v)] for k, v in argv.items() if v is not None], [])
+
+
+@pytest.mark.parametrize("n_frames", [1, 99, 100, 101, 250, 1234])
+@pytest.mark.parametrize("window, overlap", [(100, 0), (100, 30), (100, 99)])
+def test_split_windows(n_frames, window, overlap):
+    module = importlib.import_module('neural_sp.models.seq2seq.longform')
+    windows, boundaries = module.split_windows(n_frames, window, overlap)
+    assert len(boundaries) == len(windows) - 1
+    assert windows[0][0] == 0
+    assert windows[-1][1] == n_frames
+    for s, e in windows:
+        assert e - s == min(window, n_frames)
+    for i, b in enumerate(boundaries):
+        # adjacent windows overlap and hand over inside the overlapped region
+        assert windows[i][0] < windows[i + 1][0] <= windows[i][1]
+        assert windows[i + 1][0] <= b <= windows[i][1]
+        if i > 0:
+            assert boundaries[i - 1] <= b
+
+
+def test_stitch_hyps():
+    module = importlib.import_module('neural_sp.models.seq2seq.longform')
+    n_frames = 1000
+    windows, boundaries = module.split_windows(n_frames, 200, 60)
+    # a token per 7 frames
+    timestamps_all = np.arange(0, n_frames, 7)
+    tokens_all = np.random.randint(4, VOCAB, len(timestamps_all))
+    hyps, timestamps = [], []
+    for s, e in windows:
+        inside = (s <= timestamps_all) & (timestamps_all < e)
+        hyps.append(tokens_all[inside])
+        timestamps.append(timestamps_all[inside].tolist())
+    hyp = module.stitch_hyps(hyps, timestamps, windows, boundaries)
+    assert hyp.tolist() == tokens_all.tolist()
+
+
+@pytest.mark.parametrize(
+    "args, params",
+    [
+        # CTC
+        ({}, {}),
+        ({'n_stacks': 2, 'n_skips': 2}, {}),
+        ({'enc_type': 'lstm'}, {'recog_beam_width': 2}),
+        # attention
+        ({'ctc_weight': 0.5}, {'recog_beam_width': 1}),
+        ({'ctc_weight': 0.5}, {'recog_beam_width': 2, 'recog_ctc_weight': 0.3}),
+    ]
+)
+def test_decode_longform(args, params):
+    args = parse_args(make_argv(**args))
+    recog_params = vars(parse_args(make_argv()))
+    recog_params.update(params)
+    recog_params['recog_longform_overlap'] = 40
+    recog_params['recog_longform_batch_size'] = 3
+
+    module = importlib.import_module('neural_sp.models.seq2seq.speech2text')
+    model = module.Speech2Text(args)
+    model.eval()
+    module_lf = importlib.import_module('neural_sp.models.seq2seq.longform')
+
+    # a single window is identical to offline decoding
+    for xmax in [60, 150]:
+        x = np.random.randn(xmax, INPUT_DIM).astype(np.float32)
+        recog_params['recog_longform_window'] = 0
+        ref, _ = model.decode([x], recog_params, exclude_eos=True, idx2token=None)
+        recog_params['recog_longform_window'] = 200
+        hyp, _ = model.decode([x], recog_params, exclude_eos=True, idx2token=None)
+        assert hyp[0].tolist() == np.array(ref[0]).tolist()
+
+    # overlapped windows
+    x = np.random.randn(523, INPUT_DIM).astype(np.float32)
+    recog_params['recog_longform_window'] = 100
+    hyp = module_lf.decode_longform(model, x, recog_params)
+    assert hyp.ndim == 1
+    assert all([0 <= token < VOCAB for token in hyp.tolist()])
+
+    # tokens of windows are timestamped in order within the windows
+    with torch.no_grad():
+        eout_dict = model.encode([x[:100], x[100:200]], 'ys')
+        eouts, elens = eout_dict['ys']['xs'], eout_dict['ys']['xlens']
+        hyps_w = module_lf.decode_windows(model, eouts, elens, recog_params)
+        timestamps = module_lf.ctc_timestamps(model.dec_fwd.ctc, eouts, elens,
+                                              [np.array(h, dtype=np.int64) for h in hyps_w],
+                                              model.device_id)
+    for h, ts, elen in zip(hyps_w, timestamps, elens.tolist()):
+        assert len(ts) == len(h)
+        assert ts == sorted(ts)
+        assert all([0 <= t < elen for t in ts])
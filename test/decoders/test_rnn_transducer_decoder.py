@@ -37,6 +37,7 @@ def make_args(**kwargs):
         global_weight=1.0,
         mtl_per_batch=False,
         param_init=0.1,
+        joint_chunk_size=0,
     )
     args.update(kwargs)
     return args
@@ -53,6 +54,9 @@ def make_args(**kwargs):
         ({'ctc_weight': 0.5}),
         ({'ctc_weight': 1.0}),
         ({'ctc_weight': 1.0, 'ctc_lsm_prob': 0.0}),
+        # memory-efficient joint network
+        ({'joint_chunk_size': 1}),
+        ({'joint_chunk_size': 16}),
     ]
 )
 def test_forward(args):
@@ -75,3 +79,125 @@ def test_forward(args):
     assert loss.size(0) == 1
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+def _transducer_loss_naive(log_probs, ys, elens, ylens, blank):
+    losses = []
+    for b in range(log_probs.shape[0]):
+        T, U = elens[b], ylens[b]
+        alpha = np.full((T, U + 1), -np.inf)
+        alpha[0, 0] = 0.
+        for t in range(T):
+            for u in range(U + 1):
+                if t > 0:
+                    alpha[t, u] = np.logaddexp(alpha[t, u], alpha[t - 1, u] + log_probs[b, t - 1, u, blank])
+                if u > 0:
+                    alpha[t, u] = np.logaddexp(alpha[t, u], alpha[t, u - 1] + log_probs[b, t, u - 1, ys[b][u - 1]])
+        losses.append(-(alpha[T - 1, U] + log_probs[b, T - 1, U, blank]))
+    return np.mean(losses)
+
+
+def test_transducer_loss():
+    from neural_sp.models.criterion import transducer_loss
+
+    batch_size = 3
+    elens = [12, 7, 10]
+    ylens = [4, 6, 0]
+    blank = 0
+    ys = [np.random.randint(1, VOCAB, ylen) for ylen in ylens]
+    log_probs = torch.log_softmax(torch.randn(batch_size, max(elens), max(ylens) + 1, VOCAB), dim=-1)
+    ys_out = pad_list([torch.from_numpy(y).long() for y in ys], blank)
+
+    log_probs_blank = log_probs[:, :, :, blank]
+    log_probs_label = log_probs[:, :, :-1].gather(
+        3, ys_out.unsqueeze(1).unsqueeze(3).expand(-1, max(elens), -1, -1)).squeeze(3)
+    loss = transducer_loss(log_probs_blank, log_probs_label,
+                           torch.IntTensor(elens), torch.IntTensor(ylens))
+    loss_ref = _transducer_loss_naive(log_probs.numpy(), ys, elens, ylens, blank)
+    assert np.allclose(loss.item(), loss_ref, atol=1e-4)
+
+
+def test_joint_chunkwise():
+    batch_size = 4
+    emax = 23
+    eouts = torch.randn(batch_size, emax, ENC_N_UNITS, requires_grad=True)
+    elens = torch.IntTensor([23, 20, 17, 9])
+    ylens = [4, 5, 3, 7]
+    ys = [np.random.randint(4, VOCAB, ylen).astype(np.int32) for ylen in ylens]
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.rnn_transducer')
+    dec = module.RNNTransducer(**make_args(dropout=0.0, dropout_emb=0.0))
+    loss_full = dec.forward_transducer(eouts, elens, ys)
+    loss_full.backward()
+    grad_full, grad_out_full = eouts.grad.clone(), dec.output.weight.grad.clone()
+
+    eouts.grad = None
+    dec.zero_grad()
+    dec.joint_chunk_size = 5
+    loss_chunk = dec.forward_transducer(eouts, elens, ys)
+    loss_chunk.backward()
+    grad_chunk, grad_out_chunk = eouts.grad, dec.output.weight.grad
+    assert np.allclose(loss_full.item(), loss_chunk.item(), atol=1e-4)
+    assert torch.allclose(grad_full, grad_chunk, atol=1e-5)
+    # NOTE: gradients of the joint network are recomputed in checkpointing
+    assert torch.allclose(grad_out_full, grad_out_chunk, atol=1e-5)
+
+
+def make_decode_params(**kwargs):
+    args = dict(
+        recog_beam_width=4,
+        recog_ctc_weight=0.0,
+        recog_lm_weight=0.0,
+        recog_lm_second_weight=0.0,
+        recog_lm_bwd_weight=0.0,
+        recog_max_sym_exp=3,
+        recog_beam_margin=0.0,
+        recog_time_budget=0.0,
+        recog_asr_state_carry_over=False,
+        recog_lm_state_carry_over=False,
+    )
+    args.update(kwargs)
+    return args
+
+
+@pytest.mark.parametrize(
+    "params", [
+        ({'recog_beam_width': 1}),
+        ({'recog_beam_width': 4}),
+        ({'recog_beam_width': 4, 'recog_max_sym_exp': 1}),
+        ({'recog_beam_width': 4, 'recog_max_sym_exp': 5}),
+        ({'recog_beam_width': 4, 'recog_ctc_weight': 0.3}),
+        ({'recog_beam_width': 4, 'recog_beam_margin': 1.0}),
+        ({'recog_beam_width': 4, 'recog_time_budget': 1e-6}),
+    ]
+)
+def test_decoding(params):
+    args = make_args(ctc_weight=0.3 if params.get('recog_ctc_weight', 0) > 0 else 0.0)
+    params = make_decode_params(**params)
+
+    batch_size = 2
+    emax = 20
+    device_id = -1
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([len(x) for x in eouts])
+    eouts = pad_list([np2tensor(x, device_id).float() for x in eouts], 0.)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.rnn_transducer')
+    dec = module.RNNTransducer(**args)
+    dec.eval()
+
+    ctc_log_probs = None
+    if params['recog_ctc_weight'] > 0:
+        ctc_log_probs = dec.ctc_log_probs(eouts)
+
+    with torch.no_grad():
+        nbest_hyps, _, _ = dec.beam_search(eouts, elens, params, ctc_log_probs=ctc_log_probs,
+                                           nbest=params['recog_beam_width'])
+    assert len(nbest_hyps) == batch_size
+    for b in range(batch_size):
+        assert 1 <= len(nbest_hyps[b]) <= params['recog_beam_width']
+        for hyp in nbest_hyps[b]:
+            assert 0 not in hyp.tolist()  # <blank>
+            assert len(hyp) <= elens[b] * (params['recog_max_sym_exp'] - 1)
+        # hypotheses must be unique after prefix merging
+        assert len(set([tuple(hyp.tolist()) for hyp in nbest_hyps[b]])) == len(nbest_hyps[b])
@@ -0,0 +1,142 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for emission latency evaluation of streaming decoding."""
+
+import importlib
+import itertools
+import numpy as np
+import pytest
+
+from neural_sp.bin.args_asr import (
+    build_parser,
+    register_args_decoder,
+    register_args_encoder
+)
+
+INPUT_DIM = 16
+VOCAB = 10
+
+
+def parse_args(argv):
+    parser = build_parser()
+    args, _ = parser.parse_known_args(argv)
+    parser = register_args_encoder(parser, args)
+    args, _ = parser.parse_known_args(argv)
+    parser = register_args_decoder(parser, args)
+    args = parser.parse_args(argv)
+    args.vocab = VOCAB
+    args.vocab_sub1 = 0
+    args.vocab_sub2 = 0
+    args.input_dim = INPUT_DIM
+    return args
+
+
+def make_argv(**kwargs):
+    argv = dict(
+        enc_type='blstm',
+        enc_n_units=16,
+        enc_n_layers=2,
+        dec_type='lstm',
+        dec_n_units=16,
+        attn_dim=16,
+        emb_dim=16,
+        ctc_weight=1.0,
+    )
+    argv.update(kwargs)
+    return sum([['--' + k, str(v)] for k, v in argv.items()], [])
+
+
+def lcs_naive(ref, hyp):
+    """Length of the longest common subsequence by enumerating subsequences of hyp."""
+    for n in range(len(hyp), 0, -1):
+        for ids in itertools.combinations(range(len(hyp)), n):
+            it = iter(ref)
+            if all([hyp[i] in it for i in ids]):
+                return n
+    return 0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_match_tokens(seed):
+    module = importlib.import_module('neural_sp.evaluators.latency')
+    rng = np.random.RandomState(seed)
+    for _ in range(20):
+        ref = rng.randint(0, 4, rng.randint(0, 8)).tolist()
+        hyp = rng.randint(0, 4, rng.randint(0, 8)).tolist()
+        pairs = module.match_tokens(ref, hyp)
+        assert len(pairs) == lcs_naive(ref, hyp)
+        assert all([hyp[i] == ref[j] for i, j in pairs])
+        # monotonic
+        assert all([i1 < i2 and j1 < j2 for (i1, j1), (i2, j2) in zip(pairs[:-1], pairs[1:])])
+
+
+def test_emission_times():
+    module = importlib.import_module('neural_sp.evaluators.latency')
+    records = [
+        (0.1, [], 0),
+        (0.2, [5], 0),
+        (0.3, [6], 0),  # retracted
+        (0.4, [5, 7], 1),
+        (0.5, [5, 7, 8], 1),
+        (0.6, [5, 7, 9], 3),  # final result
+    ]
+    emit_times, final_times = module.emission_times(records, [5, 7, 9])
+    assert emit_times == [0.2, 0.4, 0.6]
+    assert final_times == [0.4, 0.6, 0.6]
+
+
+def zero_timer():
+    return 0.
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'lc_chunk_size_left': 8, 'lc_chunk_size_right': 4}),
+        ({'enc_type': 'lstm'}),
+    ]
+)
+@pytest.mark.parametrize("block_size", [1, 10])
+def test_measure_latency(args, block_size):
+    args = parse_args(make_argv(**args))
+    params = vars(parse_args(make_argv()))
+    params['recog_beam_width'] = 4
+    params['recog_ctc_vad'] = False
+
+    module = importlib.import_module('neural_sp.models.seq2seq.speech2text')
+    model = module.Speech2Text(args)
+    model.eval()
+    module_ss = importlib.import_module('neural_sp.models.seq2seq.streaming_session')
+    module_lat = importlib.import_module('neural_sp.evaluators.latency')
+
+    x = np.random.randn(83, INPUT_DIM).astype(np.float32)
+    session = module_ss.StreamingSession(model, params)
+    session.push_features(x)
+    ref = session.finalize().tolist()
+    y = (ref + [3, 4])[:4]  # reference with errors
+
+    # processing time is ignored
+    result = module_lat.measure_latency(model, params, x, y, block_size=block_size, timer=zero_timer)
+    assert result['hyp'] == ref
+    assert result['eou'] == 0
+    assert len(result['emission']) == len(module_lat.match_tokens(y, ref))
+    for d_emit, d_final in zip(result['emission'], result['final']):
+        assert d_emit <= d_final
+    # the first token is measured with the first matched pair
+    if len(result['emission']) > 0:
+        assert result['first_token'] == result['emission'][0]
+    else:
+        assert result['first_token'] is None
+
+    # the first token of the hypothesis is substituted
+    if len(ref) > 1:
+        y_sub = [4 if ref[0] != 4 else 5] + ref[1:]
+        result = module_lat.measure_latency(model, params, x, y_sub, block_size=block_size, timer=zero_timer)
+        assert result['first_token'] == result['emission'][0]
+        assert module_lat.match_tokens(y_sub, ref)[0] != (0, 0)
+
+    ref_times = module_lat.ctc_alignment_times(model, x, y)
+    assert len(ref_times) == len(y)
+    assert ref_times == sorted(ref_times)
+    assert ref_times[-1] <= len(x) * module_lat.FRAME_SHIFT
@@ -0,0 +1,190 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for incremental streaming decoding session."""
+
+import importlib
+import numpy as np
+import pytest
+import torch
+
+from neural_sp.bin.args_asr import (
+    build_parser,
+    register_args_decoder,
+    register_args_encoder
+)
+
+INPUT_DIM = 16
+VOCAB = 10
+
+
+def parse_args(argv):
+    parser = build_parser()
+    args, _ = parser.parse_known_args(argv)
+    parser = register_args_encoder(parser, args)
+    args, _ = parser.parse_known_args(argv)
+    parser = register_args_decoder(parser, args)
+    args = parser.parse_args(argv)
+    args.vocab = VOCAB
+    args.vocab_sub1 = 0
+    args.vocab_sub2 = 0
+    args.input_dim = INPUT_DIM
+    return args
+
+
+def make_argv(**kwargs):
+    argv = dict(
+        enc_type='blstm',
+        enc_n_units=16,
+        enc_n_layers=2,
+        dec_type='lstm',
+        dec_n_units=16,
+        attn_dim=16,
+        emb_dim=16,
+        ctc_weight=1.0,
+    )
+    argv.update(kwargs)
+    return sum([['--' + k, str(v)] for k, v in argv.items() if v is not None], [])
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        # LC-BLSTM
+        ({'lc_chunk_size_left': 8, 'lc_chunk_size_right': 4}),
+        # LC-BLSTM, frame stacking
+        ({'lc_chunk_size_left': 8, 'lc_chunk_size_right': 4,
+          'n_stacks': 2, 'n_skips': 2}),
+        # CNN + LC-BLSTM
+        ({'enc_type': 'conv_blstm', 'lc_chunk_size_left': 16, 'lc_chunk_size_right': 8,
+          'conv_channels': "8_8", 'conv_kernel_sizes': "(3,3)_(3,3)",
+          'conv_strides': "(1,1)_(1,1)", 'conv_poolings': "(2,2)_(2,2)"}),
+        # unidirectional LSTM
+        ({'enc_type': 'lstm'}),
+    ]
+)
+def test_push_features(args):
+    args = parse_args(make_argv(**args))
+    params = vars(parse_args(make_argv()))
+    params['recog_beam_width'] = 4
+    params['recog_length_penalty'] = 0.1
+    params['recog_ctc_vad'] = False
+
+    module = importlib.import_module('neural_sp.models.seq2seq.speech2text')
+    model = module.Speech2Text(args)
+    model.eval()
+    module_ss = importlib.import_module('neural_sp.models.seq2seq.streaming_session')
+    session = module_ss.StreamingSession(model, params)
+    ctc = model.dec_fwd.ctc
+
+    for xmax in [53, 96, 127]:
+        xs = np.random.randn(xmax, INPUT_DIM).astype(np.float32)
+
+        # offline CTC prefix beam search
+        with torch.no_grad():
+            eouts = model.encode([xs], 'ys')['ys']['xs']
+            beam = ctc.beam_search_chunk(model.dec_fwd.ctc_log_probs(eouts)[0],
+                                         ctc.initial_beam(), params)
+        ref = beam[0]['hyp'][1:]
+
+        # push blocks of random sizes
+        for _ in range(2):  # the session is reusable after finalize()
+            t = 0
+            while t < xmax:
+                n = np.random.randint(1, 30)
+                hyp_partial = session.push_features(xs[t:t + n])
+                assert hyp_partial.ndim == 1
+                t += n
+            hyp = session.finalize()
+            assert hyp.tolist() == ref
+            assert session.n_frames == 0
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'lc_chunk_size_left': 8, 'lc_chunk_size_right': 4}),
+        ({'enc_type': 'conv_blstm', 'lc_chunk_size_left': 16, 'lc_chunk_size_right': 8,
+          'conv_channels': "8_8", 'conv_kernel_sizes': "(3,3)_(3,3)",
+          'conv_strides': "(1,1)_(1,1)", 'conv_poolings': "(2,2)_(2,2)"}),
+        ({'enc_type': 'lstm'}),
+        ({'enc_type': 'gru'}),
+        # CNN + Transformer/Conformer with the cached left context
+        ({'enc_type': 'conv_transformer', 'enc_n_units': None, 'enc_n_layers': 2,
+          'lc_chunk_size_left': 16, 'lc_chunk_size_current': 8, 'lc_chunk_size_right': 8,
+          'transformer_d_model': 16, 'transformer_d_ff': 32, 'transformer_n_heads': 2,
+          'conv_channels': "8", 'conv_kernel_sizes': "(3,3)",
+          'conv_strides': "(1,1)", 'conv_poolings': "(2,2)"}),
+        ({'enc_type': 'conv_conformer', 'enc_n_units': None, 'enc_n_layers': 2,
+          'lc_chunk_size_left': 16, 'lc_chunk_size_current': 8, 'lc_chunk_size_right': 8,
+          'transformer_d_model': 16, 'transformer_d_ff': 32, 'transformer_n_heads': 2,
+          'transformer_enc_pe_type': 'relative', 'conformer_kernel_size': 7,
+          'conv_channels': "8", 'conv_kernel_sizes': "(3,3)",
+          'conv_strides': "(1,1)", 'conv_poolings': "(2,2)"}),
+    ]
+)
+def test_stream_scheduler(args):
+    args = parse_args(make_argv(**args))
+    params = vars(parse_args(make_argv()))
+    params['recog_beam_width'] = 4
+    params['recog_length_penalty'] = 0.1
+    params['recog_ctc_vad'] = False
+    n_streams = 7
+
+    module = importlib.import_module('neural_sp.models.seq2seq.speech2text')
+    model = module.Speech2Text(args)
+    model.eval()
+    module_ss = importlib.import_module('neural_sp.models.seq2seq.streaming_session')
+    module_sch = importlib.import_module('neural_sp.models.seq2seq.stream_scheduler')
+    scheduler = module_sch.StreamScheduler(model, params, max_batch_size=3)
+
+    xs = [np.random.randn(np.random.randint(40, 150), INPUT_DIM).astype(np.float32)
+          for _ in range(n_streams)]
+
+    # streams decoded one by one
+    refs = []
+    for x in xs:
+        session = module_ss.StreamingSession(model, params)
+        session.push_features(x)
+        refs.append(session.finalize().tolist())
+
+    # streams decoded concurrently
+    hyps = {}
+    for i in range(n_streams):
+        scheduler.open(i)
+    while len(scheduler) > 0:
+        for i in list(scheduler.sessions.keys()):
+            t = scheduler.sessions[i].n_frames
+            scheduler.push_features(i, xs[i][t:t + np.random.randint(1, 20)])
+        scheduler.run()
+        for i in list(scheduler.sessions.keys()):
+            if scheduler.sessions[i].n_frames == len(xs[i]):
+                hyps[i] = scheduler.close(i).tolist()
+    for i in range(n_streams):
+        assert hyps[i] == refs[i]
+
+
+def test_push_waveform():
+    args = parse_args(make_argv(lc_chunk_size_left=8, lc_chunk_size_right=4))
+    params = vars(parse_args(make_argv()))
+    params['recog_ctc_vad'] = False
+
+    module = importlib.import_module('neural_sp.models.seq2seq.speech2text')
+    model = module.Speech2Text(args)
+    model.eval()
+    module_ss = importlib.import_module('neural_sp.models.seq2seq.streaming_session')
+    module_fb = importlib.import_module('neural_sp.models.seq2seq.frontends.fbank')
+    session = module_ss.StreamingSession(model, params,
+                                         frontend=module_fb.OnlineFbank(n_mels=INPUT_DIM))
+
+    wav = (np.random.randn(16000) * 1000).astype(np.int16)
+    session.push_features(module_fb.OnlineFbank(n_mels=INPUT_DIM).compute(wav))
+    ref = session.finalize()
+
+    t = 0
+    while t < len(wav):
+        n = np.random.randint(1, 3200)
+        session.push_waveform(wav[t:t + n])
+        t += n
+    hyp = session.finalize()
+    assert np.array_equal(hyp, ref)
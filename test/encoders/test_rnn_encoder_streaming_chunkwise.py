@@ -167,3 +167,70 @@ def test_forward_streaming_chunkwise(args):
             eouts_stream = torch.cat(eouts_stream, dim=1)
             assert enc_out_dict['ys']['xs'].size() == eouts_stream.size()
             assert torch.equal(enc_out_dict['ys']['xs'], eouts_stream)
+
+
+def forward_lc_naive(enc, xs):
+    """Reference implementation of LC-BLSTM encoding chunk by chunk in both directions."""
+    N_l = enc.chunk_size_left // enc.subsampling_factor
+    N_r = enc.chunk_size_right // enc.subsampling_factor
+    hx_fwd = [None] * enc.n_layers
+    xs_chunks, xs_chunks_sub1 = [], []
+    for t in range(0, xs.size(1), N_l):
+        xs_chunk = xs[:, t:t + (N_l + N_r)]
+        for lth in range(enc.n_layers):
+            xs_chunk_bwd, _ = enc.rnn_bwd[lth](torch.flip(xs_chunk, dims=[1]))
+            xs_chunk_bwd = torch.flip(xs_chunk_bwd, dims=[1])
+            xs_chunk_fwd, hx_fwd[lth] = enc.rnn[lth](xs_chunk[:, :N_l], hx=hx_fwd[lth])
+            if xs_chunk.size(1) > N_l:
+                xs_chunk_fwd2, _ = enc.rnn[lth](xs_chunk[:, N_l:], hx=hx_fwd[lth])
+                xs_chunk_fwd = torch.cat([xs_chunk_fwd, xs_chunk_fwd2], dim=1)
+            if enc.bidir_sum:
+                xs_chunk = xs_chunk_fwd + xs_chunk_bwd
+            else:
+                xs_chunk = torch.cat([xs_chunk_fwd, xs_chunk_bwd], dim=-1)
+            if lth == enc.n_layers_sub1 - 1:
+                xs_chunks_sub1.append(xs_chunk[:, :N_l])
+            if enc.proj is not None and lth != enc.n_layers - 1:
+                xs_chunk = torch.tanh(enc.proj[lth](xs_chunk))
+        xs_chunks.append(xs_chunk[:, :N_l])
+    xs_sub1 = torch.cat(xs_chunks_sub1, dim=1) if enc.n_layers_sub1 > 0 else None
+    return torch.cat(xs_chunks, dim=1), xs_sub1
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'rnn_type': 'blstm', 'chunk_size_left': 20, 'chunk_size_right': 20}),
+        ({'rnn_type': 'blstm', 'chunk_size_left': 16, 'chunk_size_right': 32}),
+        ({'rnn_type': 'blstm', 'chunk_size_left': 16, 'chunk_size_right': 0}),
+        ({'rnn_type': 'bgru', 'chunk_size_left': 20, 'chunk_size_right': 8}),
+        ({'rnn_type': 'bgru', 'chunk_size_left': 16, 'chunk_size_right': 0}),
+        ({'rnn_type': 'bgru', 'chunk_size_left': 20, 'chunk_size_right': 8,
+          'bidir_sum_fwd_bwd': True, 'n_projs': 32, 'n_layers_sub1': 3}),
+        ({'rnn_type': 'blstm', 'chunk_size_left': 20, 'chunk_size_right': 8,
+          'bidir_sum_fwd_bwd': True, 'n_projs': 32, 'n_layers_sub1': 3}),
+    ]
+)
+def test_forward_batched_chunks(args):
+    """Chunks folded in the batch dimension are identical to chunks encoded one by one."""
+    args = make_args(**args)
+    args['n_units'] = 32
+    args['input_dim'] = 16
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.rnn')
+    enc = module.RNNEncoder(**args)
+    enc.eval()
+
+    for xmax in [1, 19, 20, 73, 80]:
+        xs = torch.randn(3, xmax, args['input_dim'], requires_grad=True)
+        eouts = enc(xs, torch.IntTensor([xmax] * 3), task='all')
+        eouts_ref, eouts_ref_sub1 = forward_lc_naive(enc, xs)
+        assert eouts['ys']['xs'].size() == eouts_ref.size()
+        assert torch.allclose(eouts['ys']['xs'], eouts_ref, atol=1e-6)
+        if enc.n_layers_sub1 > 0:
+            assert torch.allclose(eouts['ys_sub1']['xs'], eouts_ref_sub1, atol=1e-6)
+
+        # gradients
+        grad = torch.randn(eouts_ref.size())
+        xs_grad = torch.autograd.grad(eouts['ys']['xs'], xs, grad)[0]
+        xs_grad_ref = torch.autograd.grad(eouts_ref, xs, grad)[0]
+        assert torch.allclose(xs_grad, xs_grad_ref, atol=1e-6)
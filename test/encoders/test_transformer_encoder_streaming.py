@@ -0,0 +1,154 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for streaming encoding with cache in Transformer and Conformer encoders."""
+
+import importlib
+import pytest
+import torch
+
+INPUT_DIM = 16
+
+
+def make_args(**kwargs):
+    args = dict(
+        input_dim=INPUT_DIM,
+        enc_type='transformer',
+        n_heads=4,
+        n_layers=3,
+        n_layers_sub1=0,
+        n_layers_sub2=0,
+        d_model=32,
+        d_ff=64,
+        ffn_bottleneck_dim=0,
+        last_proj_dim=0,
+        pe_type='relative',
+        layer_norm_eps=1e-12,
+        ffn_activation='relu',
+        dropout_in=0.1,
+        dropout=0.1,
+        dropout_att=0.1,
+        dropout_layer=0.0,
+        n_stacks=1,
+        n_splices=1,
+        conv_in_channel=1,
+        conv_channels="",
+        conv_kernel_sizes="",
+        conv_strides="",
+        conv_poolings="",
+        conv_batch_norm=False,
+        conv_layer_norm=False,
+        conv_bottleneck_dim=0,
+        conv_param_init=0.1,
+        task_specific_layer=False,
+        param_init='xavier_uniform',
+        chunk_size_left=8,
+        chunk_size_current=4,
+        chunk_size_right=4,
+    )
+    args.update(kwargs)
+    return args
+
+
+def build_encoder(**kwargs):
+    args = make_args(**kwargs)
+    if 'conformer' in args['enc_type']:
+        args['kernel_size'] = args.pop('kernel_size', 3)
+        module = importlib.import_module('neural_sp.models.seq2seq.encoders.conformer')
+        enc = module.ConformerEncoder(**args)
+    else:
+        args.pop('kernel_size', None)
+        module = importlib.import_module('neural_sp.models.seq2seq.encoders.transformer')
+        enc = module.TransformerEncoder(**args)
+    enc.eval()
+    return enc
+
+
+def encode_chunks(enc, xs, start=0):
+    """Encode frames chunk by chunk with the cache."""
+    N_c = enc.chunk_size_current
+    N_r = enc.chunk_size_right
+    eouts = []
+    for t in range(start, xs.size(1), N_c):
+        x_chunk = xs[:, t:t + N_c + N_r]
+        xlens = torch.IntTensor([x_chunk.size(1)] * xs.size(0))
+        eout = enc(x_chunk, xlens, task='all', use_cache=t > start, streaming=True)['ys']['xs']
+        eouts.append(eout)
+    return torch.cat(eouts, dim=1)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'transformer'}),
+        ({'enc_type': 'transformer', 'chunk_size_right': 0}),
+        ({'enc_type': 'transformer', 'chunk_size_left': 3}),
+        ({'enc_type': 'transformer', 'pe_type': 'add'}),
+        ({'enc_type': 'transformer', 'pe_type': 'add', 'chunk_size_right': 0}),
+        ({'enc_type': 'conformer', 'kernel_size': 1}),
+        ({'enc_type': 'conformer', 'kernel_size': 1, 'chunk_size_left': 12}),
+    ]
+)
+def test_match_chunkwise(args):
+    """Cached states are identical to the left context re-encoded in a single layer."""
+    enc = build_encoder(n_layers=1, **args)
+    N_l = enc.chunk_size_left
+    N_c = enc.chunk_size_current
+    N_r = enc.chunk_size_right
+    xmax = 47
+
+    with torch.no_grad():
+        xs = torch.randn(2, xmax, INPUT_DIM)
+        xlens = torch.IntTensor([xmax, xmax])
+        eouts_chunkwise = enc(xs, xlens, task='all')['ys']['xs']
+        eouts = encode_chunks(enc, xs)
+    assert eouts.size() == eouts_chunkwise.size()
+    # NOTE: contexts out of the utterance are padded with zeros in chunkwise encoding
+    start = -(-N_l // N_c) * N_c
+    end = (xmax - N_r) // N_c * N_c
+    assert torch.allclose(eouts[:, start:end], eouts_chunkwise[:, start:end], atol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'transformer'}),
+        ({'enc_type': 'transformer', 'pe_type': 'add'}),
+        ({'enc_type': 'transformer', 'chunk_size_left': 16, 'chunk_size_right': 0}),
+        ({'enc_type': 'conv_transformer', 'chunk_size_left': 16, 'chunk_size_current': 8,
+          'chunk_size_right': 8, 'conv_channels': "8", 'conv_kernel_sizes': "(3,3)",
+          'conv_strides': "(1,1)", 'conv_poolings': "(2,2)"}),
+        ({'enc_type': 'conformer', 'kernel_size': 3}),
+        ({'enc_type': 'conformer', 'kernel_size': 7, 'chunk_size_left': 16}),
+    ]
+)
+def test_batch_streams(args):
+    """Streams at different positions are encoded at once with their own caches."""
+    enc = build_encoder(**args)
+    N_c = enc.chunk_size_current
+    N_r = enc.chunk_size_right
+    n_streams = 3
+    xs = [torch.randn(1, 60, INPUT_DIM) for _ in range(n_streams)]
+    # stream b starts after b chunks
+    starts = [b * N_c for b in range(n_streams)]
+
+    with torch.no_grad():
+        refs = [encode_chunks(enc, xs[b][:, :60 - starts[b]]) for b in range(n_streams)]
+
+        caches = [None] * n_streams
+        hyps = [[] for _ in range(n_streams)]
+        for t in range(0, 60, N_c):
+            active = [b for b in range(n_streams) if starts[b] <= t]
+            x_chunks = [xs[b][:, t - starts[b]:t - starts[b] + N_c + N_r] for b in active]
+            if len(set([x.size(1) for x in x_chunks])) > 1:
+                break  # the last chunks of streams have different lengths
+            enc.set_cache(enc.concat_cache([caches[b] for b in active]))
+            eouts = enc(torch.cat(x_chunks, dim=0), torch.IntTensor([x_chunks[0].size(1)] * len(active)),
+                        task='all', use_cache=True, streaming=True)['ys']['xs']
+            for i, (b, cache) in enumerate(zip(active, enc.split_cache(enc.get_cache(), len(active)))):
+                caches[b] = cache
+                hyps[b].append(eouts[i:i + 1])
+
+    for b in range(n_streams):
+        hyp = torch.cat(hyps[b], dim=1)
+        assert torch.allclose(hyp, refs[b][:, :hyp.size(1)], atol=1e-5)
@@ -4,6 +4,7 @@
 """Test for encoder utility functions."""
 
 import importlib
+import math
 import numpy as np
 import pytest
 import torch
@@ -41,3 +42,71 @@ def test_chunkwise(N_l, N_c, N_r):
 
         assert xs_chunk.size() == xs.size()
         assert torch.equal(xs_chunk, xs)
+
+
+def chunkwise_naive(xs, N_l, N_c, N_r):
+    """Reference implementation copying chunks one by one."""
+    bs, xmax, idim = xs.size()
+    n_chunks = math.ceil(xmax / N_c)
+    xs_tmp = xs.new_zeros(bs, n_chunks, N_l + N_c + N_r, idim)
+    xs_pad = torch.cat([xs.new_zeros(bs, N_l, idim), xs, xs.new_zeros(bs, N_r, idim)], dim=1)
+    for chunk_idx, t in enumerate(range(N_l, N_l + xmax, N_c)):
+        xs_chunk = xs_pad[:, t - N_l:t + (N_c + N_r)]
+        xs_tmp[:, chunk_idx, :xs_chunk.size(1), :] = xs_chunk
+    return xs_tmp.view(bs * n_chunks, N_l + N_c + N_r, idim)
+
+
+@pytest.mark.parametrize(
+    "N_l, N_c, N_r",
+    [
+        (96, 64, 32),
+        (40, 40, 20),
+        (0, 40, 0),
+        (8, 4, 4),
+    ]
+)
+def test_chunkwise_contexts(N_l, N_c, N_r):
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.utils')
+
+    for xmax in [1, 39, 800, 855]:
+        xs = torch.randn(3, xmax, 8, requires_grad=True)
+        xs_chunk = module.chunkwise(xs, N_l, N_c, N_r)
+        assert torch.equal(xs_chunk, chunkwise_naive(xs, N_l, N_c, N_r))
+
+        # frames in overlapped contexts accumulate gradients
+        grad = torch.randn(xs_chunk.size())
+        xs_chunk.backward(grad)
+        xs_ref = xs.detach().clone().requires_grad_(True)
+        chunkwise_naive(xs_ref, N_l, N_c, N_r).backward(grad)
+        assert torch.allclose(xs.grad, xs_ref.grad, atol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "N_l, N_c, N_r",
+    [
+        (8, 4, 4),
+        (16, 16, 0),
+        (0, 5, 3),
+    ]
+)
+def test_stitch_chunk_attention(N_l, N_c, N_r):
+    batch_size = 2
+    n_heads = 4
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.utils')
+
+    for xmax in [1, 30, 32]:
+        n_chunks = math.ceil(xmax / N_c)
+        window = N_l + N_c + N_r
+        xx_aws = torch.rand(batch_size * n_chunks, n_heads, window, window)
+        xx_aws_center = module.stitch_chunk_attention(xx_aws, batch_size, N_l, N_c, xmax)
+
+        # reference: copy the block of each chunk
+        xx_aws = xx_aws[:, :, N_l:N_l + N_c, N_l:N_l + N_c].contiguous()
+        xx_aws = xx_aws.view(batch_size, n_chunks, n_heads, N_c, N_c)
+        xx_aws_ref = xx_aws.new_zeros(batch_size, n_heads, xmax, xmax)
+        for chunk_idx in range(n_chunks):
+            offset = chunk_idx * N_c
+            emax_blc = xx_aws_ref[:, :, offset:offset + N_c].size(2)
+            xx_aws_ref[:, :, offset:offset + N_c, offset:offset + N_c] = \
+                xx_aws[:, chunk_idx, :, :emax_blc, :emax_blc]
+        assert torch.equal(xx_aws_center, xx_aws_ref)
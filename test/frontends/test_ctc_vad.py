@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for CTC-based voice activity detection."""
+
+import argparse
+import importlib
+import pytest
+import torch
+
+VOCAB = 6
+BLANK_THRESHOLD = 8
+SPIKE_THRESHOLD = 0.3
+
+
+def make_params(n_accum_frames):
+    return {
+        'recog_ctc_vad': True,
+        'recog_ctc_vad_blank_threshold': BLANK_THRESHOLD,
+        'recog_ctc_vad_spike_threshold': SPIKE_THRESHOLD,
+        'recog_ctc_vad_n_accum_frames': n_accum_frames,
+    }
+
+
+def make_streaming(module, n_accum_frames):
+    encoder = argparse.Namespace(conv=None, subsampling_factor=1,
+                                 chunk_size_left=40, chunk_size_right=20)
+    return module.Streaming(None, make_params(n_accum_frames), encoder, None)
+
+
+def make_ctc_probs(B, T, p_blank):
+    """Generate CTC posteriors with long blank regions and weak spikes."""
+    logits = torch.randn(B, T, VOCAB)
+    logits[:, :, 0] += 6 * (torch.rand(B, T, 1) < p_blank).float().squeeze(-1)
+    return torch.softmax(logits * torch.rand(B, T, 1) * 3, dim=-1)
+
+
+def ctc_vad_naive(streaming, ctc_probs_chunk):
+    """Reference implementation counting blank frames one by one."""
+    is_reset = False
+    if streaming.n_accum_frames >= streaming.MAX_N_ACCUM_FRAMES:
+        _, topk_ids_chunk = torch.topk(ctc_probs_chunk, k=1, dim=-1, largest=True, sorted=True)
+        for j in range(ctc_probs_chunk.size(1)):
+            if topk_ids_chunk[0, j, 0] == streaming.blank:
+                streaming.n_blanks += 1
+            elif ctc_probs_chunk[0, j, topk_ids_chunk[0, j, 0]] < streaming.SPIKE_THRESHOLD:
+                streaming.n_blanks += 1
+            else:
+                streaming.n_blanks = 0
+            if not is_reset and streaming.n_blanks > streaming.BLANK_THRESHOLD:
+                streaming.bd_offset = j
+                streaming.next_start_offset = streaming.offset + j
+                is_reset = True
+    return is_reset
+
+
+@pytest.mark.parametrize("T", [1, 5, 20])
+@pytest.mark.parametrize("p_blank", [0.5, 0.9])
+def test_ctc_vad_batch(T, p_blank):
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.streaming')
+    B = 5
+    # some streams do not accumulate enough frames to perform VAD
+    n_accum_frames = [0, 10, 0, 30, 0]
+    streamings = [make_streaming(module, n) for n in n_accum_frames]
+    streamings_ref = [make_streaming(module, n) for n in n_accum_frames]
+
+    # blank runs are carried over across chunks
+    for _ in range(10):
+        ctc_probs = make_ctc_probs(B, T, p_blank)
+        is_reset = module.ctc_vad_batch(streamings, ctc_probs)
+        for b in range(B):
+            s, s_ref = streamings[b], streamings_ref[b]
+            assert is_reset[b] == ctc_vad_naive(s_ref, ctc_probs[b:b + 1])
+            assert s.n_blanks == s_ref.n_blanks
+            assert s.bd_offset == s_ref.bd_offset
+            if is_reset[b]:
+                assert s.next_start_offset == s_ref.next_start_offset
+        for s in streamings + streamings_ref:
+            s.n_accum_frames += T
+            s.offset += T
+            s.bd_offset = -1
+
+
+def test_ctc_vad():
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.streaming')
+    streaming = make_streaming(module, 0)
+    streaming_ref = make_streaming(module, 0)
+    for _ in range(10):
+        ctc_probs = make_ctc_probs(1, 8, 0.8)
+        assert streaming.ctc_vad(ctc_probs) == ctc_vad_naive(streaming_ref, ctc_probs)
+        assert streaming.n_blanks == streaming_ref.n_blanks
+        assert streaming.bd_offset == streaming_ref.bd_offset
@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for online log-mel filterbank feature extraction."""
+
+import importlib
+import kaldiio
+import math
+import numpy as np
+import pytest
+import torch
+
+
+SAMPLE_RATE = 16000
+
+
+def make_wav(n_samples, seed=0):
+    rng = np.random.RandomState(seed)
+    t = np.arange(n_samples) / SAMPLE_RATE
+    wav = 3000 * np.sin(2 * np.pi * 440 * t) + 500 * rng.randn(n_samples)
+    return np.clip(wav, -32768, 32767).astype(np.int16)
+
+
+def mel(f):
+    return 1127 * math.log(1 + f / 700)
+
+
+def kaldi_fbank(wav, n_mels, window_type='hamming'):
+    """Reference implementation following feature-fbank.cc in Kaldi frame by frame."""
+    window_size, window_shift, n_fft = 400, 160, 512
+    n_frames = 1 + (len(wav) - window_size) // window_shift
+    mel_low, mel_high = mel(20), mel(SAMPLE_RATE / 2)
+    delta = (mel_high - mel_low) / (n_mels + 1)
+    banks = np.zeros((n_mels, n_fft // 2))
+    for m in range(n_mels):
+        left, center, right = mel_low + m * delta, mel_low + (m + 1) * delta, mel_low + (m + 2) * delta
+        for i in range(n_fft // 2):
+            f = mel(SAMPLE_RATE / n_fft * i)
+            if left < f < right:
+                banks[m, i] = (f - left) / (center - left) if f <= center else (right - f) / (right - center)
+
+    feats = np.zeros((n_frames, n_mels))
+    for t in range(n_frames):
+        frame = wav[t * window_shift:t * window_shift + window_size].astype(np.float64)
+        frame -= frame.mean()
+        for i in range(window_size - 1, 0, -1):
+            frame[i] -= 0.97 * frame[i - 1]
+        frame[0] -= 0.97 * frame[0]
+        n = np.arange(window_size)
+        if window_type == 'hamming':
+            frame *= 0.54 - 0.46 * np.cos(2 * np.pi * n / (window_size - 1))
+        else:
+            frame *= (0.5 - 0.5 * np.cos(2 * np.pi * n / (window_size - 1))) ** 0.85
+        power = np.abs(np.fft.fft(frame, n=n_fft)[:n_fft // 2]) ** 2
+        feats[t] = np.log(np.maximum(banks.dot(power), np.finfo(np.float32).eps))
+    return feats
+
+
+@pytest.mark.parametrize("n_mels", [40, 80])
+@pytest.mark.parametrize("window_type", ['hamming', 'povey'])
+def test_parity(n_mels, window_type):
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.fbank')
+    fbank = module.OnlineFbank(n_mels=n_mels, window_type=window_type)
+
+    wav = make_wav(8123)
+    feats = fbank.compute(wav)
+    assert feats.shape == (1 + (len(wav) - 400) // 160, n_mels)
+    assert np.allclose(feats, kaldi_fbank(wav, n_mels, window_type), atol=1e-4)
+
+    # torchaudio (Kaldi-compatible)
+    try:
+        import torchaudio
+    except ImportError:
+        return
+    ref = torchaudio.compliance.kaldi.fbank(torch.from_numpy(wav.astype(np.float32)).unsqueeze(0),
+                                            num_mel_bins=n_mels, window_type=window_type,
+                                            dither=0.0, htk_compat=True, use_energy=False)
+    assert np.allclose(feats, ref.numpy(), atol=1e-3)
+
+
+@pytest.mark.parametrize("max_block_size", [1, 100, 400, 1600])
+def test_accept_waveform(max_block_size):
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.fbank')
+    fbank = module.OnlineFbank()
+
+    wav = make_wav(16000)
+    feats = fbank.compute(wav)
+
+    # blocks of random sizes
+    feats_stream = []
+    t = 0
+    while t < len(wav):
+        n = np.random.randint(1, max_block_size + 1)
+        feats_stream.append(fbank.accept_waveform(wav[t:t + n]))
+        t += n
+    feats_stream = np.concatenate(feats_stream, axis=0)
+    assert np.array_equal(feats, feats_stream)
+
+
+def test_cmvn(tmp_path):
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.fbank')
+    feats = module.OnlineFbank().compute(make_wav(16000))
+
+    # global statistics in the format of compute-cmvn-stats
+    stats = np.zeros((2, feats.shape[1] + 1))
+    stats[0, :-1] = feats.astype(np.float64).sum(0)
+    stats[1, :-1] = (feats.astype(np.float64) ** 2).sum(0)
+    stats[0, -1] = len(feats)
+    kaldiio.save_mat(str(tmp_path / 'cmvn.ark'), stats)
+
+    fbank = module.OnlineFbank(cmvn_path=str(tmp_path / 'cmvn.ark'))
+    feats_norm = fbank.compute(make_wav(16000))
+    assert np.allclose(feats_norm.mean(0), 0, atol=1e-3)
+    assert np.allclose(feats_norm.std(0), 1, atol=1e-3)
@@ -0,0 +1,96 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for GatedConvLM."""
+
+import argparse
+import importlib
+import numpy as np
+import pytest
+import torch
+
+
+VOCAB = 100
+
+
+def make_args(**kwargs):
+    args = dict(
+        lm_type='gated_conv_custom',
+        n_units=32,
+        n_projs=0,
+        n_layers=3,
+        kernel_size=4,
+        emb_dim=16,
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        lsm_prob=0.0,
+        param_init=0.1,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+@pytest.mark.parametrize(
+    "args", [
+        ({'kernel_size': 1}),
+        ({'kernel_size': 4}),
+        ({'n_projs': 16}),
+        ({'lsm_prob': 0.1}),
+        ({'lm_type': 'gated_conv_8B'}),
+    ]
+)
+def test_forward(args):
+    args = make_args(**args)
+
+    ylens = [4, 5, 3, 7] * 20
+    ys = [np.random.randint(0, VOCAB, ylen).astype(np.int64) for ylen in ylens]
+
+    module = importlib.import_module('neural_sp.models.lm.gated_convlm')
+    lm = module.GatedConvLM(args)
+    loss, state, observation = lm(ys, state=None, n_caches=0)
+    assert loss.item() >= 0
+    assert isinstance(observation, dict)
+
+
+@pytest.mark.parametrize(
+    "args", [
+        ({'kernel_size': 1}),
+        ({'kernel_size': 4}),
+        ({'n_projs': 16}),
+        ({'lm_type': 'gated_conv_8B'}),
+    ]
+)
+def test_incremental_decode(args):
+    args = make_args(**args)
+
+    batch_size = 3
+    ymax = 7
+    ys = torch.randint(0, VOCAB, (batch_size, ymax))
+
+    module = importlib.import_module('neural_sp.models.lm.gated_convlm')
+    lm = module.GatedConvLM(args)
+    lm.eval()
+    lm.double()
+    with torch.no_grad():
+        _, _, log_probs = lm.predict(ys, None)
+
+        # one token per step with the cached left context
+        state = None
+        log_probs_inc = []
+        for t in range(ymax):
+            _, state, log_probs_t = lm.predict(ys[:, t:t + 1], state)
+            log_probs_inc.append(log_probs_t)
+            for lth, block in enumerate(lm.blocks):
+                assert state[lth].size(2) == block.kernel_size - 1
+        log_probs_inc = torch.cat(log_probs_inc, dim=1)
+        assert torch.allclose(log_probs, log_probs_inc)
+
+        # reorder the state with the beam
+        _, state, _ = lm.predict(ys[:, :-1], None)
+        perm = torch.LongTensor([2, 0, 0])
+        state = [s[perm] for s in state]
+        _, _, log_probs_perm = lm.predict(ys[perm, -1:], state)
+        assert torch.allclose(log_probs[perm, -1:], log_probs_perm)
@@ -0,0 +1,107 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for batched N-best rescoring."""
+
+import argparse
+import importlib
+import numpy as np
+import pytest
+import torch
+
+
+VOCAB = 100
+
+
+def make_args_rnnlm(**kwargs):
+    args = dict(
+        lm_type='lstm',
+        n_units=64,
+        n_projs=0,
+        n_layers=2,
+        residual=False,
+        use_glu=False,
+        n_units_null_context=0,
+        bottleneck_dim=32,
+        emb_dim=16,
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        lsm_prob=0.0,
+        param_init=0.1,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def make_args_transformerlm(**kwargs):
+    args = dict(
+        lm_type='transformer',
+        transformer_attn_type='scaled_dot',
+        transformer_n_heads=4,
+        n_layers=2,
+        transformer_d_model=64,
+        transformer_d_ff=256,
+        transformer_layer_norm_eps=1e-12,
+        transformer_ffn_activation='relu',
+        transformer_pe_type='add',
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        dropout_att=0.1,
+        dropout_layer=0.0,
+        lsm_prob=0.0,
+        transformer_param_init='xavier_uniform',
+        mem_len=0,
+        recog_mem_len=0,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def score_per_hyp(lm, y):
+    """Reference implementation scoring one hypothesis at a time."""
+    y = torch.from_numpy(np.array(y, dtype=np.int64)).unsqueeze(0)
+    _, _, log_probs = lm.predict(y[:, :-1], None)
+    score = sum([log_probs[0, t, y[0, t + 1]].item() for t in range(y.size(1) - 1)])
+    return score / (y.size(1) - 1)
+
+
+@pytest.mark.parametrize(
+    "lm_type, reverse, batch_size", [
+        ('lstm', False, 0),
+        ('lstm', True, 0),
+        ('lstm', False, 3),
+        ('transformer', False, 0),
+        ('transformer', True, 0),
+        ('transformer', False, 3),
+    ]
+)
+def test_score_nbest(lm_type, reverse, batch_size):
+    if lm_type == 'transformer':
+        module = importlib.import_module('neural_sp.models.lm.transformerlm')
+        lm = module.TransformerLM(make_args_transformerlm())
+    else:
+        module = importlib.import_module('neural_sp.models.lm.rnnlm')
+        lm = module.RNNLM(make_args_rnnlm(lm_type=lm_type))
+    lm.eval()
+
+    ylens = [4, 9, 1, 6, 6, 2, 12]
+    ys = [[2] + np.random.randint(4, VOCAB, ylen).tolist() + [2] for ylen in ylens]
+
+    module = importlib.import_module('neural_sp.models.lm.nbest_rescoring')
+    scores = module.score_nbest(lm, ys, reverse=reverse, batch_size=batch_size)
+    assert scores.shape == (len(ys),)
+
+    with torch.no_grad():
+        scores_ref = [score_per_hyp(lm, y[::-1] if reverse else y) for y in ys]
+    assert np.allclose(scores, scores_ref, atol=1e-4)
+
+    # forward and backward LMs together
+    scores_fwd, scores_bwd = module.rescore_nbest(ys, lm, lm, batch_size=batch_size)
+    assert np.allclose(scores_fwd, module.score_nbest(lm, ys), atol=1e-5)
+    assert np.allclose(scores_bwd, module.score_nbest(lm, ys, reverse=True), atol=1e-5)
@@ -0,0 +1,143 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for NgramLM."""
+
+import gzip
+import importlib
+import math
+import numpy as np
+import pytest
+import torch
+
+
+VOCAB = 20  # including <blank>, <unk>, <eos> and <pad>
+
+
+def make_ngram_lm(tmp_path, order, seed=0):
+    """Write a random back-off n-gram LM in the ARPA format and a dictionary."""
+    rng = np.random.RandomState(seed)
+    tokens = ['<unk>', '<eos>', '<pad>'] + ['w%d' % i for i in range(VOCAB - 4)]
+    with open(str(tmp_path / 'dict.txt'), 'w') as f:
+        for i, w in enumerate(tokens):
+            f.write('%s %d\n' % (w, i + 1))
+
+    # NOTE: some tokens in the vocabulary are missing in the unigrams
+    words = ['<s>', '</s>', '<unk>'] + ['w%d' % i for i in range(VOCAB - 7)] + ['oov']
+    ngrams = {1: [(w,) for w in words]}
+    for n in range(2, order + 1):
+        ngrams[n] = sorted(set([ng + (words[i],) for ng in ngrams[n - 1]
+                                for i in rng.randint(1, len(words), 3)
+                                if ng[-1] != '</s>']))
+    arpa = {}
+    for n in range(1, order + 1):
+        for ng in ngrams[n]:
+            logp = -99 if ng == ('<s>',) else np.log10(rng.uniform(0.01, 1))
+            bo = np.log10(rng.uniform(0.1, 1)) if n < order else None
+            arpa[ng] = (round(logp, 4), round(bo, 4) if bo is not None else None)
+
+    with open(str(tmp_path / 'lm.arpa'), 'w') as f:
+        f.write('\\data\\\n')
+        for n in range(1, order + 1):
+            f.write('ngram %d=%d\n' % (n, len(ngrams[n])))
+        for n in range(1, order + 1):
+            f.write('\n\\%d-grams:\n' % n)
+            for ng in ngrams[n]:
+                logp, bo = arpa[ng]
+                line = '%.4f\t%s' % (logp, ' '.join(ng))
+                if bo is not None:
+                    line += '\t%.4f' % bo
+                f.write(line + '\n')
+        f.write('\n\\end\\\n')
+    return arpa, tokens
+
+
+def naive_log_prob(arpa, history, w):
+    """Back-off log-probability in the natural log."""
+    ng = tuple(history) + (w,)
+    if ng in arpa:
+        return arpa[ng][0] * math.log(10)
+    if len(history) == 0:
+        return arpa[('<unk>',)][0] * math.log(10)
+    bo = arpa[tuple(history)][1] if tuple(history) in arpa else 0.
+    return (bo or 0.) * math.log(10) + naive_log_prob(arpa, history[1:], w)
+
+
+@pytest.mark.parametrize("order", [1, 2, 3, 4])
+def test_predict(tmp_path, order):
+    arpa, tokens = make_ngram_lm(tmp_path, order)
+
+    module = importlib.import_module('neural_sp.models.lm.ngram')
+    lm = module.NgramLM(str(tmp_path / 'lm.arpa'), str(tmp_path / 'dict.txt'))
+    assert lm.vocab == VOCAB
+    assert lm.max_order == order
+
+    batch_size = 4
+    ymax = 8
+    ys = torch.randint(4, VOCAB, (batch_size, ymax))
+    ys[:, 0] = lm.eos
+    ys[0, 4] = lm.eos  # sentence boundary
+    ys[1, 2] = lm.unk
+    _, state, log_probs = lm.predict(ys)
+    assert log_probs.size() == (batch_size, ymax, VOCAB)
+    assert state['hxs'].size() == (1, batch_size)
+
+    # reference
+    idx2token = {i + 1: w for i, w in enumerate(tokens)}
+    idx2token[lm.eos] = '</s>'
+    for b in range(batch_size):
+        history = []
+        for t in range(ymax):
+            y = ys[b, t].item()
+            history = ['<s>'] if y == lm.eos else history + [idx2token[y]]
+            history = history[-(order - 1):] if order > 1 else []
+            # truncate to the longest history in the ARPA file
+            while len(history) > 0 and tuple(history) not in arpa:
+                history = history[1:]
+            for v in range(4, VOCAB):
+                ref = naive_log_prob(arpa, history, idx2token[v])
+                assert abs(log_probs[b, t, v].item() - ref) < 1e-3
+            ref = naive_log_prob(arpa, history, '</s>')
+            assert abs(log_probs[b, t, lm.eos].item() - ref) < 1e-3
+            assert log_probs[b, t, lm.pad].item() < -200
+
+    # one token per step with the state
+    state = None
+    for t in range(ymax):
+        _, state, log_probs_t = lm.predict(ys[:, t:t + 1], state)
+        assert torch.allclose(log_probs[:, t:t + 1], log_probs_t)
+
+    # reorder the state with the beam
+    _, state, _ = lm.predict(ys[:, :-1])
+    perm = torch.LongTensor([2, 0, 0])
+    state = {'hxs': state['hxs'][:, perm], 'cxs': None}
+    _, _, log_probs_perm = lm.predict(ys[perm, -1:], state)
+    assert torch.allclose(log_probs[perm, -1:], log_probs_perm)
+
+    # candidate-restricted scoring
+    lmout, _, log_probs_skip = lm.predict(ys, skip_output=True)
+    assert log_probs_skip is None
+    cands = torch.randint(0, VOCAB, (batch_size, 3))
+    log_probs_cand = lm.score_candidates(lmout[:, -1], cands)
+    assert torch.allclose(log_probs_cand, torch.gather(log_probs[:, -1], 1, cands))
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_build(tmp_path, compress):
+    make_ngram_lm(tmp_path, order=3)
+    arpa_path = str(tmp_path / 'lm.arpa')
+    if compress:
+        with open(arpa_path, 'rb') as f_in, gzip.open(arpa_path + '.gz', 'wb') as f_out:
+            f_out.write(f_in.read())
+        arpa_path += '.gz'
+
+    module = importlib.import_module('neural_sp.bin.eval_utils')
+    lm, args_lm = module.load_lm(arpa_path, str(tmp_path / 'dict.txt'))
+    assert lm.lm_type == 'ngram'
+    assert lm.max_order == 3
+    assert not args_lm.backward
+
+    module = importlib.import_module('neural_sp.models.lm.build')
+    lm_build = module.build_lm(args_lm, asr_dict_path=str(tmp_path / 'dict.txt'))
+    ys = torch.randint(4, VOCAB, (2, 5))
+    assert torch.equal(lm.predict(ys)[2], lm_build.predict(ys)[2])
@@ -7,6 +7,7 @@ import argparse
 import importlib
 import numpy as np
 import pytest
+import torch
 
 
 ENC_N_UNITS = 64
@@ -71,3 +72,86 @@ def test_forward(args):
     # assert loss.size(0) == 1, loss
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+@pytest.mark.parametrize(
+    "args", [
+        ({'adaptive_softmax': True}),
+        ({'adaptive_softmax': True, 'n_units': 32}),
+    ]
+)
+def test_score_candidates(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    n_cands = 8
+    ys = torch.randint(0, VOCAB, (batch_size, 5))
+    cands = torch.randint(0, VOCAB, (batch_size, n_cands))
+
+    module = importlib.import_module('neural_sp.models.lm.rnnlm')
+    # only the adaptive softmax is cheaper than the full output layer
+    assert not module.RNNLM(make_args()).restricted_scoring
+    lm = module.RNNLM(args)
+    assert lm.restricted_scoring
+    lm.eval()
+    with torch.no_grad():
+        _, _, log_probs = lm.predict(ys, None)
+        lmout, _, log_probs_skip = lm.predict(ys, None, skip_output=True)
+        assert log_probs_skip is None
+        log_probs_cand = lm.score_candidates(lmout[:, -1], cands)
+        assert log_probs_cand.size() == (batch_size, n_cands)
+        assert torch.allclose(log_probs_cand, log_probs[:, -1].gather(1, cands), atol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "args, n_caches, bptt", [
+        ({}, 5, 4),
+        ({}, 5, 8),
+        ({}, 20, 6),
+        ({'adaptive_softmax': True}, 5, 4),
+    ]
+)
+def test_cache_loss(args, n_caches, bptt):
+    args = make_args(**args)
+
+    batch_size = 2
+    ymax = 25
+    ys = np.random.randint(4, VOCAB, (batch_size, ymax)).astype(np.int64)
+
+    module = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module.RNNLM(args)
+    lm.eval()
+    lm.double()
+
+    # Reference: attend to the previous `n_caches` tokens one by one
+    with torch.no_grad():
+        ys_t = torch.from_numpy(ys)
+        logits, out, _ = lm.decode(ys_t[:, :-1], None)
+        ys_out = ys_t[:, 1:]
+        if lm.adaptive_softmax is None:
+            probs = torch.softmax(logits, dim=-1)
+        else:
+            probs = lm.adaptive_softmax.log_prob(logits.reshape(-1, logits.size(2))).exp().view(
+                batch_size, ymax - 1, -1)
+        nll_ref = 0
+        for t in range(ymax - 1):
+            p = probs[:, t]
+            if t > 0:
+                keys = out[:, max(0, t - n_caches):t]
+                ids = ys_out[:, max(0, t - n_caches):t]
+                attn = torch.softmax(lm.cache_theta * torch.matmul(keys, out[:, t].unsqueeze(2)).squeeze(2), dim=1)
+                cache_probs = torch.zeros_like(p).scatter_add_(1, ids, attn)
+                p = (1 - lm.cache_lambda) * p + lm.cache_lambda * cache_probs
+            nll_ref += -torch.log(p.gather(1, ys_out[:, t:t + 1])).sum().item()
+        loss_ref = nll_ref / (batch_size * (ymax - 1))
+
+    # Chunkwise computation with the ring buffer
+    lm.reset_cache()
+    state = None
+    nll = 0
+    for offset in range(0, ymax - 1, bptt):
+        ys_chunk = ys[:, offset:offset + bptt + 1]
+        loss, state, _ = lm(ys_chunk, state, is_eval=True, n_caches=n_caches)
+        nll += loss.item() * batch_size * (ys_chunk.shape[1] - 1)
+    assert lm.cache_keys.size(1) == n_caches
+    assert np.allclose(nll / (batch_size * (ymax - 1)), loss_ref)
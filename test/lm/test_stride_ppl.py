@@ -0,0 +1,99 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for sliding-window perplexity evaluation."""
+
+import argparse
+import importlib
+import pytest
+import torch
+
+
+VOCAB = 100
+
+
+def make_lm(lm_type):
+    if lm_type == 'transformer':
+        args = dict(lm_type='transformer', transformer_attn_type='scaled_dot',
+                    transformer_n_heads=4, n_layers=2, transformer_d_model=32, transformer_d_ff=64,
+                    transformer_layer_norm_eps=1e-12, transformer_ffn_activation='relu',
+                    transformer_pe_type='add', vocab=VOCAB,
+                    dropout_in=0.1, dropout_hidden=0.1, dropout_att=0.1, dropout_layer=0.0,
+                    lsm_prob=0.0, transformer_param_init='xavier_uniform', mem_len=0, recog_mem_len=0,
+                    adaptive_softmax=False, tie_embedding=False)
+        module = importlib.import_module('neural_sp.models.lm.transformerlm')
+        return module.TransformerLM(argparse.Namespace(**args))
+    if lm_type == 'transformer_xl':
+        args = dict(lm_type='transformer_xl', transformer_n_heads=4, n_layers=2,
+                    transformer_d_model=32, transformer_d_ff=64,
+                    transformer_layer_norm_eps=1e-12, transformer_ffn_activation='relu', vocab=VOCAB,
+                    dropout_in=0.1, dropout_hidden=0.1, dropout_att=0.1, dropout_layer=0.0,
+                    lsm_prob=0.0, transformer_param_init='xavier_uniform', mem_len=0, bptt=10,
+                    recog_mem_len=100, zero_center_offset=False,
+                    adaptive_softmax=False, tie_embedding=False)
+        module = importlib.import_module('neural_sp.models.lm.transformer_xl')
+        return module.TransformerXL(argparse.Namespace(**args))
+    if 'gated_conv' in lm_type:
+        args = dict(lm_type=lm_type, n_units=32, n_projs=0, n_layers=3, kernel_size=4, emb_dim=16,
+                    vocab=VOCAB, dropout_in=0.1, dropout_hidden=0.1, lsm_prob=0.0, param_init=0.1,
+                    adaptive_softmax=False, tie_embedding=False)
+        module = importlib.import_module('neural_sp.models.lm.gated_convlm')
+        return module.GatedConvLM(argparse.Namespace(**args))
+    args = dict(lm_type=lm_type, n_units=32, n_projs=0, n_layers=2, residual=False, use_glu=False,
+                n_units_null_context=0, bottleneck_dim=32, emb_dim=16, vocab=VOCAB,
+                dropout_in=0.1, dropout_hidden=0.1, lsm_prob=0.0, param_init=0.1,
+                adaptive_softmax=False, tie_embedding=False)
+    module = importlib.import_module('neural_sp.models.lm.rnnlm')
+    return module.RNNLM(argparse.Namespace(**args))
+
+
+def segment_recurrence(lm, ys, stride):
+    """Reference of TransformerXL: segments attend to the memory of previous segments as in training."""
+    nll = []
+    mems = None
+    for offset in range(0, ys.size(1) - 1, stride):
+        ys_seg = ys[:, offset:offset + stride + 1]
+        logits, _, mems = lm.decode(ys_seg[:, :-1], mems=mems)
+        log_probs = torch.log_softmax(logits, dim=-1)
+        nll.append(-torch.gather(log_probs, 2, ys_seg[:, 1:].unsqueeze(2)).squeeze(2))
+    return torch.cat(nll, dim=1)
+
+
+@pytest.mark.parametrize(
+    "lm_type, stride", [
+        ('lstm', 1),
+        ('lstm', 7),
+        ('gated_conv_custom', 1),
+        ('gated_conv_custom', 7),
+        ('transformer', 1),
+        ('transformer', 7),
+        ('transformer_xl', 1),
+        ('transformer_xl', 7),
+    ]
+)
+def test_forward_stride(lm_type, stride):
+    batch_size = 3
+    ymax = 30
+    ys = torch.randint(4, VOCAB, (batch_size, ymax))
+
+    lm = make_lm(lm_type)
+    lm.eval()
+    lm.double()
+
+    module = importlib.import_module('neural_sp.evaluators.ppl')
+    with torch.no_grad():
+        if lm_type == 'transformer_xl':
+            nll_ref = segment_recurrence(lm, ys, stride)
+        else:
+            _, _, log_probs = lm.predict(ys[:, :-1], None)
+            nll_ref = -torch.gather(log_probs, 2, ys[:, 1:].unsqueeze(2)).squeeze(2)
+
+        # the left context covers the whole stream
+        state = None
+        nll = []
+        for offset in range(0, ymax - 1, stride):
+            nll_s, state = module.forward_stride(lm, ys[:, offset:offset + stride + 1].numpy(), state, ymax)
+            nll.append(nll_s)
+        nll = torch.cat(nll, dim=1)
+    assert nll.size() == nll_ref.size()
+    assert torch.allclose(nll, nll_ref, atol=1e-4)
@@ -38,6 +38,32 @@ def test_forward(args):
 
     for xmax in xmaxs:
         xs = torch.FloatTensor(batch_size, xmax, args['d_model'])
-        xs = conv(xs)
+        xs, _ = conv(xs)
 
         assert xs.size() == (batch_size, xmax, args['d_model'])
+
+
+@pytest.mark.parametrize("kernel_size", [3, 7, 31])
+@pytest.mark.parametrize("chunk_size", [1, 8, 20])
+def test_forward_streaming(kernel_size, chunk_size):
+    batch_size = 2
+    xmax = 50
+    d_model = 16
+    module = importlib.import_module('neural_sp.models.modules.conformer_convolution')
+    conv = module.ConformerConvBlock(d_model, kernel_size, param_init='xavier_uniform')
+    conv.eval()
+
+    xs = torch.randn(batch_size, xmax, d_model)
+    ys_offline, _ = conv(xs)
+
+    # chunk by chunk with the cache and lookahead frames
+    context = kernel_size // 2
+    cache = xs.new_zeros(batch_size, d_model, context)
+    ys = []
+    for t in range(0, xmax, chunk_size):
+        n_cur = min(chunk_size, xmax - t)
+        ys_chunk, new_cache = conv(xs[:, t:t + chunk_size + context], cache)
+        assert new_cache.size(2) == context + min(chunk_size + context, xmax - t)
+        ys.append(ys_chunk[:, :n_cur])
+        cache = new_cache[:, :, n_cur:n_cur + context]
+    assert torch.allclose(torch.cat(ys, dim=1), ys_offline, atol=1e-6)
@@ -10,17 +10,32 @@ pytest ./test/encoders/test_rnn_encoder.py || exit 1;
 pytest ./test/encoders/test_rnn_encoder_streaming_chunkwise.py || exit 1;
 pytest ./test/encoders/test_transformer_encoder.py || exit 1;
 pytest ./test/encoders/test_conformer_encoder.py || exit 1;
+pytest ./test/encoders/test_transformer_encoder_streaming.py || exit 1;
 pytest ./test/encoders/test_utils.py || exit 1;
 
 # decoder
 pytest ./test/decoders/test_las_decoder.py || exit 1;
 pytest ./test/decoders/test_transformer_decoder.py || exit 1;
 pytest ./test/decoders/test_rnn_transducer_decoder.py || exit 1;
+pytest ./test/decoders/test_streaming_session.py || exit 1;
+pytest ./test/decoders/test_streaming_latency.py || exit 1;
+pytest ./test/decoders/test_longform_decoding.py || exit 1;
+
+# frontends
+pytest ./test/frontends/test_fbank.py || exit 1;
+pytest ./test/frontends/test_ctc_vad.py || exit 1;
+
+# datasets
+pytest ./test/datasets/test_lm_dataset.py || exit 1;
 
 # LM
 pytest ./test/lm/test_rnnlm.py || exit 1;
 pytest ./test/lm/test_transformerlm.py || exit 1;
 pytest ./test/lm/test_transformer_xl_lm.py || exit 1;
+pytest ./test/lm/test_nbest_rescoring.py || exit 1;
+pytest ./test/lm/test_gated_convlm.py || exit 1;
+pytest ./test/lm/test_stride_ppl.py || exit 1;
+pytest ./test/lm/test_ngram.py || exit 1;
 
 # modules
 pytest ./test/modules/test_attention.py || exit 1;